@@ -1,41 +1,152 @@
-from fastapi import FastAPI, Query, Depends, HTTPException
-from models.query_expansion import QueryExpander
-from database.elastic_search import QueryDatabase
-from search_engines.fetch_queries import fetch_google_results, fetch_duckduckgo_results
+from fastapi import FastAPI, Query, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from pydantic import BaseModel
+from api.metrics import TimingMiddleware
+from telemetry.metrics import render, stage, timed
+from api.startup import Readiness, get_query_expander, register_metrics, shut_down, warm_up
+from search_engines.fetch_queries import fetch_google_results, fetch_duckduckgo_results, get_async_query_db
+from search_engines.provider_cache import get_provider_cache
 from sqlalchemy.ext.asyncio import AsyncSession
 from database.postgres import get_db
+from models.autocomplete import get_autocomplete
+from models.embeddings import EmbeddingOverloaded
 from database import crud
-from database.models import User
+from database.preference_cache import get_preference_cache
+import asyncio
+import json
+import os
 
-app = FastAPI()
+EXPAND_BATCH_MAX = int(os.getenv("EXPAND_BATCH_MAX", "500"))
 
-query_expander = None
+readiness = Readiness()
+register_metrics()
 
-def get_query_expander():
-    global query_expander
-    if query_expander is None:
-        query_expander = QueryExpander()
-    return query_expander
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve liveness checks right away; the model and index load in the background
+    startup = asyncio.create_task(warm_up(readiness))
+    yield
+    if not startup.done():
+        startup.cancel()
+        try:
+            await startup
+        except asyncio.CancelledError:
+            pass
+    await readiness.close()
+    await shut_down()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TimingMiddleware)
+
+class BatchExpandRequest(BaseModel):
+    queries: list[str]
+    num_return_seq: int = 5
+    log: bool = False  # Count the queries as user searches (popularity, autocomplete, FAISS)
+
+class Document(BaseModel):
+    title: str = ""
+    content: str
+
+class IndexDocumentsRequest(BaseModel):
+    documents: list[Document]
+
+def require_ready():
+    """Reject model-backed requests with 503 until startup has finished."""
+    if not readiness.is_ready:
+        raise HTTPException(status_code=503, detail="Service is starting up", headers={"Retry-After": "1"})
+
+async def require_db(db: AsyncSession = Depends(get_db)):
+    if db is None:
+        raise HTTPException(status_code=503, detail="PostgreSQL is not configured")
+    return db
+
+@app.exception_handler(EmbeddingOverloaded)
+async def embedding_overloaded(request: Request, exc: EmbeddingOverloaded):
+    return JSONResponse(status_code=503, content={"error": str(exc)}, headers={"Retry-After": "1"})
 
 @app.get("/")
 async def home():
     return {"message": "Search-sense API is running!"}
 
-@app.get("/expand_query")
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the model, FAISS index and expander are loaded."""
+    return JSONResponse(status_code=200 if readiness.is_ready else 503, content=readiness.report())
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: latency per route and stage, source outcomes, cache and index stats."""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/expand_query", dependencies=[Depends(require_ready)])
 async def expand_query(query: str, num_return_seq: int = 5, user_id: int = None, db: AsyncSession = Depends(get_db)):
     results = await get_query_expander().expand_query(query=query, user_id=user_id, num_return_seq=num_return_seq, db=db)
     return results
 
+@app.post("/expand_queries", dependencies=[Depends(require_ready)])
+async def expand_queries(request: BatchExpandRequest):
+    """Expand a batch of queries, streaming one NDJSON line per query as each finishes."""
+    if len(request.queries) > EXPAND_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {EXPAND_BATCH_MAX} queries per batch")
+    results = await get_query_expander().expand_queries(request.queries, request.num_return_seq, log=request.log)
+    lines = (json.dumps(result) + "\n" async for result in results)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
 @app.get("/search_results/")
 async def search_results(query: str, num_results: int = 5):
-    google_results = fetch_google_results(query, num_results)
-    duckduckgo_results = fetch_duckduckgo_results(query, num_results)
+    google_results, duckduckgo_results = await asyncio.gather(
+        timed("google", fetch_google_results(query, num_results)),
+        timed("duckduckgo", fetch_duckduckgo_results(query, num_results))
+    )
     return {
         "query": query,
         "google_results": google_results,
         "duckduckgo_results": duckduckgo_results
     }
 
+@app.get("/suggest")
+async def suggest(prefix: str, top_n: int = 5):
+    """Most popular logged queries starting with `prefix`."""
+    return {"prefix": prefix, "suggestions": await timed("suggest", get_async_query_db().suggest_queries(prefix, top_n))}
+
+@app.get("/autocomplete")
+async def autocomplete(prefix: str = "", top_n: int = 10):
+    """Type-ahead from the in-memory prefix index; from Elasticsearch while it is still loading."""
+    index = get_autocomplete()
+    if not index.loaded:
+        return {"prefix": prefix, "suggestions": await timed("suggest", get_async_query_db().suggest_queries(prefix, top_n))}
+    with stage("autocomplete"):
+        return {"prefix": prefix, "suggestions": index.suggest(prefix, top_n)}
+
+@app.get("/hybrid_search", dependencies=[Depends(require_ready)])
+async def hybrid_search(query: str, top_n: int = 10, user_id: int = None, db: AsyncSession = Depends(get_db)):
+    """Documents ranked by BM25 + vector retrieval fused with RRF, re-ranked on stored embeddings."""
+    results = await get_query_expander().hybrid_search(query, top_n=top_n, user_id=user_id, db=db)
+    return {"query": query, "results": results}
+
+@app.post("/documents", dependencies=[Depends(require_ready)])
+async def index_documents(request: IndexDocumentsRequest):
+    """Index documents with their embeddings computed once, here."""
+    count = await get_query_expander().index_documents([doc.model_dump() for doc in request.documents])
+    return {"indexed": count}
+
+@app.get("/cache_stats", dependencies=[Depends(require_ready)])
+async def cache_stats():
+    """Hit rates of the response, provider and embedding caches."""
+    expander = get_query_expander()
+    return {
+        "semantic": expander.semantic_cache.stats(),
+        "providers": get_provider_cache().stats(),
+        "embeddings": expander.embedder.service.stats(),
+        "preferences": get_preference_cache().stats()
+    }
+
 @app.get("/db_test/")
 async def test_db_connection(db: AsyncSession = Depends(get_db)):
     try:
@@ -45,7 +156,7 @@ async def test_db_connection(db: AsyncSession = Depends(get_db)):
         return {"error": str(e)}
 
 @app.post("/users/")
-async def create_user(username: str, email: str, db: AsyncSession = Depends(get_db)):
+async def create_user(username: str, email: str, db: AsyncSession = Depends(require_db)):
     existing_user = await crud.get_user_by_email(db, email)
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
@@ -53,25 +164,25 @@ async def create_user(username: str, email: str, db: AsyncSession = Depends(get_
     return {"message": "User created successfully!", "user": new_user}
 
 @app.get("/users/{user_id}")
-async def get_user_by_id(user_id: int, db: AsyncSession = Depends(get_db)):
+async def get_user_by_id(user_id: int, db: AsyncSession = Depends(require_db)):
     user = await crud.get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @app.get("/users/")
-async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db)):
+async def get_user_by_email(email: str, db: AsyncSession = Depends(require_db)):
     user = await crud.get_user_by_email(db, email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @app.post("/users/{user_id}/preferences/")
-async def store_user_preferences(user_id: int, preferences: dict, db: AsyncSession = Depends(get_db)):
+async def store_user_preferences(user_id: int, preferences: dict, db: AsyncSession = Depends(require_db)):
     updated_prefs = await crud.store_user_preferences(db, user_id, preferences)
     return {"message": "User preferences updated!", "preferences": updated_prefs}
 
 @app.get("/users/{user_id}/preferences/")
-async def get_user_preferences(user_id: int, db: AsyncSession = Depends(get_db)):
+async def get_user_preferences(user_id: int, db: AsyncSession = Depends(require_db)):
     preferences = await crud.get_user_preferences(db, user_id)
     return {"user_id": user_id, "preferences": preferences}
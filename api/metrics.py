@@ -0,0 +1,36 @@
+import time
+from telemetry.metrics import METRICS_ENABLED, REQUEST_LATENCY, current_trace, server_timing
+
+
+class TimingMiddleware:
+    def __init__(self, app):
+        """ASGI middleware: request latency per route, plus a Server-Timing header with the stage timings.
+
+        Written as plain ASGI rather than BaseHTTPMiddleware so streaming
+        responses pass through untouched and the per-request cost stays small.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        trace = {}
+        token = current_trace.set(trace)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing = server_timing(trace, time.perf_counter() - started).encode("latin-1")
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.observe(time.perf_counter() - started, route, str(status))
@@ -0,0 +1,216 @@
+import asyncio
+import os
+import time
+from telemetry.metrics import register_stats
+from database import faiss_store
+from database.faiss_store import get_faiss_index
+from database.preference_cache import get_preference_cache
+from database.postgres import SessionLocal, close_db, is_configured
+from models import autocomplete as autocomplete_module
+from models.autocomplete import get_autocomplete
+from models import user_queries
+from models.user_queries import close_query_log
+from models.embeddings import get_embedding_batcher
+from models import query_expansion
+from models.query_expansion import QueryExpander, close_faiss_log
+from search_engines.fetch_queries import get_async_query_db
+from search_engines.http_client import close_http_client
+from search_engines.provider_cache import get_provider_cache
+
+STARTUP_ES_RETRIES = int(os.getenv("STARTUP_ES_RETRIES", "5"))
+STARTUP_ES_RETRY_DELAY = float(os.getenv("STARTUP_ES_RETRY_DELAY", "5"))
+STARTUP_RETRY_DELAY = float(os.getenv("STARTUP_RETRY_DELAY", "5"))
+STARTUP_MAX_RETRY_DELAY = float(os.getenv("STARTUP_MAX_RETRY_DELAY", "60"))
+
+query_expander = None
+
+def get_query_expander():
+    global query_expander
+    if query_expander is None:
+        query_expander = QueryExpander()
+    return query_expander
+
+
+class Readiness:
+    def __init__(self, required=("embeddings", "faiss", "expander")):
+        """Startup progress of each component; the app is ready once all `required` ones are."""
+        self.required = required
+        self.started = time.perf_counter()
+        self.ready_after_ms = None
+        self.components = {}
+        self._ready_events = {}
+        self._retries = []
+
+    @property
+    def is_ready(self):
+        return all(self.components.get(name, {}).get("status") == "ready" for name in self.required)
+
+    def _ready_event(self, name):
+        return self._ready_events.setdefault(name, asyncio.Event())
+
+    async def wait_ready(self, name):
+        """Wait until a component is ready, however many retries that takes."""
+        await self._ready_event(name).wait()
+
+    async def track(self, name, step, retry_delay=STARTUP_RETRY_DELAY, max_retry_delay=STARTUP_MAX_RETRY_DELAY):
+        """Run a startup step, recording its status and duration instead of raising.
+
+        `step` is a zero-argument callable returning an awaitable. A failed
+        step is retried in the background with exponential backoff from
+        `retry_delay` up to `max_retry_delay` seconds until it succeeds, so a
+        dependency that was down at startup does not keep /readyz at 503
+        until a restart. Returns the first attempt's result (None if it
+        failed), so steps waiting on it are not held up by the retries.
+        """
+        result, ok = await self._attempt(name, step, 1)
+        if not ok:
+            self._retries.append(asyncio.create_task(self._retry(name, step, retry_delay, max_retry_delay)))
+        return result
+
+    async def _attempt(self, name, step, attempt):
+        self.components[name] = {"status": "loading"}
+        started = time.perf_counter()
+        try:
+            result = await step()
+            self.components[name] = {"status": "ready"}
+            self._ready_event(name).set()
+            return result, True
+        except Exception as e:
+            print(f"Startup step {name} failed (attempt {attempt}): {e}")
+            self.components[name] = {"status": "failed", "error": str(e)}
+            return None, False
+        finally:
+            self.components[name]["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            if attempt > 1:
+                self.components[name]["attempts"] = attempt
+            if self.ready_after_ms is None and self.is_ready:
+                self.ready_after_ms = round((time.perf_counter() - self.started) * 1000, 1)
+
+    async def _retry(self, name, step, delay, max_delay):
+        attempt = 1
+        while True:
+            self.components[name]["retry_in_s"] = delay
+            await asyncio.sleep(delay)
+            attempt += 1
+            if (await self._attempt(name, step, attempt))[1]:
+                return
+            delay = min(delay * 2, max_delay)
+
+    async def close(self):
+        """Stop retrying failed steps."""
+        for task in self._retries:
+            task.cancel()
+        await asyncio.gather(*self._retries, return_exceptions=True)
+
+    def report(self):
+        return {"ready": self.is_ready, "ready_after_ms": self.ready_after_ms, "components": self.components}
+
+
+def register_metrics():
+    """Export component stats at /metrics; components that are not loaded yet are skipped."""
+    register_stats("semantic_cache", lambda: query_expander and query_expander.semantic_cache.stats())
+    register_stats("embedding_cache", lambda: query_expander and query_expander.embedder.service.stats())
+    register_stats("embedding_batcher", lambda: query_expander and query_expander.embedder.stats())
+    register_stats("provider_cache", lambda: get_provider_cache().stats())
+    register_stats("preference_cache", lambda: get_preference_cache().stats())
+    register_stats("faiss", lambda: faiss_store.faiss_index and faiss_store.faiss_index.stats())
+    register_stats("es_query_log", lambda: get_async_query_db().query_log.stats(), counters=("flushed", "retries", "dropped"))
+    register_stats("pg_query_log", lambda: user_queries.query_log and user_queries.query_log.stats(),
+                   counters=("flushed", "retries", "dropped"))
+    register_stats("faiss_add_log", lambda: query_expansion.faiss_log and query_expansion.faiss_log.stats(),
+                   counters=("flushed", "retries", "dropped"))
+    register_stats("autocomplete", lambda: autocomplete_module.autocomplete and autocomplete_module.autocomplete.stats(),
+                   counters=("lookups", "dropped"))
+
+
+async def connect_elasticsearch():
+    await get_async_query_db().connect_to_es(STARTUP_ES_RETRIES, STARTUP_ES_RETRY_DELAY)
+    return True
+
+
+async def load_embeddings():
+    """Load the model off the event loop, then run one encode so the first request does not pay for it."""
+    batcher = await asyncio.to_thread(get_embedding_batcher)
+    await batcher.encode(["warm up"], cache=False)
+
+
+async def create_documents_index(readiness):
+    """Create or check the documents index once both are up: its vector width is the model's dimension."""
+    await readiness.wait_ready("embeddings")
+    await readiness.wait_ready("elasticsearch")
+    await get_async_query_db().create_documents_index(get_embedding_batcher().service.dimension)
+
+
+async def load_faiss_index(elastic_ready):
+    """Restore FAISS from its snapshot, bootstrapping from the databases only on first run.
+
+    Readers never bootstrap: they serve whatever the writer publishes.
+    """
+    faiss_index = get_faiss_index()
+    if not await asyncio.to_thread(faiss_index.load_snapshot) and faiss_index.role != "reader":
+        await elastic_ready
+        try:
+            if is_configured():
+                async with SessionLocal() as db:
+                    await faiss_index.load_queries(db, get_async_query_db())
+            else:
+                await faiss_index.load_queries(None, get_async_query_db())
+        except Exception as e:
+            print(f"Error bootstrapping FAISS index: {e}")
+    faiss_index.start_compaction()
+
+
+async def load_autocomplete(elastic_ready):
+    """Restore the prefix index from its snapshot, building it from the stored queries only on first run.
+
+    Either way it then keeps merging counts from Elasticsearch, which also
+    catches it up on queries stored after the snapshot was saved.
+    """
+    autocomplete = get_autocomplete()
+    if not await asyncio.to_thread(autocomplete.load_snapshot):
+        await elastic_ready
+        try:
+            if is_configured():
+                async with SessionLocal() as db:
+                    await autocomplete.load_corpus(get_async_query_db(), db)
+            else:
+                await autocomplete.load_corpus(get_async_query_db())
+            if autocomplete.claim_snapshot():
+                await asyncio.to_thread(autocomplete.save_snapshot)
+        except Exception as e:
+            print(f"Error building autocomplete index: {e}")
+            autocomplete.finish_loading()
+    # Syncs that fail while Elasticsearch is down are retried every interval
+    autocomplete.start_maintenance(get_async_query_db())
+
+
+async def warm_up(readiness):
+    """Connect to Elasticsearch, load the model and load the indexes concurrently.
+
+    Autocomplete and the documents index are not required for readiness;
+    /autocomplete answers from Elasticsearch until it is loaded.
+    """
+    elastic = asyncio.create_task(readiness.track("elasticsearch", connect_elasticsearch))
+    documents = asyncio.create_task(readiness.track("documents_index", lambda: create_documents_index(readiness)))
+    await asyncio.gather(
+        readiness.track("embeddings", load_embeddings),
+        readiness.track("faiss", lambda: load_faiss_index(asyncio.shield(elastic))),
+        readiness.track("autocomplete", lambda: load_autocomplete(asyncio.shield(elastic))),
+        elastic
+    )
+    await readiness.track("expander", lambda: asyncio.to_thread(get_query_expander))
+    print(f"Startup finished: {readiness.report()}")
+    await documents  # Waits for Elasticsearch and the model, however long their retries take
+
+
+async def shut_down():
+    await close_faiss_log()
+    faiss_index = get_faiss_index()
+    faiss_index.stop_compaction()
+    if faiss_index.delta_count:
+        await asyncio.to_thread(faiss_index.save_snapshot)
+    await get_autocomplete().stop_maintenance()
+    await get_async_query_db().close()
+    await close_query_log()
+    await close_http_client()
+    await close_db()
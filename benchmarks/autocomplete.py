@@ -0,0 +1,88 @@
+"""Build time, memory, lookup latency and snapshot cost of the autocomplete index.
+
+Synthetic queries get Zipf-distributed counts (a few very popular queries, a
+long tail), like real query logs. Lookups use prefixes of 1 to 12 characters
+taken from held-out queries, so some prefixes miss:
+
+    python -m benchmarks.autocomplete --sizes 100000 1000000
+    python -m benchmarks.autocomplete --sizes 1000000 --top-k 5 --output autocomplete.json
+
+Memory is `Autocomplete.measure()` (sys.getsizeof over the whole structure).
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import numpy as np
+from benchmarks.synthetic_queries import generate_queries
+from models.autocomplete import Autocomplete
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def lookup_latencies(index, prefixes):
+    latencies = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        index.suggest(prefix)
+        latencies.append(time.perf_counter() - started)
+    return np.array(latencies) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--zipf", type=float, default=1.2, help="Zipf exponent of the query counts")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    held_out = generate_queries(1000, seed=1)
+    prefixes = [q[:rng.randint(1, 12)] for q in rng.choices(held_out, k=args.lookups)]
+    results = []
+    for size in args.sizes:
+        queries = generate_queries(size, seed=0)
+        counts = np.minimum(np.random.default_rng(0).zipf(args.zipf, size), 1_000_000).tolist()
+        index = Autocomplete(top_k=args.top_k)
+        _, build_seconds = timed(index.add_counts, list(zip(queries, counts)))
+        index.finish_loading()
+        latencies = lookup_latencies(index, prefixes)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trie.pkl")
+            _, save_seconds = timed(index.save_snapshot, path)
+            snapshot_bytes = os.path.getsize(path)
+            _, load_seconds = timed(Autocomplete(top_k=args.top_k).load_snapshot, path)
+
+        row = {
+            "size": size,
+            "top_k": args.top_k,
+            "nodes": index.nodes,
+            "build_s": round(build_seconds, 2),
+            "memory_mb": round(index.memory_bytes / 2**20, 1),
+            "bytes_per_query": round(index.memory_bytes / size),
+            "lookup_p50_us": round(float(np.percentile(latencies, 50)), 2),
+            "lookup_p99_us": round(float(np.percentile(latencies, 99)), 2),
+            "snapshot_mb": round(snapshot_bytes / 2**20, 1),
+            "save_s": round(save_seconds, 2),
+            "load_s": round(load_seconds, 2),
+        }
+        results.append(row)
+        print(row)
+        del index
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
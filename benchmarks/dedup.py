@@ -0,0 +1,69 @@
+"""Microbenchmark for semantic de-duplication of expansion candidates.
+
+Compares the previous implementation (full sklearn similarity matrix walked
+with a nested Python loop) against the vectorized greedy selection, with and
+without an early-stop limit:
+
+    python -m benchmarks.dedup --sizes 20 100 500 2000 --limit 5
+"""
+import argparse
+import json
+import time
+import numpy as np
+from models.dedup import DEDUP_THRESHOLD, select_diverse
+
+
+def candidates(size, dimension=384, duplicate_rate=0.3, seed=0):
+    """Random unit vectors where a share of rows are near-duplicates of earlier rows."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((size, dimension)).astype("float32")
+    for i in range(1, size):
+        if rng.random() < duplicate_rate:
+            vectors[i] = vectors[rng.integers(0, i)] + 0.1 * rng.standard_normal(dimension)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def legacy_filter(embeddings, threshold=DEDUP_THRESHOLD):
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    similarity_matrix = cosine_similarity(embeddings)
+    return [i for i in range(len(embeddings)) if all(similarity_matrix[i][j] < threshold for j in range(i))]
+
+
+def timed(fn, repeat):
+    fn()  # Warm-up: imports and BLAS initialisation
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return round(float(np.median(timings)) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 100, 500, 2000])
+    parser.add_argument("--limit", type=int, default=5, help="num_return_seq used for early stopping")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        embeddings = candidates(size)
+        row = {
+            "candidates": size,
+            "legacy_ms": timed(lambda: legacy_filter(embeddings), args.repeat),
+            "vectorized_ms": timed(lambda: select_diverse(embeddings), args.repeat),
+            "vectorized_limit_ms": timed(lambda: select_diverse(embeddings, limit=args.limit), args.repeat),
+        }
+        results.append(row)
+        print(row)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Throughput, latency and accuracy of the embedding backends against fp32 PyTorch.
+
+Encodes a sample of the stored queries with every backend and reports:
+
+- throughput (queries/s) for batched encodes,
+- p50/p95/p99 latency of single-query encodes,
+- drift: cosine similarity between each backend's vector and the fp32 one,
+- recall@k of nearest-neighbour search, both within the backend's own
+  vectors and for backend queries against an fp32-built index (what serving
+  sees when only the query path is switched).
+
+    python -m benchmarks.embedding_backends --backends torch int8 onnx --threads 4
+    python -m benchmarks.embedding_backends --queries-file queries.txt --output backends.json
+"""
+import argparse
+import json
+import time
+import numpy as np
+from models.dedup import normalize_rows
+from models.embeddings import BACKENDS, EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_FILE, EmbeddingService
+
+
+def stored_queries(limit):
+    """Up to `limit` queries from Elasticsearch."""
+    from database.elastic_search import QueryDatabase
+    from database.corpus import iter_elastic_queries
+
+    queries = []
+    for chunk in iter_elastic_queries(QueryDatabase().es):
+        queries.extend(chunk)
+        if len(queries) >= limit:
+            break
+    return list(dict.fromkeys(queries))[:limit]
+
+
+def file_queries(path, limit):
+    with open(path) as f:
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))[:limit]
+
+
+def encode_all(service, queries, batch_size):
+    chunks = [service.encode(queries[i:i + batch_size], cache=False) for i in range(0, len(queries), batch_size)]
+    return normalize_rows(np.vstack(chunks))
+
+
+def throughput(service, queries, batch_size):
+    started = time.perf_counter()
+    embeddings = encode_all(service, queries, batch_size)
+    return embeddings, len(queries) / (time.perf_counter() - started)
+
+
+def latencies(service, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        service.encode([query], cache=False)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {f"p{p}_ms": round(float(np.percentile(timings, p)), 3) for p in (50, 95, 99)}
+
+
+def neighbours(corpus, queries, k):
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, 1:k + 1]  # Skip the query itself
+
+
+def recall(expected, found):
+    return float(np.mean([len(set(e) & set(f)) / len(e) for e, f in zip(expected, found)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--onnx-file", default=EMBEDDING_ONNX_FILE)
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads per backend (0: library default)")
+    parser.add_argument("--queries-file", help="one query per line instead of reading Elasticsearch")
+    parser.add_argument("--limit", type=int, default=5000, help="queries to encode")
+    parser.add_argument("--latency-queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    queries = file_queries(args.queries_file, args.limit) if args.queries_file else stored_queries(args.limit)
+    if len(queries) <= args.top_k:
+        raise SystemExit(f"Need more than {args.top_k} queries, found {len(queries)}")
+    probe = np.arange(min(len(queries), args.latency_queries))
+
+    baseline_service = EmbeddingService(args.model, cache_size=0, backend="torch", threads=args.threads)
+    baseline = encode_all(baseline_service, queries, args.batch_size)
+    baseline_neighbours = neighbours(baseline, baseline[probe], args.top_k)
+
+    results = []
+    for backend in args.backends:
+        service = baseline_service if backend == "torch" else EmbeddingService(
+            args.model, cache_size=0, backend=backend, threads=args.threads, onnx_file=args.onnx_file
+        )
+        service.encode(queries[:args.batch_size], cache=False)  # Warm-up
+        embeddings, qps = throughput(service, queries, args.batch_size)
+        drift = np.sum(embeddings * baseline, axis=1)
+        row = {
+            "backend": service.model_id,
+            "queries": len(queries),
+            "throughput_qps": round(qps, 1),
+            **latencies(service, [queries[i] for i in probe]),
+            "cosine_to_fp32_mean": round(float(drift.mean()), 5),
+            "cosine_to_fp32_min": round(float(drift.min()), 5),
+            f"recall_at_{args.top_k}": round(recall(baseline_neighbours, neighbours(embeddings, embeddings[probe], args.top_k)), 4),
+            f"cross_recall_at_{args.top_k}": round(recall(baseline_neighbours, neighbours(baseline, embeddings[probe], args.top_k)), 4),
+        }
+        results.append(row)
+        print(row)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
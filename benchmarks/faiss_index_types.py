@@ -0,0 +1,121 @@
+"""Recall vs latency benchmark for the FAISS index types.
+
+Every index type is built over the same corpus and compared against an exact
+flat index:
+
+    python -m benchmarks.faiss_index_types --size 200000 --queries 1000
+    python -m benchmarks.faiss_index_types --source elastic --output results.json
+"""
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from database.faiss_indexes import INDEX_TYPES, build_index, training_sample, set_search_params
+
+
+def synthetic_corpus(size, dimension, seed=0):
+    """Clustered unit vectors, which resemble sentence embeddings more than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, size // 100), dimension)).astype("float32")
+    vectors = centers[rng.integers(0, len(centers), size)]
+    vectors += 0.3 * rng.standard_normal((size, dimension)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def stored_corpus(model_name):
+    """Embeddings of the queries stored in Elasticsearch."""
+    from sentence_transformers import SentenceTransformer
+    from database.elastic_search import QueryDatabase
+
+    queries = QueryDatabase().search_all_queries()
+    model = SentenceTransformer(model_name)
+    return np.asarray(model.encode(queries, batch_size=256, show_progress_bar=True), dtype="float32")
+
+
+def split_queries(corpus, count, seed=1):
+    """Perturbed copies of corpus rows, so queries follow the corpus distribution."""
+    rng = np.random.default_rng(seed)
+    queries = corpus[rng.integers(0, len(corpus), count)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def measure(index, queries, truth, k):
+    """Single-query latency (the serving pattern) and recall@k against exact results."""
+    latencies, hits = [], 0
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - started)
+        hits += len(set(ids[0]) & set(truth[i]))
+    latencies = np.array(latencies) * 1000
+    return {
+        "recall": round(hits / truth.size, 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "qps": round(float(len(queries) / (latencies.sum() / 1000)), 1),
+    }
+
+
+def run(corpus, queries, k, index_types, nprobes, ef_searches):
+    dimension = corpus.shape[1]
+    flat = faiss.IndexFlatL2(dimension)
+    flat.add(corpus)
+    _, truth = flat.search(queries, k)
+
+    results = []
+    for index_type in index_types:
+        index = flat if index_type == "flat" else build_index(index_type, dimension, len(corpus))
+        started = time.perf_counter()
+        if not index.is_trained:
+            index.train(training_sample(corpus))
+        if index is not flat:
+            index.add(corpus)
+        build_seconds = round(time.perf_counter() - started, 2)
+
+        if index_type.startswith("ivf"):
+            settings = [{"nprobe": n} for n in nprobes]
+        elif index_type == "hnsw":
+            settings = [{"ef_search": ef} for ef in ef_searches]
+        else:
+            settings = [{}]
+        for params in settings:
+            set_search_params(index, **params)
+            row = {"index_type": index_type, "build_s": build_seconds, **params, **measure(index, queries, truth, k)}
+            results.append(row)
+            print(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=("synthetic", "elastic"), default="synthetic")
+    parser.add_argument("--size", type=int, default=100_000, help="synthetic corpus size")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    if args.source == "elastic":
+        corpus = stored_corpus(args.model)
+    else:
+        corpus = synthetic_corpus(args.size, args.dimension)
+    queries = split_queries(corpus, args.queries)
+    print(f"Corpus: {len(corpus)} x {corpus.shape[1]}, {len(queries)} queries, k={args.k}")
+
+    results = run(corpus, queries, args.k, args.types, args.nprobe, args.ef_search)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"corpus_size": len(corpus), "k": args.k, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
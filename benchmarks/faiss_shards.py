@@ -0,0 +1,131 @@
+"""Search throughput vs shard count for the sharded FAISS index.
+
+For every corpus size the same synthetic corpus is indexed once per shard
+count (1 is the unsharded baseline) and searched with single queries, the
+serving pattern. FAISS's own OpenMP threads are pinned (`--omp-threads`, 1
+by default) so the speed-up measured comes from searching shards in
+parallel. Recall is the overlap with the unsharded index's results.
+
+    python -m benchmarks.faiss_shards --sizes 1000000 10000000 --shards 1 2 4 8
+    python -m benchmarks.faiss_shards --sizes 1000000 --type flat --output shards.json
+
+A 10M x 384 corpus needs ~15 GB as float32; it is generated and added in
+chunks, so only the index itself (e.g. ~0.6 GB as ivf_pq) stays in memory.
+"""
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from database.faiss_indexes import (
+    INDEX_TYPES,
+    ShardedIndex,
+    add_id_map,
+    build_index,
+    choose_index_type,
+    set_search_params,
+    training_sample
+)
+
+
+def corpus_chunks(size, dimension, chunk_size, seed=0):
+    """Clustered unit vectors, generated chunk by chunk around one shared set of centers."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, min(size // 100, 100_000)), dimension)).astype("float32")
+    for start in range(0, size, chunk_size):
+        count = min(chunk_size, size - start)
+        vectors = centers[rng.integers(0, len(centers), count)]
+        vectors += 0.3 * rng.standard_normal((count, dimension)).astype("float32")
+        yield start, vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def sample_queries(size, dimension, count, chunk_size):
+    """Perturbed copies of rows from the first chunk."""
+    _, first = next(corpus_chunks(size, dimension, chunk_size))
+    rng = np.random.default_rng(1)
+    queries = first[rng.integers(0, len(first), count)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def build(index_type, size, dimension, num_shards, chunk_size, nprobe):
+    def new_index(corpus_size):
+        return add_id_map(build_index(index_type, dimension, corpus_size))
+
+    index = new_index(size) if num_shards == 1 else ShardedIndex(
+        [new_index(size // num_shards) for _ in range(num_shards)]
+    )
+    started = time.perf_counter()
+    for start, vectors in corpus_chunks(size, dimension, chunk_size):
+        if not index.is_trained:
+            index.train(training_sample(vectors))
+        index.add_with_ids(vectors, np.arange(start, start + len(vectors), dtype="int64"))
+    set_search_params(index, nprobe=nprobe)
+    return index, round(time.perf_counter() - started, 2)
+
+
+def measure(index, queries, k):
+    latencies, found = [], []
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - started)
+        found.append(ids[0])
+    latencies = np.array(latencies) * 1000
+    return np.array(found), {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "qps": round(float(len(queries) / (latencies.sum() / 1000)), 1),
+    }
+
+
+def overlap(expected, found):
+    return round(float(np.mean([len(set(e) & set(f)) / len(e) for e, f in zip(expected, found)])), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--type", default="auto", choices=INDEX_TYPES + ("auto",))
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--chunk-size", type=int, default=200_000)
+    parser.add_argument("--omp-threads", type=int, default=1, help="FAISS OpenMP threads per search")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.omp_threads)
+    shard_counts = sorted(set([1] + args.shards))
+    results = []
+    for size in args.sizes:
+        index_type = choose_index_type(size) if args.type == "auto" else args.type
+        queries = sample_queries(size, args.dimension, args.queries, args.chunk_size)
+        print(f"Corpus: {size} x {args.dimension} ({index_type}), {len(queries)} queries, k={args.k}")
+
+        baseline = None
+        for num_shards in shard_counts:
+            index, build_seconds = build(index_type, size, args.dimension, num_shards, args.chunk_size, args.nprobe)
+            found, timings = measure(index, queries, args.k)
+            baseline = found if baseline is None else baseline
+            row = {
+                "size": size,
+                "index_type": index_type,
+                "shards": num_shards,
+                "build_s": build_seconds,
+                **timings,
+                "overlap_with_unsharded": overlap(baseline, found),
+            }
+            results.append(row)
+            print(row)
+            del index
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Offline load test: throughput and p50/p95/p99 latency, with every external service stubbed locally.
+
+Starts `benchmarks.stand_ins` (fake Google/DuckDuckGo with configurable
+latency and an in-memory Elasticsearch seeded with synthetic queries), runs
+the API against them with a throwaway FAISS directory, and drives:
+
+- expand_query:   GET /expand_query
+- search_results: GET /search_results/
+- faiss:          FAISSIndex.search_similar_queries in-process, per corpus size
+
+at every concurrency level with a closed loop of workers. Each request uses
+a different query from a held-out synthetic set, so response caches mostly
+miss. Results are JSON with one row per (scenario, corpus size,
+concurrency); pass an earlier file as --baseline to print the changes.
+
+    python -m benchmarks.load_test --concurrency 1 8 32 --requests 500 --output results.json
+    python -m benchmarks.load_test --scenarios faiss --faiss-sizes 100000 1000000 --baseline results.json
+
+The FAISS scenario fills the index with synthetic vectors unless
+--faiss-vectors model is given (the model then encodes the whole corpus);
+queries are always encoded with the model, as in serving.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import numpy as np
+from benchmarks.synthetic_queries import generate_queries
+
+QUERY_SEED = 1  # Held out from the corpus, which uses seed 0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until(url, timeout, status=200):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            if httpx.get(url, timeout=5).status_code == status:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"{url} did not return {status} within {timeout}s")
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = np.asarray(latencies) * 1000
+    row = {"requests": len(latencies), "errors": errors, "throughput_rps": round(len(latencies) / elapsed, 1)}
+    if len(latencies):
+        row.update({f"p{p}_ms": round(float(np.percentile(latencies, p)), 2) for p in (50, 95, 99)})
+        row["mean_ms"] = round(float(latencies.mean()), 2)
+    return row
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# HTTP scenarios
+
+async def drive_http(client, url, params_for, queries, concurrency, requests):
+    """Closed loop: `concurrency` workers issue `requests` requests in total, one at a time each."""
+    latencies, errors = [], 0
+    next_request = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in next_request:
+            started = time.perf_counter()
+            try:
+                response = await client.get(url, params=params_for(queries[i % len(queries)]))
+                failed = response.status_code >= 400 or "error" in response.json()
+            except (httpx.HTTPError, ValueError):
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+HTTP_SCENARIOS = {
+    "expand_query": ("/expand_query", lambda q: {"query": q, "num_return_seq": 5}),
+    "search_results": ("/search_results/", lambda q: {"query": q, "num_results": 5}),
+}
+
+
+def take(queries, count):
+    return list(itertools.islice(queries, count))
+
+
+async def run_http(base, scenarios, concurrency_levels, requests, queries, warmup):
+    """`queries` is an iterator shared by all runs, so no run repeats another's (cached) queries."""
+    rows = []
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=httpx.Limits(max_connections=max(concurrency_levels))) as client:
+        for scenario in scenarios:
+            path, params_for = HTTP_SCENARIOS[scenario]
+            if warmup:
+                await drive_http(client, path, params_for, take(queries, warmup), 1, warmup)
+            for concurrency in concurrency_levels:
+                batch = take(queries, requests)
+                row = {"scenario": scenario, "concurrency": concurrency,
+                       **await drive_http(client, path, params_for, batch, concurrency, requests)}
+                rows.append(row)
+                print(row)
+    return rows
+
+
+def start_services(args, workdir):
+    es_port, provider_port, api_port = free_port(), free_port(), free_port()
+    stand_ins = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.stand_ins",
+        "--es-port", str(es_port), "--provider-port", str(provider_port),
+        "--corpus-size", str(args.corpus_size),
+        "--latency-ms", str(args.provider_latency_ms), "--jitter-ms", str(args.provider_jitter_ms),
+        "--error-rate", str(args.provider_error_rate),
+    ])
+    wait_until(f"http://127.0.0.1:{es_port}/", args.timeout)
+
+    env = {
+        **os.environ,
+        "ELASTICSEARCH_HOST": f"http://127.0.0.1:{es_port}",
+        "GOOGLE_SEARCH_URL": f"http://127.0.0.1:{provider_port}/customsearch/v1",
+        "DUCKDUCKGO_URL": f"http://127.0.0.1:{provider_port}/",
+        "GOOGLE_API_KEY": "benchmark",
+        "SEARCH_ENGINE_ID": "benchmark",
+        "FAISS_INDEX_DIR": os.path.join(workdir, "faiss_index"),
+        "FAISS_ROLE": "standalone",
+        "EMBEDDING_STORE_DIR": os.path.join(workdir, "embedding_store"),
+        "AUTOCOMPLETE_SNAPSHOT": os.path.join(workdir, "autocomplete", "trie.pkl"),
+        "DATABASE_URL": "",
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(api_port), "--log-level", "warning",
+         "--workers", str(args.workers)],
+        env=env, stdout=subprocess.DEVNULL if args.quiet else None
+    )
+    wait_until(f"http://127.0.0.1:{api_port}/readyz", args.timeout)
+    return f"http://127.0.0.1:{api_port}", [api, stand_ins]
+
+
+# FAISS scenario
+
+class SyntheticEncoder:
+    def __init__(self, dimension, seed=0):
+        """Clustered unit vectors per text, standing in for the model when filling a large index."""
+        rng = np.random.default_rng(seed)
+        self.centers = rng.standard_normal((256, dimension)).astype("float32")
+        self.rng = rng
+
+    def encode(self, texts, cache=False):
+        vectors = self.centers[self.rng.integers(0, len(self.centers), len(texts))]
+        vectors = vectors + 0.3 * self.rng.standard_normal(vectors.shape).astype("float32")
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_faiss(sizes, concurrency_levels, requests, queries, vectors, warmup):
+    from database.faiss_store import FAISSIndex
+
+    rows = []
+    for size in sizes:
+        index = FAISSIndex(index_dir="", role="standalone")
+        if vectors == "synthetic":
+            index.corpus_encoder = SyntheticEncoder(index.dimension)
+        started = time.perf_counter()
+        index.build(generate_queries(size, seed=0))
+        build_seconds = round(time.perf_counter() - started, 2)
+        for query in take(queries, warmup):
+            index.search_similar_queries(query)
+
+        for concurrency in concurrency_levels:
+            batch = take(queries, requests)
+            latencies, errors = [], 0
+
+            def one(query):
+                started = time.perf_counter()
+                index.search_similar_queries(query)
+                return time.perf_counter() - started
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for future in [executor.submit(one, batch[i % len(batch)]) for i in range(requests)]:
+                    try:
+                        latencies.append(future.result())
+                    except Exception:
+                        errors += 1
+            row = {"scenario": "faiss", "corpus_size": size, "build_s": build_seconds, "concurrency": concurrency,
+                   **summarize(latencies, errors, time.perf_counter() - started)}
+            rows.append(row)
+            print(row)
+    return rows
+
+
+# Comparison
+
+def row_key(row):
+    return row["scenario"], row.get("corpus_size"), row["concurrency"]
+
+
+def compare(baseline_path, rows):
+    with open(baseline_path) as f:
+        baseline = {row_key(row): row for row in json.load(f)["results"]}
+    for row in rows:
+        old = baseline.get(row_key(row))
+        if old is None:
+            continue
+        changes = {
+            metric: f"{old[metric]} -> {row[metric]} ({(row[metric] - old[metric]) / old[metric]:+.1%})"
+            for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+            if old.get(metric) and row.get(metric) is not None
+        }
+        print({"scenario": row["scenario"], "corpus_size": row.get("corpus_size"), "concurrency": row["concurrency"], **changes})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(HTTP_SCENARIOS) + ["faiss"], default=list(HTTP_SCENARIOS) + ["faiss"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=300, help="requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--corpus-size", type=int, default=10_000, help="queries seeded into the Elasticsearch stand-in")
+    parser.add_argument("--faiss-sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--faiss-vectors", choices=("synthetic", "model"), default="synthetic")
+    parser.add_argument("--provider-latency-ms", type=float, default=80)
+    parser.add_argument("--provider-jitter-ms", type=float, default=20)
+    parser.add_argument("--provider-error-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the services to start")
+    parser.add_argument("--quiet", action="store_true", help="hide the API's output")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    args = parser.parse_args()
+
+    levels = sorted(set(args.concurrency))
+    runs = len(args.scenarios) - ("faiss" in args.scenarios) + len(args.faiss_sizes) * ("faiss" in args.scenarios)
+    queries = iter(generate_queries((args.requests * len(levels) + args.warmup) * runs, seed=QUERY_SEED))
+    results = []
+
+    http_scenarios = [s for s in args.scenarios if s in HTTP_SCENARIOS]
+    if http_scenarios:
+        with tempfile.TemporaryDirectory(prefix="load-test-") as workdir:
+            base, processes = start_services(args, workdir)
+            try:
+                results += asyncio.run(run_http(base, http_scenarios, levels, args.requests, queries, args.warmup))
+            finally:
+                for process in processes:
+                    process.terminate()
+                    process.wait()
+
+    if "faiss" in args.scenarios:
+        results += run_faiss(args.faiss_sizes, levels, args.requests, queries, args.faiss_vectors, args.warmup)
+
+    if args.baseline:
+        compare(args.baseline, results)
+    if args.output:
+        report = {
+            "meta": {
+                "revision": git_revision(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "cpus": os.cpu_count(),
+                "args": vars(args),
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
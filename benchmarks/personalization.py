@@ -0,0 +1,88 @@
+"""Microbenchmark for personalization boosts in re_rank_results.
+
+Compares the previous per-keyword substring loop (lowercasing each document
+once per keyword) with the compiled KeywordMatcher:
+
+    python -m benchmarks.personalization --keywords 10 100 500 --docs 50
+"""
+import argparse
+import json
+import random
+import time
+import numpy as np
+from database.preference_cache import KeywordMatcher
+
+WORDS = ["data", "model", "search", "python", "vector", "query", "index", "cloud", "learning", "tools",
+         "privacy", "latency", "ranking", "embedding", "cache", "stream", "graph", "neural", "token", "agent"]
+
+
+def corpus(docs, words_per_doc=300, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) + str(rng.randint(0, 50)) for _ in range(words_per_doc)) for _ in range(docs)]
+
+
+def keywords(count, seed=1):
+    rng = random.Random(seed)
+    unique = set()
+    while len(unique) < count:
+        unique.add(f"{rng.choice(WORDS)}{rng.randint(0, 50)} {rng.choice(WORDS)}")
+    return sorted(unique)
+
+
+def legacy_boost(documents, user_prefs):
+    scores = []
+    for content in documents:
+        score = 0.0
+        for keyword in user_prefs:
+            if keyword.lower() in content.lower():
+                score += 0.2
+        scores.append(score)
+    return scores
+
+
+def matcher_boost(documents, matcher):
+    return [0.2 * matcher.count(content) for content in documents]
+
+
+def timed(fn, repeat):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return round(float(np.median(timings)) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, nargs="+", default=[10, 100, 500, 1000])
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    documents = corpus(args.docs)
+    results = []
+    for count in args.keywords:
+        prefs = keywords(count)
+        matcher = KeywordMatcher(prefs)
+        expected = [round(score / 0.2) for score in legacy_boost(documents, prefs)]
+        assert expected == [matcher.count(content) for content in documents]
+        row = {
+            "keywords": count,
+            "documents": args.docs,
+            "legacy_ms": timed(lambda: legacy_boost(documents, prefs), args.repeat),
+            "matcher_ms": timed(lambda: matcher_boost(documents, matcher), args.repeat),
+            "compile_ms": timed(lambda: KeywordMatcher(prefs), args.repeat),
+        }
+        results.append(row)
+        print(row)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+"""Local stand-ins for the external services, for offline benchmarks.
+
+One process serves, on separate ports:
+
+- fake Google Custom Search (`/customsearch/v1`) and DuckDuckGo (`/`) APIs
+  with configurable latency, jitter and error rate;
+- an in-memory Elasticsearch speaking the subset of the REST API this
+  project uses (ping, index create/exists/mapping, aliases, _bulk with the
+  query upsert script, _search with match/fuzziness/prefix/function_score/
+  knn/sort and the completion suggester, _msearch, _count, point in time),
+  seeded with a synthetic query corpus.
+
+    python -m benchmarks.stand_ins --es-port 9201 --provider-port 9300 --corpus-size 10000
+
+then point the API at them:
+
+    ELASTICSEARCH_HOST=http://127.0.0.1:9201
+    GOOGLE_SEARCH_URL=http://127.0.0.1:9300/customsearch/v1 GOOGLE_API_KEY=bench SEARCH_ENGINE_ID=bench
+    DUCKDUCKGO_URL=http://127.0.0.1:9300/
+
+Relevance is approximate (token matching with edit distance 1 for fuzzy
+queries); the point is realistic request shapes and sizes, not ES scoring.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from benchmarks.synthetic_queries import generate_queries
+from database.elastic_search import QUERIES_INDEX, QUERIES_MAPPING, queries_index_name, query_upsert_operations
+
+ES_HEADERS = {"X-Elastic-Product": "Elasticsearch"}
+
+
+def tokens(text):
+    return str(text).lower().split()
+
+
+def deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))} | {token}
+
+
+class MemoryIndex:
+    def __init__(self, name):
+        """Documents of one index plus an inverted index per text field."""
+        self.name = name
+        self.docs = {}                      # _id -> _source
+        self.order = []                     # _ids in insertion order, for _shard_doc sorts
+        self.postings = defaultdict(set)    # (field, token) -> _ids
+        self.variants = defaultdict(set)    # (field, deletion variant) -> tokens, for fuzzy matching
+        self.prefixes = defaultdict(set)    # (field, token prefix) -> tokens, for edge-ngram subfields
+        self.mappings = {}
+
+    def put(self, doc_id, source):
+        if doc_id in self.docs:
+            self.delete(doc_id)
+        else:
+            self.order.append(doc_id)
+        self.docs[doc_id] = source
+        for field, value in source.items():
+            if isinstance(value, str):
+                for token in tokens(value):
+                    self.postings[(field, token)].add(doc_id)
+                    for variant in deletions(token):
+                        self.variants[(field, variant)].add(token)
+                    for end in range(1, len(token) + 1):
+                        self.prefixes[(field, token[:end])].add(token)
+
+    def delete(self, doc_id):
+        source = self.docs.pop(doc_id, None)
+        if source is None:
+            return False
+        for field, value in source.items():
+            if isinstance(value, str):
+                for token in tokens(value):
+                    self.postings[(field, token)].discard(doc_id)
+        return True
+
+    def match(self, field, text, fuzzy):
+        """_id -> score: matched query tokens, fuzzy ones within edit distance 1 counting less."""
+        scores = defaultdict(float)
+        for token in tokens(text):
+            matched = {token: 1.0}
+            if fuzzy and len(token) > 2:
+                for variant in deletions(token):
+                    for candidate in self.variants.get((field, variant), ()):
+                        matched.setdefault(candidate, 0.5)
+            for candidate, weight in matched.items():
+                for doc_id in self.postings.get((field, candidate), ()):
+                    scores[doc_id] += weight
+        return scores
+
+    def prefix_match(self, field, text):
+        """_id -> score for docs where every query token starts some doc token (an edge-ngram field, operator and)."""
+        scores = None
+        for token in tokens(text):
+            matched = set()
+            for candidate in self.prefixes.get((field, token), ()):
+                matched |= self.postings.get((field, candidate), set())
+            scores = {d: 1.0 for d in matched} if scores is None else {d: s + 1.0 for d, s in scores.items() if d in matched}
+        return scores or {}
+
+    def suggest(self, field, prefix, size):
+        """Completion suggester: docs whose input starts with `prefix`, by weight."""
+        prefix = prefix.lower()
+        options = []
+        for doc_id, source in self.docs.items():
+            completion = source.get(field) or {}
+            if any(str(text).lower().startswith(prefix) for text in completion.get("input", ())):
+                options.append((completion.get("weight", 1), doc_id))
+        options.sort(key=lambda option: option[0], reverse=True)
+        return options[:size]
+
+
+class MemoryElasticsearch:
+    def __init__(self):
+        self.indexes = {}
+        self.aliases = {}  # alias -> index name
+        self.pits = {}  # PIT id -> (index, frozen list of _ids)
+        self._ids = itertools.count(1)
+
+    def index(self, name, create=True):
+        name = self.aliases.get(name, name)
+        if name not in self.indexes and create:
+            self.indexes[name] = MemoryIndex(name)
+        return self.indexes.get(name)
+
+    def create(self, name, body):
+        self.index(name).mappings = body.get("mappings", {})
+        for alias in body.get("aliases", {}):
+            self.aliases[alias] = name
+
+    def update_aliases(self, actions):
+        for action in actions:
+            kind, spec = next(iter(action.items()))
+            if kind == "add":
+                self.aliases[spec["alias"]] = spec["index"]
+            elif kind == "remove":
+                self.aliases.pop(spec["alias"], None)
+            elif kind == "remove_index":
+                self.indexes.pop(spec["index"], None)
+
+    def seed_queries(self, queries):
+        """Seed the versioned queries index behind its alias, through the same upserts the API sends."""
+        self.create(queries_index_name(), {**QUERIES_MAPPING, "aliases": {QUERIES_INDEX: {}}})
+        now = datetime.utcnow()
+        docs = [{"query": query, "timestamp": (now - timedelta(seconds=i)).isoformat()} for i, query in enumerate(queries)]
+        self.bulk(query_upsert_operations(docs))
+
+    # _bulk
+
+    def bulk(self, lines, default_index=None):
+        items, errors = [], False
+        lines = iter(lines)
+        for action_line in lines:
+            action, meta = next(iter(action_line.items()))
+            index = self.index(meta.get("_index", default_index))
+            doc_id = str(meta.get("_id") or next(self._ids))
+            status = 200
+            if action in ("index", "create"):
+                index.put(doc_id, next(lines))
+                status = 201
+            elif action == "update":
+                body = next(lines)
+                existing = index.docs.get(doc_id)
+                source = dict(existing or body.get("upsert") or {})
+                source.update(body.get("doc", {}))
+                if existing is not None and "script" in body:
+                    self._run_upsert_script(source, body["script"].get("params", {}))
+                index.put(doc_id, source)
+            elif action == "delete":
+                status = 200 if index.delete(doc_id) else 404
+            items.append({action: {"_index": index.name, "_id": doc_id, "status": status}})
+        return {"took": 1, "errors": errors, "items": items}
+
+    @staticmethod
+    def _run_upsert_script(source, params):
+        """The effect of UPSERT_QUERY_SCRIPT, the only script this project sends."""
+        source["count"] = source.get("count", 0) + params["count"]
+        source["timestamp"] = params["timestamp"]
+        source["suggest"] = {"input": [source["query"]], "weight": min(source["count"], params["max_weight"])}
+
+    # _search
+
+    def search(self, index_name, body, size=None):
+        body = body or {}
+        size = int(body.get("size", size if size is not None else 10))
+        pit = body.get("pit")
+        if pit:
+            index_name, doc_ids = self.pits[pit["id"]]
+        index = self.index(index_name, create=False)
+        if index is None:
+            return {"hits": {"total": {"value": 0, "relation": "eq"}, "hits": []}}
+        if not pit:
+            doc_ids = index.order
+
+        if "suggest" in body:
+            return self._suggest(index, body)
+
+        query = body.get("query", {"match_all": {}})
+        if "knn" in body:
+            scored = self._knn(index, body["knn"])
+        elif "match_all" in query:
+            scored = {doc_id: 1.0 for doc_id in doc_ids if doc_id in index.docs}
+        else:
+            scored = self._score(index, query)
+
+        hits = self._sorted(index, scored, body.get("sort"), doc_ids if pit else None, body.get("search_after"))
+        source_filter = body.get("_source", body.get("source", True))
+        results = []
+        for doc_id, score, sort in hits[:size]:
+            hit = {"_index": index.name, "_id": doc_id, "_score": score,
+                   "_source": self._filter(index.docs[doc_id], source_filter)}
+            if sort is not None:
+                hit["sort"] = sort
+            results.append(hit)
+        response = {"took": 1, "timed_out": False, "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": results}}
+        if pit:
+            response["pit_id"] = pit["id"]
+        return response
+
+    def _score(self, index, query):
+        if "function_score" in query:
+            spec = query["function_score"]
+            factor = spec.get("field_value_factor", {})
+            scored = self._score(index, spec.get("query", {"match_all": {}}))
+            if factor:
+                for doc_id in scored:
+                    value = index.docs[doc_id].get(factor["field"], factor.get("missing", 1))
+                    scored[doc_id] *= math.log10(1 + value) if factor.get("modifier") == "log1p" else value
+            return scored
+        if "bool" in query:
+            scored = defaultdict(float)
+            for clause in query["bool"].get("should", []):
+                for doc_id, score in self._score(index, clause).items():
+                    scored[doc_id] += score
+            return scored
+        if "match" in query:
+            field, spec = next(iter(query["match"].items()))
+            text, fuzzy = (spec.get("query", ""), bool(spec.get("fuzziness"))) if isinstance(spec, dict) else (spec, False)
+            if field.endswith(".prefix"):
+                return index.prefix_match(field.rsplit(".", 1)[0], text)
+            return index.match(field, text, fuzzy)
+        return {doc_id: 1.0 for doc_id in index.docs}
+
+    def _suggest(self, index, body):
+        source_filter = body.get("_source", body.get("source", True))
+        suggest = {}
+        for name, spec in body["suggest"].items():
+            completion = spec["completion"]
+            options = [
+                {"text": index.docs[doc_id][completion["field"]]["input"][0], "_index": index.name, "_id": doc_id,
+                 "_score": float(weight), "_source": self._filter(index.docs[doc_id], source_filter)}
+                for weight, doc_id in index.suggest(completion["field"], spec["prefix"], int(completion.get("size", 5)))
+            ]
+            suggest[name] = [{"text": spec["prefix"], "offset": 0, "length": len(spec["prefix"]), "options": options}]
+        return {"took": 1, "timed_out": False, "hits": {"total": {"value": 0, "relation": "eq"}, "hits": []}, "suggest": suggest}
+
+    @staticmethod
+    def _knn(index, knn):
+        field = knn["field"]
+        doc_ids = [doc_id for doc_id, source in index.docs.items() if source.get(field) is not None]
+        if not doc_ids:
+            return {}
+        vectors = np.asarray([index.docs[doc_id][field] for doc_id in doc_ids], dtype="float32")
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(knn["query_vector"], dtype="float32")
+        similarities = vectors @ (query / max(np.linalg.norm(query), 1e-12))
+        top = np.argsort(-similarities)[:int(knn.get("k", 10))]
+        return {doc_ids[i]: float((1 + similarities[i]) / 2) for i in top}
+
+    @staticmethod
+    def _sorted(index, scored, sort, pit_order, search_after):
+        fields = [next(iter(s)) if isinstance(s, dict) else s for s in (sort or [])]
+        if "_shard_doc" in fields:
+            position = {doc_id: i for i, doc_id in enumerate(pit_order or index.order)}
+            hits = sorted((position[d], d) for d in scored if d in position and d in index.docs)
+            start = search_after[0] if search_after else -1
+            return [(d, 1.0, [p]) for p, d in hits if p > start]
+        if "timestamp" in fields:
+            ranked = sorted(scored, key=lambda d: index.docs[d].get("timestamp", ""), reverse=True)
+            return [(d, scored[d], None) for d in ranked if d in index.docs]
+        ranked = sorted(scored, key=scored.get, reverse=True)
+        return [(d, scored[d], None) for d in ranked if d in index.docs]
+
+    @staticmethod
+    def _filter(source, source_filter):
+        if source_filter is True or source_filter is None:
+            return source
+        if isinstance(source_filter, list):
+            return {k: v for k, v in source.items() if k in source_filter}
+        if isinstance(source_filter, dict):
+            excludes = set(source_filter.get("excludes", []))
+            return {k: v for k, v in source.items() if k not in excludes}
+        return {}
+
+    def open_pit(self, index_name):
+        pit_id = uuid.uuid4().hex
+        index = self.index(index_name)
+        self.pits[pit_id] = (index.name, list(index.order))
+        return {"id": pit_id}
+
+
+def ndjson(body):
+    return [json.loads(line) for line in body.decode("utf-8").splitlines() if line.strip()]
+
+
+def elasticsearch_app(es):
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def product_header(request, call_next):
+        response = await call_next(request)
+        response.headers.update(ES_HEADERS)  # elasticsearch-py refuses servers without it
+        return response
+
+    def body_of(raw):
+        return json.loads(raw) if raw.strip() else {}
+
+    @app.api_route("/", methods=["GET", "HEAD"])
+    async def info():
+        return {"name": "stand-in", "cluster_name": "benchmark", "version": {"number": "8.17.0"}, "tagline": "You Know, for Search"}
+
+    @app.post("/_bulk")
+    @app.put("/_bulk")
+    async def bulk(request: Request):
+        return es.bulk(ndjson(await request.body()))
+
+    @app.post("/_msearch")
+    @app.get("/_msearch")
+    async def msearch(request: Request):
+        lines = ndjson(await request.body())
+        return {"took": 1, "responses": [
+            {**es.search(header.get("index"), body), "status": 200} for header, body in zip(lines[::2], lines[1::2])
+        ]}
+
+    @app.post("/_search")
+    @app.get("/_search")
+    async def pit_search(request: Request):
+        return es.search(None, body_of(await request.body()), request.query_params.get("size"))
+
+    @app.delete("/_pit")
+    async def close_pit(request: Request):
+        es.pits.pop(body_of(await request.body()).get("id"), None)
+        return {"succeeded": True, "num_freed": 1}
+
+    @app.api_route("/_alias/{name}", methods=["HEAD"])
+    async def alias_exists(name: str):
+        return Response(status_code=200 if name in es.aliases else 404)
+
+    @app.get("/_alias/{name}")
+    async def get_alias(name: str):
+        if name not in es.aliases:
+            return JSONResponse(status_code=404, content={"error": f"alias [{name}] missing", "status": 404})
+        return {es.aliases[name]: {"aliases": {name: {}}}}
+
+    @app.post("/_aliases")
+    async def update_aliases(request: Request):
+        es.update_aliases(body_of(await request.body()).get("actions", []))
+        return {"acknowledged": True}
+
+    @app.api_route("/{index}", methods=["HEAD"])
+    async def exists(index: str):
+        return Response(status_code=200 if index in es.indexes or index in es.aliases else 404)
+
+    @app.put("/{index}")
+    async def create(index: str, request: Request):
+        es.create(index, body_of(await request.body()))
+        return {"acknowledged": True, "index": index}
+
+    @app.delete("/{index}")
+    async def delete_index(index: str):
+        es.indexes.pop(index, None)
+        return {"acknowledged": True}
+
+    @app.post("/{index}/_refresh")
+    async def refresh(index: str):
+        return {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+    @app.put("/{index}/_mapping")
+    async def put_mapping(index: str, request: Request):
+        es.index(index).mappings.setdefault("properties", {}).update(body_of(await request.body()).get("properties", {}))
+        return {"acknowledged": True}
+
+    @app.post("/{index}/_bulk")
+    @app.put("/{index}/_bulk")
+    async def index_bulk(index: str, request: Request):
+        return es.bulk(ndjson(await request.body()), default_index=index)
+
+    @app.post("/{index}/_search")
+    @app.get("/{index}/_search")
+    async def search(index: str, request: Request):
+        return es.search(index, body_of(await request.body()), request.query_params.get("size"))
+
+    @app.post("/{index}/_count")
+    @app.get("/{index}/_count")
+    async def count(index: str):
+        found = es.index(index, create=False)
+        return {"count": len(found.docs) if found else 0}
+
+    @app.post("/{index}/_pit")
+    async def open_pit(index: str):
+        return es.open_pit(index)
+
+    @app.post("/{index}/_doc")
+    async def index_doc(index: str, request: Request):
+        result = es.bulk([{"index": {"_index": index}}, body_of(await request.body())])
+        return {"_index": index, "_id": result["items"][0]["index"]["_id"], "result": "created"}
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+    async def unsupported(path: str):
+        return JSONResponse(status_code=400, content={"error": {"type": "unsupported", "reason": f"/{path} is not emulated"}})
+
+    return app
+
+
+def providers_app(latency_ms, jitter_ms, error_rate, results, seed=0):
+    """Fake Google Custom Search and DuckDuckGo answering with titles derived from the query."""
+    app = FastAPI()
+    rng = random.Random(seed)
+
+    async def respond(payload):
+        await asyncio.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+        if rng.random() < error_rate:
+            return JSONResponse(status_code=503, content={"error": "injected failure"})
+        return payload
+
+    @app.get("/customsearch/v1")
+    async def google(q: str = ""):
+        return await respond({"items": [{"title": f"{q} result {i}", "link": f"https://example.com/{i}"} for i in range(results)]})
+
+    @app.get("/")
+    async def duckduckgo(q: str = ""):
+        return await respond({"RelatedTopics": [{"Text": f"{q} topic {i}"} for i in range(results)]})
+
+    return app
+
+
+def serve(app, port):
+    """Run an app on 127.0.0.1:`port` in a daemon thread."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    return server, thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--es-port", type=int, default=9201)
+    parser.add_argument("--provider-port", type=int, default=9300)
+    parser.add_argument("--corpus-size", type=int, default=10_000, help="synthetic queries seeded into the queries index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=80, help="mean provider latency")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--results", type=int, default=5, help="results per provider response")
+    args = parser.parse_args()
+
+    es = MemoryElasticsearch()
+    es.seed_queries(generate_queries(args.corpus_size, args.seed))
+    print(f"Elasticsearch stand-in on :{args.es_port} with {args.corpus_size} queries")
+    print(f"Provider stand-ins on :{args.provider_port} ({args.latency_ms}±{args.jitter_ms} ms, {args.error_rate:.0%} errors)", flush=True)
+
+    serve(providers_app(args.latency_ms, args.jitter_ms, args.error_rate, args.results, args.seed), args.provider_port)
+    server, _ = serve(elasticsearch_app(es), args.es_port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Time-to-first-request benchmark for the API.
+
+Starts `uvicorn api.main:app` in a fresh process for every run and records:
+
+- import_s: time to import api.main in a separate interpreter,
+- live_s: time until /healthz answers,
+- ready_s: time until /readyz returns 200,
+- first_request_s: time until the first /expand_query completes,
+- first_request_ms: latency of that first request,
+- the per-component startup timings reported by /readyz.
+
+    python -m benchmarks.startup --runs 3 --output startup.json
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import httpx
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_time():
+    code = "import time; t = time.perf_counter(); import api.main; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return round(float(output.strip().splitlines()[-1]), 3)
+
+
+def wait_for(client, url, started, timeout, status=200):
+    while time.perf_counter() - started < timeout:
+        try:
+            response = client.get(url)
+            if response.status_code == status:
+                return round(time.perf_counter() - started, 3), response
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(f"{url} did not return {status} within {timeout}s")
+
+
+def run_once(query, timeout):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"],
+        env=os.environ.copy()
+    )
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            live_s, _ = wait_for(client, f"{base}/healthz", started, timeout)
+            ready_s, ready = wait_for(client, f"{base}/readyz", started, timeout)
+            request_started = time.perf_counter()
+            client.get(f"{base}/expand_query", params={"query": query})
+            first_request_s = round(time.perf_counter() - started, 3)
+            return {
+                "live_s": live_s,
+                "ready_s": ready_s,
+                "first_request_s": first_request_s,
+                "first_request_ms": round((time.perf_counter() - request_started) * 1000, 1),
+                "components": ready.json()["components"],
+            }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--query", default="best ai tools for productivity")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = {"import_s": import_time(), "runs": []}
+    print({"import_s": results["import_s"]})
+    for _ in range(args.runs):
+        row = run_once(args.query, args.timeout)
+        results["runs"].append(row)
+        print({k: v for k, v in row.items() if k != "components"})
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Deterministic synthetic search queries for benchmarks.
+
+Queries are built from templates and small vocabularies, so they share words
+the way real query logs do (fuzzy and semantic matches exist) while a seed
+makes every run reproducible:
+
+    python -m benchmarks.synthetic_queries --count 100000 --output queries.txt
+"""
+import argparse
+import random
+
+TOPICS = [
+    "laptop", "phone", "camera", "headphones", "monitor", "keyboard", "router", "tablet", "smartwatch", "printer",
+    "python", "javascript", "rust", "database", "kubernetes", "docker", "linux", "excel", "spreadsheet", "api",
+    "recipe", "pasta", "coffee", "bread", "salad", "vegan dinner", "smoothie", "pizza dough", "curry", "soup",
+    "flight", "hotel", "train", "visa", "backpack", "road trip", "beach", "camping", "hiking boots", "passport",
+    "mortgage", "budget", "credit card", "index fund", "tax return", "insurance", "savings", "loan", "pension", "stocks",
+    "running", "yoga", "protein", "sleep", "meditation", "workout", "cycling", "marathon", "stretching", "diet",
+]
+QUALIFIERS = [
+    "best", "cheap", "fast", "lightweight", "beginner", "advanced", "quiet", "portable", "wireless", "free",
+    "open source", "easy", "healthy", "modern", "reliable", "secure", "small", "professional", "budget", "top rated",
+]
+GOALS = [
+    "for students", "for work", "for travel", "for gaming", "for beginners", "for families", "at home",
+    "on a budget", "for productivity", "for small business", "in 2025", "near me", "for kids", "for seniors",
+]
+ACTIONS = [
+    "how to choose", "how to fix", "how to set up", "how to learn", "how to clean", "how to compare",
+    "what is", "why use", "when to replace", "how much does",
+]
+TEMPLATES = [
+    "{qualifier} {topic}",
+    "{qualifier} {topic} {goal}",
+    "{action} {topic}",
+    "{action} a {qualifier} {topic}",
+    "{topic} vs {other}",
+    "{topic} {goal}",
+    "{topic} tips {goal}",
+    "{qualifier} {topic} review",
+]
+
+
+def generate_queries(count, seed=0):
+    """`count` distinct queries; the same seed always gives the same list."""
+    rng = random.Random(seed)
+    queries = {}
+    attempts = 0
+    while len(queries) < count:
+        attempts += 1
+        query = rng.choice(TEMPLATES).format(
+            qualifier=rng.choice(QUALIFIERS),
+            topic=rng.choice(TOPICS),
+            other=rng.choice(TOPICS),
+            goal=rng.choice(GOALS),
+            action=rng.choice(ACTIONS),
+        )
+        if attempts > count * 4:
+            query = f"{query} {rng.randrange(10 ** 6)}"  # Templates exhausted: long tail of unique queries
+        queries.setdefault(query, None)
+    return list(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write one query per line (default: print)")
+    args = parser.parse_args()
+
+    queries = generate_queries(args.count, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("\n".join(queries) + "\n")
+    else:
+        print("\n".join(queries))
+
+
+if __name__ == "__main__":
+    main()
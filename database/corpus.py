@@ -0,0 +1,179 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, select
+from database.models import QueryLogs
+
+CORPUS_CHUNK_SIZE = int(os.getenv("CORPUS_CHUNK_SIZE", "5000"))
+CORPUS_PREFETCH = int(os.getenv("CORPUS_PREFETCH", "2"))
+CORPUS_PROGRESS_INTERVAL = float(os.getenv("CORPUS_PROGRESS_INTERVAL", "5"))
+ES_PIT_KEEP_ALIVE = os.getenv("ES_PIT_KEEP_ALIVE", "2m")
+
+
+def elastic_page(chunk_size, pit_id, search_after=None, fields=("query",), query=None):
+    """One page of a point-in-time scan over every document (or those matching `query`), in index order."""
+    page = {
+        "size": chunk_size,
+        "pit": {"id": pit_id, "keep_alive": ES_PIT_KEEP_ALIVE},
+        "sort": [{"_shard_doc": "asc"}],
+        "source": list(fields),
+    }
+    if query is not None:
+        page["query"] = query
+    if search_after is not None:
+        page["search_after"] = search_after
+    return page
+
+
+def page_queries(response):
+    return [hit["_source"]["query"] for hit in response["hits"]["hits"] if hit["_source"].get("query")]
+
+
+def iter_elastic_queries(es, index="queries", chunk_size=CORPUS_CHUNK_SIZE):
+    """Yield every stored query in chunks, using a point in time and search_after.
+
+    Unlike from/size or a single large search this has no result window limit,
+    sees a consistent view while documents keep arriving and holds only one
+    page in memory.
+    """
+    for response in iter_elastic_pages(es, index, chunk_size):
+        yield page_queries(response)
+
+
+def iter_elastic_docs(es, index, fields, chunk_size=CORPUS_CHUNK_SIZE):
+    """Yield the `fields` of every document in chunks of `_source` dicts, as iter_elastic_queries does."""
+    for response in iter_elastic_pages(es, index, chunk_size, fields):
+        yield [hit["_source"] for hit in response["hits"]["hits"]]
+
+
+def iter_elastic_pages(es, index, chunk_size, fields=("query",)):
+    pit_id = es.open_point_in_time(index=index, keep_alive=ES_PIT_KEEP_ALIVE)["id"]
+    search_after = None
+    try:
+        while True:
+            response = es.search(**elastic_page(chunk_size, pit_id, search_after, fields))
+            hits = response["hits"]["hits"]
+            if not hits:
+                return
+            pit_id = response.get("pit_id", pit_id)
+            search_after = hits[-1]["sort"]
+            yield response
+    finally:
+        es.close_point_in_time(id=pit_id)
+
+
+async def aiter_elastic_queries(es, index="queries", chunk_size=CORPUS_CHUNK_SIZE):
+    """Async version of iter_elastic_queries for AsyncElasticsearch."""
+    async for response in aiter_elastic_pages(es, index, chunk_size):
+        yield page_queries(response)
+
+
+async def aiter_elastic_docs(es, index, fields, chunk_size=CORPUS_CHUNK_SIZE, query=None):
+    """Async version of iter_elastic_docs for AsyncElasticsearch; `query` limits the scan."""
+    async for response in aiter_elastic_pages(es, index, chunk_size, fields, query):
+        yield [hit["_source"] for hit in response["hits"]["hits"]]
+
+
+async def aiter_elastic_pages(es, index, chunk_size, fields=("query",), query=None):
+    pit_id = (await es.open_point_in_time(index=index, keep_alive=ES_PIT_KEEP_ALIVE))["id"]
+    search_after = None
+    try:
+        while True:
+            response = await es.search(**elastic_page(chunk_size, pit_id, search_after, fields, query))
+            hits = response["hits"]["hits"]
+            if not hits:
+                return
+            pit_id = response.get("pit_id", pit_id)
+            search_after = hits[-1]["sort"]
+            yield response
+    finally:
+        await es.close_point_in_time(id=pit_id)
+
+
+async def aiter_postgres_queries(db, chunk_size=CORPUS_CHUNK_SIZE):
+    """Yield distinct logged queries in chunks through a server-side cursor.
+
+    Only the query column is selected, so no ORM objects are built, and rows
+    are fetched `chunk_size` at a time rather than materialized up front.
+    """
+    statement = select(QueryLogs.query).distinct().execution_options(yield_per=chunk_size)
+    result = await db.stream(statement)
+    async for rows in result.partitions(chunk_size):
+        yield [row[0] for row in rows if row[0]]
+
+
+async def count_elastic_queries(es, index="queries"):
+    try:
+        return (await es.count(index=index))["count"]
+    except Exception as e:
+        print(f"Elasticsearch Error: {e}")
+        return 0
+
+
+async def count_postgres_queries(db):
+    """Logged query rows; an upper bound on the distinct queries streamed."""
+    try:
+        return (await db.execute(select(func.count()).select_from(QueryLogs))).scalar() or 0
+    except Exception as e:
+        print(f"PostgreSQL Error: {e}")
+        return 0
+
+
+async def chain_chunks(*sources):
+    for source in sources:
+        async for chunk in source:
+            yield chunk
+
+
+async def encode_chunks(chunks, embedder, prefetch=CORPUS_PREFETCH):
+    """Pipeline text chunks through the encoder on a dedicated thread.
+
+    Up to `prefetch` chunks are encoded ahead of the consumer, so reading the
+    next page, encoding and adding to the index overlap. Yields
+    `(texts, embeddings)`; the corpus cache is bypassed.
+    """
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="corpus-encoder") as executor:
+        try:
+            async for texts in chunks:
+                if not texts:
+                    continue
+                pending.append((texts, loop.run_in_executor(executor, embedder.encode, texts, False)))
+                if len(pending) > prefetch:
+                    texts, future = pending.popleft()
+                    yield texts, await future
+            while pending:
+                texts, future = pending.popleft()
+                yield texts, await future
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+class Progress:
+    def __init__(self, label, total=None, interval=CORPUS_PROGRESS_INTERVAL):
+        """Periodic count and throughput readout for long-running corpus jobs."""
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.count = 0
+        self.started = time.perf_counter()
+        self.last_report = self.started
+
+    def update(self, count):
+        self.count += count
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            print(self._line(now))
+
+    def done(self):
+        print(self._line(time.perf_counter()) + " - done")
+
+    def _line(self, now):
+        elapsed = max(now - self.started, 1e-9)
+        total = f"/{self.total}" if self.total else ""
+        return f"{self.label}: {self.count}{total} queries in {elapsed:.1f}s ({self.count / elapsed:.0f}/s)"
@@ -1,6 +1,7 @@
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import User, UserPreferences
+from database.preference_cache import get_preference_cache
 
 # Create a new user
 async def create_user(db: AsyncSession, username: str, email: str):
@@ -38,6 +39,7 @@ async def store_user_preferences(db: AsyncSession, user_id: int, preferences: di
         db.add(new_preferences)
 
     await db.commit()
+    get_preference_cache().invalidate(user_id)
     return preferences
 
 # Get user preferences
@@ -45,4 +47,9 @@ async def get_user_preferences(db: AsyncSession, user_id: int):
     """Retrieves user preferences for personalized ranking."""
     result = await db.execute(select(UserPreferences).filter(UserPreferences.user_id == user_id))
     preferences = result.scalars().first()
-    return preferences.preferred_keywords if preferences else []
\ No newline at end of file
+    return preferences.preferred_keywords if preferences else []
+
+# Get compiled keyword matcher for personalization
+async def get_preference_matcher(db: AsyncSession, user_id: int):
+    """Returns the user's cached keyword matcher, loading preferences on a miss."""
+    return await get_preference_cache().get(user_id, lambda: get_user_preferences(db, user_id))
@@ -1,45 +1,244 @@
-from elasticsearch import Elasticsearch, ConnectionError
+from elasticsearch import Elasticsearch, AsyncElasticsearch, ConnectionError
 from datetime import datetime
+import asyncio
 import os
 import time
 from sqlalchemy.orm import Session
 from database.models import UserPreferences
+from database.write_behind import WriteBehindBuffer
+from database.corpus import iter_elastic_queries, aiter_elastic_queries
+from database.query_store import query_id
 from sqlalchemy import text
 
+ES_BULK_SIZE = int(os.getenv("ES_BULK_SIZE", "500"))
+ES_FLUSH_INTERVAL = float(os.getenv("ES_FLUSH_INTERVAL", "1.0"))
+ES_MAX_PENDING = int(os.getenv("ES_MAX_PENDING", "10000"))
+QUERY_NGRAM_MAX = int(os.getenv("QUERY_NGRAM_MAX", "20"))
+
+# "queries" is an alias for the current versioned index, so mapping changes can be reindexed and swapped in
+QUERIES_INDEX = "queries"
+QUERIES_INDEX_VERSION = 2
+MAX_SUGGEST_WEIGHT = 2**31 - 1
+
+def embedding_property(dims):
+    """Stored document vectors; `dims` must be the embedding model's dimension."""
+    return {
+        "embedding": {
+            "type": "dense_vector",
+            "dims": dims,
+            "index": True,
+            "similarity": "cosine"
+        }
+    }
+
+
+def documents_mapping(dims):
+    return {
+        "mappings": {
+            "properties": {
+                "title": {"type": "text"},
+                "content": {"type": "text"},
+                "timestamp": {"type": "date"},
+                **embedding_property(dims)
+            }
+        }
+    }
+
+QUERIES_MAPPING = {
+    "settings": {
+        "analysis": {
+            "filter": {
+                "query_edge_ngram": {"type": "edge_ngram", "min_gram": 1, "max_gram": QUERY_NGRAM_MAX}
+            },
+            "analyzer": {
+                "query_prefix": {"type": "custom", "tokenizer": "standard", "filter": ["lowercase", "query_edge_ngram"]}
+            }
+        }
+    },
+    "mappings": {
+        "properties": {
+            "query": {
+                "type": "text",
+                "fields": {
+                    "keyword": {"type": "keyword", "ignore_above": 256},
+                    "prefix": {"type": "text", "analyzer": "query_prefix", "search_analyzer": "standard"}
+                }
+            },
+            "suggest": {"type": "completion"},
+            "count": {"type": "long"},
+            "timestamp": {"type": "date"}
+        }
+    }
+}
+
+# Repeats of a query raise its count and completion weight instead of adding documents
+UPSERT_QUERY_SCRIPT = """
+ctx._source.count = (ctx._source.count == null ? 0 : ctx._source.count) + params.count;
+if (params.timestamp != null) { ctx._source.timestamp = params.timestamp; }
+ctx._source.suggest = ['input': [ctx._source.query], 'weight': (int) Math.min(ctx._source.count, params.max_weight)];
+"""
+
+def queries_index_name(version=QUERIES_INDEX_VERSION):
+    return f"{QUERIES_INDEX}-v{version}"
+
+def query_doc(query: str):
+    return {"query": query, "timestamp": datetime.utcnow()}
+
+def query_upsert_operations(docs, index=QUERIES_INDEX):
+    """Bulk scripted upserts keyed on the query ID, with repeats within the batch merged into one.
+
+    A missing timestamp (documents from before timestamps were stored) never
+    replaces a known one.
+    """
+    batch = {}
+    for doc in docs:
+        qid = query_id(doc["query"])
+        count = doc.get("count", 1)
+        timestamp = doc.get("timestamp")
+        if qid in batch:
+            batch[qid]["count"] += count
+            batch[qid]["timestamp"] = max((t for t in (batch[qid]["timestamp"], timestamp) if t is not None),
+                                          default=None)
+        else:
+            batch[qid] = {"query": doc["query"], "count": count, "timestamp": timestamp}
+
+    operations = []
+    for qid, doc in batch.items():
+        operations.append({"update": {"_index": index, "_id": str(qid)}})
+        operations.append({
+            "script": {
+                "source": UPSERT_QUERY_SCRIPT,
+                "lang": "painless",
+                "params": {"count": doc["count"], "timestamp": doc["timestamp"], "max_weight": MAX_SUGGEST_WEIGHT}
+            },
+            "upsert": {**doc, "suggest": {"input": [doc["query"]], "weight": min(doc["count"], MAX_SUGGEST_WEIGHT)}}
+        })
+    return operations
+
+def similar_queries_body(query: str):
+    """Edge-ngram prefix match plus a bounded fuzzy match, scaled by how often each query was seen.
+
+    Popularity is a stored count, so no hit needs sorting by timestamp.
+    """
+    return {
+        "query": {
+            "function_score": {
+                "query": {
+                    "bool": {
+                        "should": [
+                            {"match": {"query.prefix": {"query": query, "operator": "and"}}},
+                            {"match": {"query": {"query": query, "fuzziness": "AUTO", "prefix_length": 1, "max_expansions": 20}}}
+                        ],
+                        "minimum_should_match": 1
+                    }
+                },
+                "field_value_factor": {"field": "count", "modifier": "log1p", "missing": 1},
+                "boost_mode": "multiply"
+            }
+        },
+        "_source": ["query"]
+    }
+
+def legacy_similar_queries_body(query: str):
+    """For a queries index created before its mapping (see scripts/migrate_queries_index.py)."""
+    return {
+        "query": {
+            "match": {
+                "query": {
+                    "query": query,
+                    "fuzziness": "AUTO"
+                }
+            }
+        },
+        "sort": [{"timestamp": {"order": "desc"}}]
+    }
+
+def suggest_body(prefix: str, size: int):
+    return {
+        "suggest": {
+            "queries": {
+                "prefix": prefix,
+                "completion": {"field": "suggest", "size": size, "skip_duplicates": True}
+            }
+        },
+        "_source": ["query"]
+    }
+
+def suggestions(response):
+    return [option["_source"]["query"] for option in response["suggest"]["queries"][0]["options"]]
+
+def documents_body(query: str):
+    return {"query": {"match": {"content": query}}, "_source": {"excludes": ["embedding"]}}
+
+def documents_knn_body(query_vector, k: int, num_candidates: int):
+    return {
+        "knn": {
+            "field": "embedding",
+            "query_vector": [float(x) for x in query_vector],
+            "k": k,
+            "num_candidates": num_candidates
+        }
+    }
+
+def document_hits(response):
+    hits = []
+    for hit in response["hits"]["hits"]:
+        doc = {
+            "id": hit["_id"],
+            "title": hit["_source"].get("title", "No Title"),
+            "content": hit["_source"].get("content", "No Content"),
+            "score": hit.get("_score", 0)
+        }
+        if "embedding" in hit["_source"]:
+            doc["embedding"] = hit["_source"]["embedding"]
+        hits.append(doc)
+    return hits
+
+def document_doc(title: str, content: str, embedding=None):
+    doc = {"title": title, "content": content, "timestamp": datetime.utcnow()}
+    if embedding is not None:
+        doc["embedding"] = [float(x) for x in embedding]
+    return doc
+
+def bulk_operations(docs, index="queries"):
+    operations = []
+    for doc in docs:
+        operations.append({"index": {"_index": index}})
+        operations.append(doc)
+    return operations
+
 class QueryDatabase:
     def __init__(self):
-        """Initialize connection to ElasticSearch & PostgreSQL with retries"""
+        """Synchronous ElasticSearch access for scripts and tools.
+
+        Creating the client does not touch the network; call `connect_to_es`
+        to wait for the cluster and ensure the queries index exists.
+        """
         self.ELASTICSEARCH_HOST = os.getenv("ELASTICSEARCH_HOST", "http://localhost:9200")
-        self.es = None
-        self.connect_to_es()
-        self.create_documents_index()  # Ensure the index exists
+        self.es = Elasticsearch(self.ELASTICSEARCH_HOST)
+        self.queries_mapped = True  # False while the queries index predates its mapping
 
-    def connect_to_es(self):
+    def connect_to_es(self, max_retries=5, retry_delay=5):
         """Retry connecting to Elasticsearch"""
-        max_retries = 5
-        retry_delay = 5  # seconds
-
         for attempt in range(max_retries):
             try:
-                self.es = Elasticsearch(self.ELASTICSEARCH_HOST)
                 if self.es.ping():
                     print(f"Connected to Elasticsearch at {self.ELASTICSEARCH_HOST}")
+                    self.create_queries_index()
                     return
             except ConnectionError:
-                print(f"Elasticsearch not available. Retrying ({attempt + 1}/{max_retries})...")
-                time.sleep(retry_delay)
+                pass
+            print(f"Elasticsearch not available. Retrying ({attempt + 1}/{max_retries})...")
+            time.sleep(retry_delay)
 
         raise ConnectionError(f"Failed to connect to Elasticsearch at {self.ELASTICSEARCH_HOST}")
 
     def store_query(self, query: str, db: Session):
         """Store a new query in Elasticsearch and PostgreSQL"""
-        doc = {
-            "query": query,
-            "timestamp": datetime.utcnow()
-        }
+        doc = query_doc(query)
 
         try:
-            self.es.index(index="queries", document=doc)
+            self.es.bulk(operations=query_upsert_operations([doc]))
         except Exception as e:
             print(f"Error storing query in Elasticsearch: {e}")
 
@@ -52,52 +251,49 @@ class QueryDatabase:
         #     db.rollback()
         #     print(f"Error storing query in PostgreSQL: {e}")
 
+    def store_queries(self, queries):
+        """Store many queries in Elasticsearch with a single _bulk request"""
+        if not queries:
+            return
+        try:
+            response = self.es.bulk(operations=query_upsert_operations(query_doc(q) for q in queries))
+            if response.get("errors"):
+                print("Some queries failed to index in Elasticsearch bulk request")
+        except Exception as e:
+            print(f"Error bulk storing queries in Elasticsearch: {e}")
+
     def search_similar_queries(self, query: str, top_n: int = 5):
         try:
-            body = {
-                "query": {
-                    "match": {
-                        "query": {
-                            "query": query,
-                            "fuzziness": "AUTO"
-                        }
-                    }
-                },
-                "sort": [{"timestamp": {"order": "desc"}}]
-            }
-            response = self.es.search(index="queries", body=body, size=top_n)
+            body = similar_queries_body(query) if self.queries_mapped else legacy_similar_queries_body(query)
+            response = self.es.search(index=QUERIES_INDEX, body=body, size=top_n)
             return [hit["_source"]["query"] for hit in response["hits"]["hits"]]
         except Exception as e:
             print(f"Elasticsearch Error: {e}")
             return []
 
+    def suggest_queries(self, prefix: str, top_n: int = 5):
+        """Most popular stored queries starting with `prefix`, from the completion suggester."""
+        if not self.queries_mapped:
+            return []
+        try:
+            return suggestions(self.es.search(index=QUERIES_INDEX, body=suggest_body(prefix, top_n)))
+        except Exception as e:
+            print(f"Elasticsearch Error: {e}")
+            return []
+
     def search_all_queries(self):
+        """Every stored query. Holds the whole corpus in memory; stream large ones with iter_elastic_queries."""
         try:
-            body = {"query": {"match_all": {}}}
-            response = self.es.search(index="queries", body=body, size=1000)
-            return [hit["_source"]["query"] for hit in response["hits"]["hits"]]
+            return [query for chunk in iter_elastic_queries(self.es) for query in chunk]
         except Exception as e:
             print(f"Elasticsearch Error: {e}")
             return []
 
     def search_documents(self, query: str, top_n: int = 10):
         try:
-            body = {
-                "query": {
-                    "match": {
-                        "content": query
-                    }
-                }
-            }
+            body = documents_body(query)
             response = self.es.search(index="documents", body=body, size=top_n)
-            return [
-                {
-                    "title": hit["_source"].get("title", "No Title"),
-                    "content": hit["_source"].get("content", "No Content"),
-                    "score": hit.get("_score", 0)
-                }
-                for hit in response["hits"]["hits"]
-            ]
+            return document_hits(response)
         except Exception as e:
             print(f"Elasticsearch Error: {e}")
             return []
@@ -110,19 +306,183 @@ class QueryDatabase:
             print(f"PostgreSQL Error: {e}")
             return []
 
-    def create_documents_index(self):
+    def create_queries_index(self):
+        """Create the versioned queries index behind its alias, or detect one that predates the mapping."""
         try:
-            if not self.es.indices.exists(index="documents"):
-                body = {
-                    "mappings": {
-                        "properties": {
-                            "title": {"type": "text"},
-                            "content": {"type": "text"},
-                            "timestamp": {"type": "date"}
-                        }
-                    }
-                }
-                self.es.indices.create(index="documents", body=body)
+            if not self.es.indices.exists(index=QUERIES_INDEX):
+                name = queries_index_name()
+                self.es.indices.create(index=name, body={**QUERIES_MAPPING, "aliases": {QUERIES_INDEX: {}}})
+                print(f"Created '{name}' index with alias '{QUERIES_INDEX}'")
+            elif not self.es.indices.exists_alias(name=QUERIES_INDEX):
+                self.queries_mapped = False
+                print(f"The '{QUERIES_INDEX}' index has no mapping; run python -m scripts.migrate_queries_index")
+        except Exception as e:
+            print(f"Error creating '{QUERIES_INDEX}' index: {e}")
+
+
+class AsyncQueryDatabase:
+    def __init__(self):
+        """Non-blocking ElasticSearch access with write-behind query logging"""
+        self.ELASTICSEARCH_HOST = os.getenv("ELASTICSEARCH_HOST", "http://localhost:9200")
+        self.es = AsyncElasticsearch(self.ELASTICSEARCH_HOST)
+        self.query_log = WriteBehindBuffer(
+            self._bulk_index,
+            max_batch=ES_BULK_SIZE,
+            flush_interval=ES_FLUSH_INTERVAL,
+            max_pending=ES_MAX_PENDING,
+            name="Elasticsearch query log"
+        )
+        self.queries_mapped = True  # False while the queries index predates its mapping
+
+    async def connect_to_es(self, max_retries=5, retry_delay=5):
+        """Retry connecting to Elasticsearch without blocking the event loop"""
+        for attempt in range(max_retries):
+            try:
+                if await self.es.ping():
+                    print(f"Connected to Elasticsearch at {self.ELASTICSEARCH_HOST}")
+                    await self.create_queries_index()
+                    return
+            except ConnectionError:
+                pass
+            print(f"Elasticsearch not available. Retrying ({attempt + 1}/{max_retries})...")
+            await asyncio.sleep(retry_delay)
+
+        raise ConnectionError(f"Failed to connect to Elasticsearch at {self.ELASTICSEARCH_HOST}")
+
+    async def _bulk_index(self, docs):
+        response = await self.es.bulk(operations=query_upsert_operations(docs))
+        if response.get("errors"):
+            print("Some queries failed to index in Elasticsearch bulk request")
+
+    async def store_query(self, query: str):
+        """Queue a query for the next bulk write; waits only when the buffer is full"""
+        await self.query_log.put(query_doc(query))
+
+    async def store_queries(self, queries):
+        """Store many queries with a single _bulk request"""
+        if not queries:
+            return
+        try:
+            await self._bulk_index([query_doc(q) for q in queries])
+        except Exception as e:
+            print(f"Error bulk storing queries in Elasticsearch: {e}")
+
+    def _similar_queries_body(self, query: str):
+        return similar_queries_body(query) if self.queries_mapped else legacy_similar_queries_body(query)
+
+    async def search_similar_queries(self, query: str, top_n: int = 5):
+        try:
+            body = self._similar_queries_body(query)
+            response = await self.es.search(index=QUERIES_INDEX, body=body, size=top_n)
+            return [hit["_source"]["query"] for hit in response["hits"]["hits"]]
+        except Exception as e:
+            print(f"Elasticsearch Error: {e}")
+            return []
+
+    async def suggest_queries(self, prefix: str, top_n: int = 5):
+        """Most popular stored queries starting with `prefix`, from the completion suggester."""
+        if not self.queries_mapped:
+            return []
+        try:
+            return suggestions(await self.es.search(index=QUERIES_INDEX, body=suggest_body(prefix, top_n)))
+        except Exception as e:
+            print(f"Elasticsearch Error: {e}")
+            return []
+
+    async def msearch_similar_queries(self, queries, top_n: int = 5):
+        """Fuzzy lookups for many queries in a single _msearch round-trip"""
+        if not queries:
+            return []
+        searches = []
+        for query in queries:
+            searches.append({"index": QUERIES_INDEX})
+            searches.append({**self._similar_queries_body(query), "size": top_n})
+        try:
+            response = await self.es.msearch(searches=searches)
+            return [
+                [hit["_source"]["query"] for hit in item["hits"]["hits"]] if "hits" in item else []
+                for item in response["responses"]
+            ]
+        except Exception as e:
+            print(f"Elasticsearch Error: {e}")
+            return [[] for _ in queries]
+
+    async def search_all_queries(self):
+        """Every stored query. Holds the whole corpus in memory; stream large ones with aiter_elastic_queries."""
+        try:
+            return [query async for chunk in aiter_elastic_queries(self.es) for query in chunk]
+        except Exception as e:
+            print(f"Elasticsearch Error: {e}")
+            return []
+
+    async def search_documents(self, query: str, top_n: int = 10):
+        try:
+            body = documents_body(query)
+            response = await self.es.search(index="documents", body=body, size=top_n)
+            return document_hits(response)
+        except Exception as e:
+            print(f"Elasticsearch Error: {e}")
+            return []
+
+    async def hybrid_documents(self, query: str, query_vector, top_n: int = 50, num_candidates: int = 200):
+        """BM25 and kNN candidate lists from the documents index in a single _msearch round-trip"""
+        searches = [
+            {"index": "documents"},
+            {**documents_body(query), "size": top_n, "_source": True},
+            {"index": "documents"},
+            {**documents_knn_body(query_vector, top_n, num_candidates), "size": top_n}
+        ]
+        try:
+            response = await self.es.msearch(searches=searches)
+            return [document_hits(item) if "hits" in item else [] for item in response["responses"]]
+        except Exception as e:
+            print(f"Elasticsearch Error: {e}")
+            return [[], []]
+
+    async def index_documents(self, docs):
+        """Bulk index documents (with their embeddings) into the documents index"""
+        if not docs:
+            return
+        response = await self.es.bulk(operations=bulk_operations(docs, index="documents"))
+        if response.get("errors"):
+            print("Some documents failed to index in Elasticsearch bulk request")
+
+    async def create_queries_index(self):
+        """Create the versioned queries index behind its alias, or detect one that predates the mapping."""
+        try:
+            if not await self.es.indices.exists(index=QUERIES_INDEX):
+                name = queries_index_name()
+                await self.es.indices.create(index=name, body={**QUERIES_MAPPING, "aliases": {QUERIES_INDEX: {}}})
+                print(f"Created '{name}' index with alias '{QUERIES_INDEX}'")
+            elif not await self.es.indices.exists_alias(name=QUERIES_INDEX):
+                self.queries_mapped = False
+                print(f"The '{QUERIES_INDEX}' index has no mapping; run python -m scripts.migrate_queries_index")
+        except Exception as e:
+            print(f"Error creating '{QUERIES_INDEX}' index: {e}")
+
+    async def create_documents_index(self, dims):
+        """Create the documents index with `dims`-wide vectors, or check an existing one against them.
+
+        Called once the embedding model is loaded, since `dims` is its dimension.
+        """
+        try:
+            if not await self.es.indices.exists(index="documents"):
+                await self.es.indices.create(index="documents", body=documents_mapping(dims))
                 print("Created 'documents' index")
+                return
+            mapping = await self.es.indices.get_mapping(index="documents")
+            properties = next(iter(mapping.values()))["mappings"].get("properties", {})
+            stored_dims = properties.get("embedding", {}).get("dims")
+            if stored_dims is None:
+                # Indexes created before hybrid search lack the vector field
+                await self.es.indices.put_mapping(index="documents", properties=embedding_property(dims))
+            elif stored_dims != dims:
+                print(f"The 'documents' index stores {stored_dims}-dim vectors but the embedding model produces {dims}; "
+                      "reindex the documents before using hybrid search")
         except Exception as e:
             print(f"Error creating 'documents' index: {e}")
+
+    async def close(self):
+        """Flush pending query logs and close the client"""
+        await self.query_log.close()
+        await self.es.close()
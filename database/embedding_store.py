@@ -0,0 +1,159 @@
+import json
+import os
+import re
+import threading
+import numpy as np
+from database.query_store import query_id
+
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "embedding_store")  # Empty disables the store
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32")      # float32 or float16
+
+VECTORS_FILE = "vectors.bin"
+IDS_FILE = "ids.bin"
+META_FILE = "meta.json"
+
+
+def store_name(model_name, dimension, dtype):
+    """Directory name for one model's vectors; different models never share rows."""
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name).strip("_")
+    return f"{slug}-{dimension}-{np.dtype(dtype).name}"
+
+
+class EmbeddingStore:
+    def __init__(self, service, directory=EMBEDDING_STORE_DIR, dtype=EMBEDDING_STORE_DTYPE):
+        """Persistent, content-addressed embeddings for bulk corpus encodes.
+
+        Vectors are appended to a flat file that is memory-mapped for reads;
+        a parallel file holds each row's ID, the hash of the normalized text
+        (see query_store.query_id). Rebuilds only run the model on texts that
+        have never been embedded with this model. With float32 storage, chunks
+        whose rows are stored contiguously are returned as views of the map.
+
+        One process should write to a store at a time.
+        """
+        self.service = service
+        self.dimension = service.dimension
+        self.dtype = np.dtype(dtype)
+        self.path = os.path.join(directory, store_name(service.model_id, self.dimension, self.dtype))
+        self.vectors_path = os.path.join(self.path, VECTORS_FILE)
+        self.ids_path = os.path.join(self.path, IDS_FILE)
+        self.rows = 0
+        self.vectors = np.empty((0, self.dimension), dtype=self.dtype)
+        self.hits = 0
+        self.misses = 0
+        self._runs = []  # Sorted (ids, rows) pairs; merged in binary-counter fashion as they grow
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump({"model": self.service.model_id, "dimension": self.dimension, "dtype": self.dtype.name}, f)
+
+        row_bytes = self.dimension * self.dtype.itemsize
+        ids = np.fromfile(self.ids_path, dtype="int64") if os.path.exists(self.ids_path) else np.empty(0, "int64")
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        self.rows = min(len(ids), vector_rows)
+
+        # Drop a partially written tail left by an interrupted append
+        for path, size in ((self.ids_path, self.rows * 8), (self.vectors_path, self.rows * row_bytes)):
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                os.truncate(path, size)
+
+        self._remap()
+        if self.rows:
+            self._add_run(ids[:self.rows], np.arange(self.rows, dtype="int64"))
+            print(f"Opened embedding store {self.path} with {self.rows} vectors")
+
+    def _remap(self):
+        if self.rows:
+            self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self.rows, self.dimension))
+
+    def _add_run(self, ids, rows):
+        order = np.argsort(ids, kind="stable")
+        self._runs.append((ids[order], rows[order]))
+        while len(self._runs) > 1 and len(self._runs[-1][0]) >= len(self._runs[-2][0]):
+            (ids_b, rows_b), (ids_a, rows_a) = self._runs.pop(), self._runs.pop()
+            ids, rows = np.concatenate([ids_a, ids_b]), np.concatenate([rows_a, rows_b])
+            order = np.argsort(ids, kind="stable")
+            self._runs.append((ids[order], rows[order]))
+
+    def __len__(self):
+        return self.rows
+
+    def find(self, ids):
+        """Row of each ID in the vector file, or -1 when it has not been stored."""
+        ids = np.asarray(ids, dtype="int64")
+        rows = np.full(len(ids), -1, dtype="int64")
+        for run_ids, run_rows in self._runs:
+            pos = np.minimum(np.searchsorted(run_ids, ids), len(run_ids) - 1)
+            found = run_ids[pos] == ids
+            rows[found] = run_rows[pos[found]]
+        return rows
+
+    def gather(self, rows):
+        """Vectors for stored rows as float32; a view of the map when the rows are one contiguous run."""
+        if not len(rows):
+            return np.empty((0, self.dimension), dtype="float32")
+        if self.dtype == np.float32 and rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+            return self.vectors[rows[0]:rows[-1] + 1]
+        return np.asarray(self.vectors[rows], dtype="float32")
+
+    def append(self, ids, embeddings):
+        """Store vectors for IDs that are not in the store yet."""
+        with self._lock:
+            ids = np.asarray(ids, dtype="int64")
+            new = self.find(ids) < 0
+            ids, embeddings = ids[new], np.asarray(embeddings)[new]
+            if not len(ids):
+                return
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(embeddings, dtype=self.dtype).tobytes())
+            with open(self.ids_path, "ab") as f:  # Written second; rows without an ID are dropped on open
+                f.write(ids.tobytes())
+            rows = np.arange(self.rows, self.rows + len(ids), dtype="int64")
+            self.rows += len(ids)
+            self._remap()
+            self._add_run(ids, rows)
+
+    def encode(self, texts, cache=False):
+        """Same contract as EmbeddingService.encode, reading stored vectors and encoding only new texts."""
+        texts = list(texts)
+        ids = np.fromiter((query_id(text) for text in texts), dtype="int64", count=len(texts))
+        rows = self.find(ids)
+        missing = np.flatnonzero(rows < 0)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if len(missing):
+            new = {}  # ID -> first text with that ID
+            for i in missing:
+                new.setdefault(int(ids[i]), texts[i])
+            embeddings = self.service.encode(list(new.values()), cache=cache)
+            self.append(list(new), embeddings)
+            rows = self.find(ids)
+        return self.gather(rows)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "vectors": self.rows,
+            "runs": len(self._runs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+embedding_stores = {}
+_stores_lock = threading.Lock()
+
+def get_embedding_store(service):
+    """Process-wide embedding store for a model, or None when EMBEDDING_STORE_DIR is empty."""
+    if not EMBEDDING_STORE_DIR:
+        return None
+    with _stores_lock:
+        if service.model_id not in embedding_stores:
+            embedding_stores[service.model_id] = EmbeddingStore(service, EMBEDDING_STORE_DIR)
+        return embedding_stores[service.model_id]
@@ -0,0 +1,178 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")  # flat, ivf_flat, ivf_pq, hnsw or auto
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))          # 0 derives the list count from corpus size
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))           # sub-quantizers, must divide the dimension
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", "80"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))
+FAISS_NUM_SHARDS = int(os.getenv("FAISS_NUM_SHARDS", "1"))  # 1 keeps a single index
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+PQ_MIN_TRAINING = 256  # 8-bit PQ codebooks need at least 2^8 training points
+
+
+def choose_index_type(corpus_size):
+    """Pick an index type for a corpus size.
+
+    Brute force is exact and fast enough for small corpora. IVF-Flat keeps
+    full vectors and supports deletion. IVF-PQ compresses vectors so that
+    millions of them fit in memory.
+    """
+    if corpus_size < 50_000:
+        return "flat"
+    if corpus_size < 1_000_000:
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def default_nlist(corpus_size):
+    """Number of IVF lists, roughly 4 * sqrt(n) as recommended by the FAISS wiki."""
+    if FAISS_NLIST:
+        return FAISS_NLIST
+    return int(min(65536, max(16, 4 * math.sqrt(max(corpus_size, 1)))))
+
+
+def build_index(index_type, dimension, corpus_size=0, nlist=None):
+    """Create an empty FAISS index of the given type."""
+    if index_type == "auto":
+        index_type = choose_index_type(corpus_size)
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimension)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, FAISS_HNSW_M)
+        index.hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+        return index
+
+    if index_type == "ivf_pq" and 0 < corpus_size < PQ_MIN_TRAINING:
+        index_type = "ivf_flat"
+
+    # IVF variants: never ask k-means for more clusters than training points
+    nlist = nlist or default_nlist(corpus_size)
+    if corpus_size:
+        nlist = max(1, min(nlist, corpus_size))
+    quantizer = faiss.IndexFlatL2(dimension)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_L2)
+    if index_type == "ivf_pq":
+        return faiss.IndexIVFPQ(quantizer, dimension, nlist, FAISS_PQ_M, 8)
+    raise ValueError(f"Unknown FAISS index type '{index_type}', expected one of {INDEX_TYPES + ('auto',)}")
+
+
+def training_sample(embeddings, sample_size=FAISS_TRAIN_SAMPLE, seed=0):
+    """Random subset of the corpus used to train IVF centroids and PQ codebooks."""
+    if len(embeddings) <= sample_size:
+        return embeddings
+    rows = np.random.default_rng(seed).choice(len(embeddings), sample_size, replace=False)
+    return embeddings[np.sort(rows)]
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Apply query-time parameters; settings that do not apply to the index are ignored."""
+    if isinstance(index, ShardedIndex):
+        for shard in index.shards:
+            set_search_params(shard, nprobe, ef_search)
+        return
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+
+
+def add_id_map(index):
+    """Make an index addressable by stable 64-bit query IDs.
+
+    IVF indexes store IDs natively (a hash-table direct map makes removal and
+    reconstruction by ID cheap). Other types are wrapped in IndexIDMap2.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def clone_index(index):
+    if isinstance(index, ShardedIndex):
+        return ShardedIndex([faiss.clone_index(shard) for shard in index.shards])
+    return faiss.clone_index(index)
+
+
+def shard_of(ids, num_shards):
+    """Shard of each query ID: Fibonacci hashing, so sequential row IDs spread evenly too."""
+    mixed = np.asarray(ids, dtype="int64").astype("uint64") * np.uint64(0x9E3779B97F4A7C15)
+    return ((mixed >> np.uint64(32)) % np.uint64(num_shards)).astype("int64")
+
+
+class ShardedIndex:
+    def __init__(self, shards):
+        """ID-addressable sub-indexes partitioned by query ID, searched in parallel.
+
+        Implements the parts of the FAISS index interface FAISSIndex uses
+        (add_with_ids, remove_ids, reconstruct, search, train). Each search
+        runs on every shard from a thread pool (FAISS releases the GIL) and the
+        per-shard top-k lists are merged. Shards can be replaced one at a time
+        with `replace_shard`, e.g. after rebuilding one with a new type.
+        """
+        self.shards = list(shards)
+        self.d = self.shards[0].d
+        self.metric_type = self.shards[0].metric_type
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="faiss-shard")
+
+    @property
+    def ntotal(self):
+        return sum(shard.ntotal for shard in self.shards)
+
+    @property
+    def is_trained(self):
+        return all(shard.is_trained for shard in self.shards)
+
+    def train(self, x):
+        """Train the first shard and copy its (still empty) trained state to the others."""
+        self.shards[0].train(x)
+        self.shards[1:] = [faiss.clone_index(self.shards[0]) for _ in self.shards[1:]]
+
+    def _partition(self, ids):
+        shards = shard_of(ids, len(self.shards))
+        return [(shard, np.flatnonzero(shards == shard)) for shard in range(len(self.shards))]
+
+    def add_with_ids(self, x, ids):
+        x, ids = np.asarray(x, dtype="float32"), np.asarray(ids, dtype="int64")
+        for shard, rows in self._partition(ids):
+            if len(rows):
+                self.shards[shard].add_with_ids(np.ascontiguousarray(x[rows]), ids[rows])
+
+    def remove_ids(self, ids):
+        ids = np.asarray(ids, dtype="int64")
+        return sum(
+            self.shards[shard].remove_ids(ids[rows]) for shard, rows in self._partition(ids) if len(rows)
+        )
+
+    def reconstruct(self, qid):
+        return self.shards[int(shard_of([qid], len(self.shards))[0])].reconstruct(qid)
+
+    def search(self, x, k):
+        x = np.ascontiguousarray(x, dtype="float32")
+        results = list(self._executor.map(lambda shard: shard.search(x, k), self.shards))
+        distances = np.hstack([d for d, _ in results])
+        ids = np.hstack([i for _, i in results])
+
+        # Merge: best k of the shards' candidates, with empty slots (-1) last
+        larger_is_better = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        keys = -distances if larger_is_better else distances.copy()
+        keys[ids < 0] = np.inf
+        order = np.argsort(keys, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def replace_shard(self, shard, index):
+        self.shards[shard] = index
@@ -1,59 +1,860 @@
+import asyncio
+import fcntl
+import io
+import os
+import glob
+import pickle
+import shutil
+import struct
+import threading
+import time
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.postgres import get_db  
-from models.user_queries import get_all_queries  
-from database.elastic_search import QueryDatabase  
+from database.elastic_search import AsyncQueryDatabase
+from database.corpus import (
+    Progress,
+    aiter_elastic_queries,
+    aiter_postgres_queries,
+    chain_chunks,
+    count_elastic_queries,
+    count_postgres_queries,
+    encode_chunks
+)
+from database.query_store import QueryStore, query_id
+from database.embedding_store import get_embedding_store
+from models.embeddings import EMBEDDING_MODEL_NAME, get_embedding_service
+from database.faiss_indexes import (
+    FAISS_INDEX_TYPE,
+    FAISS_NPROBE,
+    FAISS_EF_SEARCH,
+    FAISS_NUM_SHARDS,
+    ShardedIndex,
+    add_id_map,
+    build_index,
+    choose_index_type,
+    clone_index,
+    FAISS_TRAIN_SAMPLE,
+    training_sample,
+    set_search_params,
+    shard_of
+)
+
+FAISS_INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "faiss_index")
+FAISS_MMAP = os.getenv("FAISS_MMAP", "false").lower() == "true"
+FAISS_COMPACTION_INTERVAL = float(os.getenv("FAISS_COMPACTION_INTERVAL", "300"))
+FAISS_QUERY_TTL = float(os.getenv("FAISS_QUERY_TTL", "0"))  # seconds, 0 keeps queries forever
+
+# Multi-process serving: one writer publishes snapshots, readers memory-map them
+FAISS_ROLE = os.getenv("FAISS_ROLE", "standalone")  # standalone, writer, reader or auto
+FAISS_PUBLISH_INTERVAL = float(os.getenv("FAISS_PUBLISH_INTERVAL", "30"))
+FAISS_RELOAD_INTERVAL = float(os.getenv("FAISS_RELOAD_INTERVAL", "2"))
+FAISS_KEEP_SNAPSHOTS = int(os.getenv("FAISS_KEEP_SNAPSHOTS", "2"))
+# An open reader spool untouched this long belongs to a reader that died before handing it over
+FAISS_SPOOL_STALE_AFTER = float(os.getenv("FAISS_SPOOL_STALE_AFTER", str(10 * FAISS_RELOAD_INTERVAL)))
+
+INDEX_FILE = "index.faiss"
+SHARD_FILE = "shard-{:03d}.faiss"
+STORE_FILE = "queries.npz"
+LEGACY_MAPPING_FILE = "id_to_text.pkl"
+CURRENT_FILE = "CURRENT"
+WRITER_LOCK_FILE = "writer.lock"
+SPOOL_DIR = "spool"
+ROLES = ("standalone", "writer", "reader", "auto")
+
+# Delta log records: op, query ID, timestamp, text length, then text and (for upserts) the vector
+RECORD_HEADER = struct.Struct("<BqdI")
+OP_UPSERT, OP_TOUCH, OP_DELETE = 1, 2, 3
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+class IndexBuilder:
+    def __init__(self, index, train_size=FAISS_TRAIN_SAMPLE):
+        """Fill a fresh index and query store from encoded chunks.
+
+        Untrained index types buffer the first `train_size` vectors, train on
+        them and then add everything, so memory stays bounded by the training
+        sample no matter how large the corpus is. Queries already added (the
+        same text from another source) are skipped.
+        """
+        self.index = index
+        self.store = QueryStore()
+        self.train_size = train_size
+        self.buffer = []  # (ids, texts, embeddings) waiting for training
+        self.buffered = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def fresh(self, texts):
+        """IDs and texts from a chunk that are not in the store yet."""
+        batch = {}
+        with self._lock:
+            for text in texts:
+                qid = query_id(text)
+                if qid not in self.store and qid not in batch:
+                    batch[qid] = text
+            self.skipped += len(texts) - len(batch)
+        return list(batch), list(batch.values())
+
+    def add(self, ids, texts, embeddings):
+        if not ids:
+            return
+        with self._lock:
+            self._add_or_buffer(ids, texts, embeddings)
+
+    def _add_or_buffer(self, ids, texts, embeddings):
+        if not self.index.is_trained:
+            self.buffer.append((ids, texts, embeddings))
+            self.buffered += len(ids)
+            if self.buffered >= self.train_size:
+                self._train()
+            return
+        self._add(ids, texts, embeddings)
+
+    def _train(self):
+        self.index.train(training_sample(np.vstack([embeddings for _, _, embeddings in self.buffer])))
+        buffer, self.buffer = self.buffer, []
+        for ids, texts, embeddings in buffer:
+            self._add(ids, texts, embeddings)
+
+    def _add(self, ids, texts, embeddings):
+        # Drop repeats that were still in flight when the chunk was filtered
+        keep = [i for i, qid in enumerate(ids) if qid not in self.store]
+        if len(keep) < len(ids):
+            self.skipped += len(ids) - len(keep)
+            ids, texts, embeddings = [ids[i] for i in keep], [texts[i] for i in keep], embeddings[keep]
+        self.index.add_with_ids(embeddings, np.asarray(ids, dtype="int64"))
+        now = time.time()
+        for qid, text in zip(ids, texts):
+            self.store.put(qid, text, now)
+
+    def finish(self):
+        with self._lock:
+            if self.buffer:
+                self._train()
+            return self.index, self.store
+
 
 class FAISSIndex:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        """Initialize FAISS index and Sentence Transformer model."""
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, index_dir=FAISS_INDEX_DIR, index_type=FAISS_INDEX_TYPE,
+                 nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH, role=FAISS_ROLE, num_shards=FAISS_NUM_SHARDS):
+        """Initialize FAISS index on top of the shared embedding service.
+
+        `index_type` is one of flat, ivf_flat, ivf_pq, hnsw or auto. Trained
+        types need a corpus, so the index starts as a flat index and switches
+        to the configured type when `build` is called. Neither the model nor
+        the index is loaded here, so a snapshot can be read while the model
+        loads elsewhere.
+
+        `role` shares one index between processes: the writer applies all
+        changes and publishes snapshots, readers memory-map the latest snapshot
+        and spool their additions for the writer. With `auto` the first
+        process to lock the index directory becomes the writer. `standalone`
+        is a single process that owns its index.
+
+        With `num_shards` > 1 new indexes are split by query ID into that many
+        sub-indexes that are searched in parallel. Snapshots keep the shard
+        count they were written with.
+        """
+        self.model_name = model_name
+        self._embedder = None
+        self._index = None
+        self.corpus_encoder = None  # Persistent embedding store for rebuilds, opened on first use
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.num_shards = max(1, num_shards)
 
         # Try to use GPU acceleration if available
         self.use_gpu = faiss.get_num_gpus() > 0
+
+        self.store = QueryStore()  # Map stable query IDs to query text
+
+        # Persistence: snapshot directories plus an append-only log of later changes
+        self.index_dir = index_dir
+        self.generation = 0       # Snapshot generation currently loaded
+        self.read_only = False    # True while the index is memory-mapped from a snapshot
+        self.delta_count = 0      # Changes logged since the last snapshot
+        self._delta_log = None
+        self._writer_lock = None
+        self._spool_file = None
+        self._spool_seq = 0
+        self._lock = threading.RLock()
+        self._stop_compaction = threading.Event()
+        self._compaction_thread = None
+        self.role = self._claim_role(role)
+
+    def _claim_role(self, role):
+        """Writers hold an exclusive lock on the index directory for as long as they run."""
+        if role not in ROLES:
+            raise ValueError(f"Unknown FAISS role {role!r}; expected one of {', '.join(ROLES)}")
+        if not self.index_dir:
+            return "standalone"
+        if role in ("standalone", "reader"):
+            return role
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        lock = open(os.path.join(self.index_dir, WRITER_LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            if role == "writer":
+                raise RuntimeError(f"Another process is already the FAISS writer for {self.index_dir}")
+            return "reader"
+        self._writer_lock = lock
+        return "writer"
+
+    @property
+    def embedder(self):
+        """Shared embedding service, loaded on first use."""
+        if self._embedder is None:
+            self._embedder = get_embedding_service(self.model_name)
+        return self._embedder
+
+    @property
+    def index(self):
+        """The FAISS index; an empty flat one until a snapshot is loaded or a build runs."""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._new_index("flat")  # Default CPU-based FAISS
+        return self._index
+
+    @index.setter
+    def index(self, index):
+        self._index = index
+
+    @property
+    def dimension(self):
+        return self._index.d if self._index is not None else self.embedder.dimension
+
+    def _to_device(self, index):
         if self.use_gpu:
-            self.index = faiss.index_cpu_to_gpu(
-                faiss.StandardGpuResources(), 0, faiss.IndexFlatL2(384)
-            )
-        else:
-            self.index = faiss.IndexFlatL2(384)  # Default CPU-based FAISS
+            return faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index)
+        return index
+
+    def _new_index(self, index_type, corpus_size=0, num_shards=None):
+        num_shards = num_shards or self.num_shards
+        if num_shards == 1:
+            return self._to_device(add_id_map(build_index(index_type, self.dimension, corpus_size)))
+        return ShardedIndex([
+            self._to_device(add_id_map(build_index(index_type, self.dimension, corpus_size // num_shards)))
+            for _ in range(num_shards)
+        ])
+
+    @property
+    def tombstones(self):
+        """Vectors still in the index whose query was deleted (index types without removal)."""
+        return max(0, self.index.ntotal - len(self.store))
+
+    async def load_queries(self, db: AsyncSession = None, elastic: AsyncQueryDatabase = None):
+        """Rebuild FAISS from every query in Elasticsearch and PostgreSQL (when given), streamed in chunks."""
+        own_elastic = elastic is None
+        elastic = elastic or AsyncQueryDatabase()
+        try:
+            corpus_size = await count_elastic_queries(elastic.es)
+            sources = [aiter_elastic_queries(elastic.es)]
+            if db is not None:
+                corpus_size += await count_postgres_queries(db)
+                sources.append(aiter_postgres_queries(db))
+            await self.build_from_chunks(chain_chunks(*sources), corpus_size)
+        finally:
+            if own_elastic:
+                await elastic.close()
+
+    def _corpus_encoder(self):
+        """Encoder for bulk corpus work: the on-disk embedding store when enabled."""
+        if self.corpus_encoder is None:
+            store = get_embedding_store(self.embedder)
+            self.corpus_encoder = self.embedder if store is None else store
+        return self.corpus_encoder
+
+    def _builder(self, corpus_size):
+        index_type = choose_index_type(corpus_size) if self.index_type == "auto" else self.index_type
+        print(f"Building FAISS {index_type} index over ~{corpus_size} queries")
+        return IndexBuilder(self._new_index(index_type, corpus_size))
+
+    def _install(self, builder):
+        if self.role == "reader":
+            raise RuntimeError("FAISS readers serve published snapshots; rebuild in the writer process")
+        index, store = builder.finish()
+        set_search_params(index, self.nprobe, self.ef_search)
+        with self._lock:
+            self.index = index
+            self.read_only = False
+            self.store = store
+            self.save_snapshot()  # A rebuild supersedes the delta log
+
+    def build(self, queries, ids=None):
+        """Rebuild the index from a full corpus, training it first when the type requires it."""
+        batch = dict(zip(ids or [query_id(q) for q in queries], queries))
+        if not batch:
+            return
+
+        builder = self._builder(len(batch))
+        texts = list(batch.values())
+        builder.add(list(batch), texts, self._corpus_encoder().encode(texts, cache=False))
+        self._install(builder)
+
+    async def build_from_chunks(self, chunks, corpus_size=0):
+        """Rebuild the index from an async iterator of query text chunks.
+
+        Reading, encoding and indexing are pipelined and only a few chunks (plus
+        the training sample for IVF types) are held in memory at once. The new
+        index replaces the live one only when the build completes. `corpus_size`
+        is an estimate used to pick the index type and the number of IVF lists.
+        """
+        builder = self._builder(corpus_size)
+        progress = Progress("FAISS build", corpus_size)
+
+        async def fresh_chunks():
+            async for texts in chunks:
+                progress.update(len(texts))
+                yield (await asyncio.to_thread(builder.fresh, texts))[1]
 
-        self.query_map = {}  # Map FAISS indices to queries
+        async for texts, embeddings in encode_chunks(fresh_chunks(), self._corpus_encoder()):
+            await asyncio.to_thread(builder.add, [query_id(t) for t in texts], texts, embeddings)
 
-    async def load_queries(self, db: AsyncSession):
-        """Load queries from PostgreSQL and Elasticsearch into FAISS."""
-        elastic = QueryDatabase()  # Lazy instantiation 
-        stored_queries = elastic.search_all_queries()  # From Elasticsearch
-        pg_queries = await get_all_queries(db)         # From PostgreSQL
+        progress.done()
+        if builder.skipped:
+            print(f"Skipped {builder.skipped} duplicate queries")
+        if len(builder.store) or builder.buffer:
+            await asyncio.to_thread(self._install, builder)
 
-        combined_queries = list(set(stored_queries + [q.query for q in pg_queries]))
-        self.add_queries(combined_queries)
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """Tune the recall/latency trade-off of IVF (nprobe) and HNSW (efSearch) indexes."""
+        self.nprobe = nprobe if nprobe is not None else self.nprobe
+        self.ef_search = ef_search if ef_search is not None else self.ef_search
+        with self._lock:
+            set_search_params(self.index, self.nprobe, self.ef_search)
+
+    def rebuild_shard(self, shard, index_type=None):
+        """Rebuild one shard of a sharded index from its stored queries, leaving the others serving.
+
+        Vectors come from the embedding store when enabled, so only queries it
+        has never seen are re-encoded. Changes made to the shard while it is
+        rebuilt are applied to the new shard before it is swapped in.
+        """
+        if not isinstance(self.index, ShardedIndex):
+            raise ValueError("rebuild_shard needs a sharded index (FAISS_NUM_SHARDS > 1)")
+        if self.role == "reader":
+            raise RuntimeError("FAISS readers serve published snapshots; rebuild in the writer process")
+
+        with self._lock:
+            num_shards = len(self.index.shards)
+            ids = self.store.ids()
+            ids = ids[shard_of(ids, num_shards) == shard]
+            texts = [self.store.get(int(qid)) for qid in ids]
+            generation, delta_count = self.generation, self.delta_count
+
+        index_type = index_type or self.index_type
+        if index_type == "auto":
+            index_type = choose_index_type(len(ids) * num_shards)
+        builder = IndexBuilder(self._new_index(index_type, len(ids), num_shards=1))
+        if len(ids):
+            builder.add(ids.tolist(), texts, self._corpus_encoder().encode(texts, cache=False))
+        index, _ = builder.finish()
+        set_search_params(index, self.nprobe, self.ef_search)
+
+        with self._lock:
+            if (self.generation, self.delta_count) != (generation, delta_count):
+                # Catch up with upserts and deletes that raced the rebuild
+                built = dict(zip(ids.tolist(), texts))
+                live = self.store.ids()
+                removed = [qid for qid, text in built.items() if self.store.get(qid) != text]
+                added = [qid for qid in live[shard_of(live, num_shards) == shard].tolist()
+                         if built.get(qid) != self.store.get(qid)]
+                if removed:
+                    try:
+                        index.remove_ids(np.asarray(removed, dtype="int64"))
+                    except RuntimeError:
+                        pass  # HNSW keeps them as tombstones, as in _remove_vectors
+                if added:
+                    current = self.index.shards[shard]
+                    index.add_with_ids(np.vstack([current.reconstruct(qid) for qid in added]),
+                                       np.asarray(added, dtype="int64"))
+            self._writable()
+            self.index.replace_shard(shard, index)
+            print(f"Rebuilt FAISS shard {shard} with {index.ntotal} vectors")
+        self.save_snapshot()
+
+    def stats(self):
+        """Index size and persistence state, without loading anything that is not loaded yet."""
+        index = self._index
+        return {
+            "vectors": index.ntotal if index is not None else 0,
+            "queries": len(self.store),
+            "shards": len(index.shards) if isinstance(index, ShardedIndex) else 1,
+            "generation": self.generation,
+            "delta_count": self.delta_count,
+        }
 
     def add_queries(self, queries):
         """Add queries to FAISS index."""
-        if not queries:
+        self.upsert_queries(queries)
+
+    def upsert_queries(self, queries, ids=None, bulk=False):
+        """Insert new queries or refresh existing ones.
+
+        IDs default to a hash of the normalized text; pass ES or Postgres row IDs
+        to key on those instead. Queries already stored with the same text only
+        have their last-seen timestamp refreshed and are not re-encoded. Bulk
+        loads read and fill the on-disk embedding store instead of the LRU cache.
+        """
+        batch = dict(zip(ids or [query_id(q) for q in queries], queries))
+        if not batch:
+            return
+
+        now = time.time()
+        with self._lock:
+            unchanged = [qid for qid, text in batch.items() if self.store.get(qid) == text]
+            if self.role == "reader":
+                self._spool(OP_TOUCH, unchanged, now)
+            else:
+                for qid in unchanged:
+                    self.store.touch(qid, now)
+                self._log(OP_TOUCH, unchanged, now)
+        unchanged = set(unchanged)
+        changed = [qid for qid in batch if qid not in unchanged]
+        if not changed:
             return
 
-        embeddings = self.model.encode(queries)
-        embeddings = np.array(embeddings).astype("float32")
+        texts = [batch[qid] for qid in changed]
+        embeddings = self._corpus_encoder().encode(texts, cache=False) if bulk else self.embedder.encode(texts)
+        with self._lock:
+            if self.role == "reader":
+                # Applied by the writer; visible here once it publishes the next snapshot
+                self._spool(OP_UPSERT, changed, now, texts, embeddings)
+                return
+            self._apply_upserts(changed, texts, embeddings, np.full(len(changed), now))
+            self._log(OP_UPSERT, changed, now, texts, embeddings)
+
+    def delete_queries(self, ids):
+        """Remove queries by ID."""
+        with self._lock:
+            if self.role == "reader":
+                ids = [qid for qid in ids if qid in self.store]
+                self._spool(OP_DELETE, ids, time.time())
+                return len(ids)
+            ids = [qid for qid in ids if self.store.remove(qid)]
+            self._remove_vectors(ids)
+            self._log(OP_DELETE, ids, time.time())
+        return len(ids)
+
+    def evict_expired(self, ttl=FAISS_QUERY_TTL):
+        """Delete queries that have not been seen for `ttl` seconds."""
+        if not ttl or self.role == "reader":
+            return 0
+        evicted = self.delete_queries(self.store.expired(time.time() - ttl).tolist())
+        if evicted:
+            print(f"Evicted {evicted} stale queries from FAISS")
+        return evicted
+
+    def _writable(self):
+        if self.read_only:
+            # Copy-on-write: the memory-mapped snapshot itself is never modified
+            self.index = clone_index(self.index)
+            set_search_params(self.index, self.nprobe, self.ef_search)
+            self.read_only = False
 
-        start_idx = len(self.query_map)
-        self.index.add(embeddings)
+    def _remove_vectors(self, ids):
+        if not ids:
+            return
+        self._writable()
+        try:
+            self.index.remove_ids(np.asarray(ids, dtype="int64"))
+        except RuntimeError:
+            pass  # e.g. HNSW: the vector stays as a tombstone until the next build
 
-        for i, query in enumerate(queries):
-            self.query_map[start_idx + i] = query  # Store query ID mapping
+    def _apply_upserts(self, ids, texts, embeddings, timestamps):
+        self._remove_vectors([qid for qid in ids if qid in self.store])
+        self._writable()
+        self.index.add_with_ids(embeddings, np.asarray(ids, dtype="int64"))
+        for qid, text, timestamp in zip(ids, texts, timestamps):
+            self.store.put(qid, text, timestamp)
 
     def search_similar_queries(self, query, top_k=5):
         """Retrieve similar queries using FAISS."""
         if self.index.ntotal == 0:
             return []  # Return empty if FAISS index is not populated
 
-        query_embedding = self.model.encode([query]).astype("float32")
-        distances, indices = self.index.search(query_embedding, top_k)
+        return self.search_by_embedding(self.embedder.encode([query]), top_k)
+
+    def search_by_embedding(self, query_embedding, top_k=5, with_embeddings=False):
+        """Retrieve similar queries for an already encoded query (a 1 x dimension matrix).
+
+        With `with_embeddings=True` returns `(texts, vectors)`, where the vectors
+        are reconstructed from the index so callers need not re-encode the texts.
+        """
+        return self.search_batch(query_embedding, top_k, with_embeddings)[0]
+
+    def search_batch(self, query_embeddings, top_k=5, with_embeddings=False):
+        """Search many encoded queries with a single multi-row index.search call.
+
+        Runs under the index lock: FAISS indexes are not safe to search while
+        another thread adds to or removes from them.
+        """
+        query_embeddings = np.asarray(query_embeddings, dtype="float32")
+        with self._lock:
+            # Held until the results are built: a reload cannot swap the pair and no upsert, delete
+            # or ingest can modify this index while it is searched and reconstructed
+            index, store = self.index, self.store
+            if index.ntotal == 0:
+                empty = ([], np.empty((0, index.d), dtype="float32")) if with_embeddings else []
+                return [empty for _ in range(len(query_embeddings))]
+
+            k = top_k * 2 if index.ntotal > len(store) else top_k
+            distances, indices = index.search(query_embeddings, k)
+
+            batch = []
+            for row in indices:
+                results, ids = [], []
+                for qid in dict.fromkeys(row.tolist()):
+                    text = store.get(qid) if qid >= 0 else None
+                    if text is not None:
+                        results.append(text)
+                        ids.append(qid)
+                results, ids = results[:top_k], ids[:top_k]
+                batch.append((results, self._reconstruct(index, ids)) if with_embeddings else results)
+            return batch
+
+    @staticmethod
+    def _reconstruct(index, ids):
+        vectors = np.empty((len(ids), index.d), dtype="float32")
+        for row, qid in enumerate(ids):
+            vectors[row] = index.reconstruct(qid)
+        return vectors
+
+    # Snapshots and delta log
+
+    def _delta_path(self, generation):
+        return os.path.join(self.index_dir, f"delta-{generation:06d}.log")
+
+    def _snapshot_dir(self):
+        """Return the directory and generation of the latest snapshot, if any."""
+        current = os.path.join(self.index_dir, CURRENT_FILE)
+        if os.path.exists(current):
+            with open(current) as f:
+                name = f.read().strip()
+            return os.path.join(self.index_dir, name), int(name.rsplit("-", 1)[1])
+        if os.path.exists(os.path.join(self.index_dir, INDEX_FILE)):
+            return self.index_dir, 0  # Layout written by scripts/populate_faiss.py
+        return None, 0
+
+    @staticmethod
+    def _pack_records(op, ids, timestamp, texts=None, embeddings=None):
+        records = []
+        for i, qid in enumerate(ids):
+            text = texts[i].encode("utf-8") if texts else b""
+            vector = np.asarray(embeddings[i], dtype="float32").tobytes() if embeddings is not None else b""
+            records.append(RECORD_HEADER.pack(op, qid, timestamp, len(text)) + text + vector)
+        return b"".join(records)
+
+    def _log(self, op, ids, timestamp, texts=None, embeddings=None):
+        if not self.index_dir or not ids:
+            return
+        if self._delta_log is None:
+            os.makedirs(self.index_dir, exist_ok=True)
+            self._delta_log = open(self._delta_path(self.generation + 1), "ab")
+
+        self._delta_log.write(self._pack_records(op, ids, timestamp, texts, embeddings))
+        self._delta_log.flush()
+        self.delta_count += len(ids)
+
+    def _spool(self, op, ids, timestamp, texts=None, embeddings=None):
+        """Reader: queue changes for the writer, in the delta log record format."""
+        if not ids:
+            return
+        if self._spool_file is None:
+            spool_dir = os.path.join(self.index_dir, SPOOL_DIR)
+            os.makedirs(spool_dir, exist_ok=True)
+            self._spool_seq += 1
+            self._spool_file = open(os.path.join(spool_dir, f"{os.getpid()}-{self._spool_seq:06d}.log"), "ab")
+        self._spool_file.write(self._pack_records(op, ids, timestamp, texts, embeddings))
+        self._spool_file.flush()
+
+    def _rotate_spool(self):
+        """Reader: hand the current spool file to the writer (only *.ready files are ingested)."""
+        with self._lock:
+            if self._spool_file is None:
+                return
+            self._spool_file.close()
+            os.replace(self._spool_file.name, self._spool_file.name[:-len(".log")] + ".ready")
+            self._spool_file = None
+
+    @staticmethod
+    def _abandoned_spools(spool_dir):
+        """Open *.log spools whose reader is gone: its pid is not running, or it stopped rotating.
+
+        They are renamed before being read, so nothing else appends to them.
+        """
+        claimed = []
+        for path in glob.glob(os.path.join(spool_dir, "*.log")):
+            try:
+                pid = int(os.path.basename(path).split("-", 1)[0])
+                stale = time.time() - os.path.getmtime(path) > FAISS_SPOOL_STALE_AFTER
+            except (ValueError, OSError):
+                continue
+            if not stale and pid_alive(pid):
+                continue
+            claimed_path = path[:-len(".log")] + ".abandoned"
+            try:
+                os.replace(path, claimed_path)
+            except OSError:
+                continue
+            claimed.append(claimed_path)
+        return claimed
+
+    def _ingest_spool(self):
+        """Writer: apply the changes readers spooled, logging them like local changes.
+
+        Spools left open by readers that died are ingested too; a truncated
+        last record from an interrupted write is skipped.
+        """
+        applied = 0
+        spool_dir = os.path.join(self.index_dir, SPOOL_DIR)
+        claimed = glob.glob(os.path.join(spool_dir, "*.ready")) + glob.glob(os.path.join(spool_dir, "*.abandoned"))
+        claimed += self._abandoned_spools(spool_dir)
+        for path in sorted(set(claimed)):
+            with open(path, "rb") as f:
+                data = f.read()
+            with self._lock:
+                applied += self._apply_records(data, log=True)
+            os.remove(path)
+        return applied
+
+    def _replay_delta(self, path):
+        """Re-apply logged changes from their stored embeddings, without re-encoding."""
+        with open(path, "rb") as f:
+            return self._apply_records(f.read())
+
+    def _apply_records(self, data, log=False):
+        """Apply delta-log formatted records; with `log=True` also append them to this process's log."""
+        vector_size = self.dimension * 4
+        upserts = ([], [], [], [])  # ids, texts, vectors, timestamps
+
+        def flush_upserts():
+            if upserts[0]:
+                embeddings = np.vstack(upserts[2])
+                self._apply_upserts(upserts[0], upserts[1], embeddings, upserts[3])
+                if log:
+                    self._log(OP_UPSERT, upserts[0], upserts[3][-1], upserts[1], embeddings)
+                for column in upserts:
+                    column.clear()
+
+        applied, offset = 0, 0
+        while offset + RECORD_HEADER.size <= len(data):
+            op, qid, timestamp, length = RECORD_HEADER.unpack_from(data, offset)
+            text_start = offset + RECORD_HEADER.size
+            end = text_start + length + (vector_size if op == OP_UPSERT else 0)
+            if end > len(data):
+                break  # Truncated trailing record from an interrupted write
+
+            if op == OP_UPSERT and log and self.store.get(qid) == data[text_start:text_start + length].decode("utf-8"):
+                op = OP_TOUCH  # Another reader already sent this query
+
+            if op == OP_UPSERT:
+                if qid in upserts[0]:
+                    flush_upserts()  # Later upsert of the same ID must replace the earlier one
+                upserts[0].append(qid)
+                upserts[1].append(data[text_start:text_start + length].decode("utf-8"))
+                upserts[2].append(np.frombuffer(data, dtype="float32", count=self.dimension, offset=text_start + length))
+                upserts[3].append(timestamp)
+            else:
+                flush_upserts()
+                if op == OP_TOUCH:
+                    self.store.touch(qid, timestamp)
+                elif self.store.remove(qid):
+                    self._remove_vectors([qid])
+                if log:
+                    self._log(op, [qid], timestamp)
+            applied += 1
+            offset = end
+
+        flush_upserts()
+        return applied
+
+    def _serialize(self, index):
+        """(file name, bytes) of each index file in a snapshot: one per shard for sharded indexes."""
+        shards = index.shards if isinstance(index, ShardedIndex) else [index]
+        data = [faiss.serialize_index(faiss.index_gpu_to_cpu(s) if self.use_gpu else s) for s in shards]
+        if not isinstance(index, ShardedIndex):
+            return [(INDEX_FILE, data[0])]
+        return [(SHARD_FILE.format(shard), d) for shard, d in enumerate(data)]
+
+    def _read_index(self, snapshot_dir, flags=0):
+        paths = sorted(glob.glob(os.path.join(snapshot_dir, SHARD_FILE.replace("{:03d}", "*"))))
+        if not paths:
+            return self._to_device(faiss.read_index(os.path.join(snapshot_dir, INDEX_FILE), flags))
+        return ShardedIndex([self._to_device(faiss.read_index(path, flags)) for path in paths])
+
+    def _load_legacy(self, snapshot_dir):
+        """Convert the positional index written by scripts/populate_faiss.py to stable IDs."""
+        index = faiss.read_index(os.path.join(snapshot_dir, INDEX_FILE))
+        with open(os.path.join(snapshot_dir, LEGACY_MAPPING_FILE), "rb") as f:
+            queries = pickle.load(f)
+        vectors = index.reconstruct_n(0, index.ntotal)
+        ids = [query_id(q) for q in queries]
+        batch = {qid: i for i, qid in enumerate(ids)}  # Drop duplicate queries
+        rows = list(batch.values())
+
+        self.index = self._new_index("flat")
+        self.store = QueryStore(capacity=len(rows))
+        self._apply_upserts(
+            list(batch), [queries[i] for i in rows], vectors[rows], np.full(len(rows), time.time())
+        )
+
+    def load_snapshot(self, mmap=FAISS_MMAP):
+        """Load the latest snapshot and replay the delta log written after it.
+
+        With `mmap=True` the index is memory-mapped read-only and is only copied
+        into memory if it is modified. Returns False if no snapshot exists.
+        """
+        if not self.index_dir:
+            return False
+        if self.role == "reader":
+            return self._load_published()
+
+        with self._lock:
+            snapshot_dir, generation = self._snapshot_dir()
+            if snapshot_dir is not None and not os.path.exists(os.path.join(snapshot_dir, STORE_FILE)):
+                self._load_legacy(snapshot_dir)
+                self.generation = generation
+            elif snapshot_dir is not None:
+                flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap and not self.use_gpu else 0
+                index = self._read_index(snapshot_dir, flags)
+                set_search_params(index, self.nprobe, self.ef_search)
+                self.index = index
+                self.read_only = bool(flags)
+                self.store = QueryStore.load(os.path.join(snapshot_dir, STORE_FILE))
+                self.generation = generation
+
+            replayed = 0
+            for path in sorted(glob.glob(os.path.join(self.index_dir, "delta-*.log"))):
+                if int(path.rsplit("-", 1)[1].split(".")[0]) > self.generation:
+                    replayed += self._replay_delta(path)
+            self.delta_count = replayed
+
+        if snapshot_dir is None and not replayed:
+            return False
+        print(f"Loaded FAISS snapshot {self.generation} with {len(self.store)} queries ({replayed} changes replayed from log)")
+        return True
+
+    def _load_published(self):
+        """Reader: memory-map the latest published snapshot and swap it in if it is new."""
+        snapshot_dir, generation = self._snapshot_dir()
+        if snapshot_dir is None or generation == self.generation:
+            return False
+        if not os.path.exists(os.path.join(snapshot_dir, STORE_FILE)):
+            return False  # Legacy layout; the writer converts it on its first snapshot
+
+        index = self._read_index(snapshot_dir, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        set_search_params(index, self.nprobe, self.ef_search)
+        store = QueryStore.load(os.path.join(snapshot_dir, STORE_FILE), mmap=True)
+        with self._lock:
+            self.index, self.store, self.generation, self.read_only = index, store, generation, True
+        print(f"Loaded published FAISS snapshot {generation} with {len(store)} queries")
+        return True
+
+    def save_snapshot(self):
+        """Write the current index as a new snapshot and drop the logs it covers."""
+        if not self.index_dir or self.role == "reader":
+            return
+
+        with self._lock:
+            generation = self.generation + 1
+            files = self._serialize(self.index)
+            store = io.BytesIO()
+            self.store.save(store)
+
+            # New changes go to the next log while the snapshot is written
+            if self._delta_log is not None:
+                self._delta_log.close()
+                self._delta_log = None
+            self.generation = generation
+            self.delta_count = 0
+
+        name = f"snapshot-{generation:06d}"
+        snapshot_dir = os.path.join(self.index_dir, name)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        for filename, data in files:
+            data.tofile(os.path.join(snapshot_dir, filename))
+        with open(os.path.join(snapshot_dir, STORE_FILE), "wb") as f:
+            f.write(store.getbuffer())
+
+        # Atomically point CURRENT at the new snapshot
+        current_tmp = os.path.join(self.index_dir, CURRENT_FILE + ".tmp")
+        with open(current_tmp, "w") as f:
+            f.write(name)
+        os.replace(current_tmp, os.path.join(self.index_dir, CURRENT_FILE))
+
+        for path in glob.glob(os.path.join(self.index_dir, "delta-*.log")):
+            if int(path.rsplit("-", 1)[1].split(".")[0]) <= generation:
+                os.remove(path)
+        # Keep the previous snapshots a little longer: readers may still be loading them
+        snapshots = sorted(glob.glob(os.path.join(self.index_dir, "snapshot-*")))
+        for path in snapshots[:-max(1, FAISS_KEEP_SNAPSHOTS)]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def start_compaction(self, interval=None):
+        """Run the background maintenance for this process's role.
+
+        Standalone and writer processes periodically evict stale queries and
+        fold the delta log into a fresh snapshot; the writer also applies what
+        readers spooled, and publishes every FAISS_PUBLISH_INTERVAL seconds.
+        Readers hand over their spool and pick up newly published snapshots.
+        """
+        if self._compaction_thread is not None:
+            return
+        if interval is None:
+            interval = {"writer": FAISS_PUBLISH_INTERVAL, "reader": FAISS_RELOAD_INTERVAL}.get(
+                self.role, FAISS_COMPACTION_INTERVAL
+            )
+
+        def run():
+            while not self._stop_compaction.wait(interval):
+                try:
+                    if self.role == "reader":
+                        self._rotate_spool()
+                        self._load_published()
+                        continue
+                    if self.role == "writer":
+                        self._ingest_spool()
+                    self.evict_expired()
+                    if self.delta_count:
+                        self.save_snapshot()
+                except Exception as e:
+                    print(f"FAISS compaction failed: {e}")
+
+        self._stop_compaction.clear()
+        self._compaction_thread = threading.Thread(target=run, name="faiss-compaction", daemon=True)
+        self._compaction_thread.start()
+
+    def stop_compaction(self):
+        if self._compaction_thread is not None:
+            self._stop_compaction.set()
+            self._compaction_thread.join()
+            self._compaction_thread = None
+        if self.role == "reader":
+            self._rotate_spool()
+        elif self.role == "writer":
+            self._ingest_spool()
 
-        return [self.query_map[idx] for idx in indices[0] if idx in self.query_map]
+faiss_index = None
+_faiss_index_lock = threading.Lock()
 
-# Initialize FAISS but defer DB loading
-faiss_index = FAISSIndex()
\ No newline at end of file
+def get_faiss_index():
+    """Process-wide FAISS index. Cheap to create; the snapshot is loaded separately."""
+    global faiss_index
+    with _faiss_index_lock:
+        if faiss_index is None:
+            faiss_index = FAISSIndex()
+        return faiss_index
@@ -2,31 +2,69 @@ import os
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-# Pull DB URL from .env 
+# Pull DB URL from .env
 DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL environment variable is not set!")
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower() == "true"  # Log every statement
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "10"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "10"))
+DATABASE_POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", "1800"))
 
-# Create Async Engine
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
-
-# Session Factory
-SessionLocal = sessionmaker(
-    class_=AsyncSession,
-    autocommit=False,
-    autoflush=False,
-    bind=engine
-)
+engine = None
+session_factory = None
 
 # Base class for models
 Base = declarative_base()
 
+def is_configured():
+    return bool(DATABASE_URL)
+
+def get_engine():
+    """Create the async engine on first use, so importing models never needs a database."""
+    global engine, session_factory
+    if engine is None:
+        if not DATABASE_URL:
+            raise RuntimeError("DATABASE_URL environment variable is not set!")
+
+        # Create Async Engine; pool limits are per worker process
+        engine = create_async_engine(
+            DATABASE_URL,
+            echo=DATABASE_ECHO,
+            pool_size=DATABASE_POOL_SIZE,
+            max_overflow=DATABASE_MAX_OVERFLOW,
+            pool_timeout=DATABASE_POOL_TIMEOUT,
+            pool_recycle=DATABASE_POOL_RECYCLE,
+            future=True
+        )
+
+        # Session Factory
+        session_factory = sessionmaker(
+            class_=AsyncSession,
+            autocommit=False,
+            autoflush=False,
+            bind=engine
+        )
+    return engine
+
+def SessionLocal():
+    """Open a new session (`async with SessionLocal() as db:`)."""
+    get_engine()
+    return session_factory()
+
 # Async Dependency for FastAPI
 async def get_db():
+    """Yield a session, or None when PostgreSQL is not configured (it is optional)."""
+    if not is_configured():
+        yield None
+        return
     async with SessionLocal() as session:
         yield session
 
-# Initialize DB 
+# Initialize DB
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+async def close_db():
+    if engine is not None:
+        await engine.dispose()
@@ -0,0 +1,131 @@
+import os
+import re
+import time
+from collections import OrderedDict
+
+PREFERENCE_CACHE_SIZE = int(os.getenv("PREFERENCE_CACHE_SIZE", "10000"))
+PREFERENCE_CACHE_TTL = float(os.getenv("PREFERENCE_CACHE_TTL", "300"))
+
+
+def preference_keywords(preferences):
+    """Keywords from stored preferences: a list of keywords, or a dict keyed by keyword."""
+    if not preferences:
+        return []
+    if isinstance(preferences, str):
+        preferences = [preferences]
+    return list(dict.fromkeys(k.strip().lower() for k in preferences if isinstance(k, str) and k.strip()))
+
+
+def trie_pattern(words):
+    """Regex for a set of words with shared prefixes factored out.
+
+    Python's regex engine tries alternatives one by one, so a flat
+    "a|b|c|..." costs time per keyword at every position; a trie-shaped
+    pattern only follows branches that match the text so far.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    # Below this many keywords, substring checks on the lowercased text are faster than the regex
+    REGEX_MIN_KEYWORDS = 64
+
+    def __init__(self, keywords):
+        """Finds which of a user's keywords occur in a text, in one pass.
+
+        Large keyword sets are compiled into a single trie-shaped regex inside
+        a lookahead, so every position reports the longest keyword starting
+        there; keywords contained in a matched keyword are credited too, which
+        gives the same answer as testing each keyword separately.
+        """
+        self.keywords = sorted(set(k.lower() for k in keywords), key=len, reverse=True)
+        self.pattern = None
+        self.contains = {}
+        if len(self.keywords) >= self.REGEX_MIN_KEYWORDS:
+            self.pattern = re.compile(f"(?=({trie_pattern(self.keywords)}))")
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def matches(self, text):
+        """Set of keywords that occur in `text` (case-insensitive)."""
+        if not self.keywords or not text:
+            return set()
+        text = text.lower()
+        if self.pattern is None:
+            return {k for k in self.keywords if k in text}
+        found = set()
+        for longest in set(self.pattern.findall(text)):
+            if longest not in self.contains:  # Filled lazily; most keywords never match
+                self.contains[longest] = {k for k in self.keywords if k in longest}
+            found |= self.contains[longest]
+        return found
+
+    def count(self, text):
+        return len(self.matches(text))
+
+
+class PreferenceCache:
+    def __init__(self, max_size=PREFERENCE_CACHE_SIZE, ttl=PREFERENCE_CACHE_TTL):
+        """Per-user compiled keyword matchers.
+
+        Entries are dropped when preferences are stored through this process
+        (see crud.store_user_preferences); the TTL bounds staleness for writes
+        made by other workers.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # user_id -> (matcher, loaded_at)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id, load):
+        """Matcher for a user, awaiting `load()` for their stored preferences on a miss."""
+        entry = self.entries.get(user_id)
+        if entry is not None and time.time() - entry[1] < self.ttl:
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        matcher = KeywordMatcher(preference_keywords(await load()))
+        self.entries[user_id] = (matcher, time.time())
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return matcher
+
+    def invalidate(self, user_id):
+        self.entries.pop(user_id, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+preference_cache = None
+
+def get_preference_cache():
+    global preference_cache
+    if preference_cache is None:
+        preference_cache = PreferenceCache()
+    return preference_cache
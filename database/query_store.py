@@ -0,0 +1,224 @@
+import hashlib
+import struct
+import zipfile
+import numpy as np
+
+MERGE_THRESHOLD = 4096  # Pending insertions before the sorted lookup arrays are rebuilt
+
+
+def normalize_query(query: str):
+    """Case- and whitespace-insensitive form used for IDs and cache keys."""
+    return " ".join(query.lower().split())
+
+
+def query_id(query: str):
+    """Stable 63-bit ID derived from the normalized query text."""
+    digest = hashlib.blake2b(normalize_query(query).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+class QueryStore:
+    def __init__(self, capacity=1024):
+        """Array-backed map from query ID to text and last-seen timestamp.
+
+        Texts live in one UTF-8 byte buffer addressed by an offsets array, so a
+        million queries cost a few arrays instead of a million Python objects.
+        Rows are append-only; removed rows are only marked dead until `compact`.
+        """
+        self._ids = np.empty(capacity, dtype="int64")
+        self._timestamps = np.empty(capacity, dtype="float64")
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._offsets = np.zeros(capacity + 1, dtype="int64")
+        self._blob = bytearray()
+        self.rows = 0
+        self.count = 0
+
+        # ID lookup: sorted arrays plus a small dict of rows added since the last merge
+        self._sorted_ids = np.empty(0, dtype="int64")
+        self._sorted_rows = np.empty(0, dtype="int64")
+        self._pending = {}
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, qid):
+        return self._row(qid) >= 0
+
+    def _grow(self, needed):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        self._ids = np.resize(self._ids, capacity)
+        self._timestamps = np.resize(self._timestamps, capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.rows] = self._alive[:self.rows]
+        self._alive = alive
+        offsets = np.zeros(capacity + 1, dtype="int64")
+        offsets[:self.rows + 1] = self._offsets[:self.rows + 1]
+        self._offsets = offsets
+
+    def _merge(self):
+        rows = np.flatnonzero(self._alive[:self.rows])
+        order = np.argsort(self._ids[rows], kind="stable")
+        self._sorted_ids = self._ids[rows][order]
+        self._sorted_rows = rows[order]
+        self._pending = {}
+
+    def _row(self, qid):
+        row = self._pending.get(qid)
+        if row is None:
+            pos = np.searchsorted(self._sorted_ids, qid)
+            if pos == len(self._sorted_ids) or self._sorted_ids[pos] != qid:
+                return -1
+            row = int(self._sorted_rows[pos])
+        return row if self._alive[row] else -1
+
+    def _text(self, row):
+        return bytes(self._blob[self._offsets[row]:self._offsets[row + 1]]).decode("utf-8")
+
+    def get(self, qid):
+        row = self._row(qid)
+        return self._text(row) if row >= 0 else None
+
+    def timestamp(self, qid):
+        row = self._row(qid)
+        return float(self._timestamps[row]) if row >= 0 else None
+
+    def put(self, qid, text, timestamp):
+        """Insert or replace the text stored under `qid`."""
+        old = self._row(qid)
+        if old >= 0:
+            if self._text(old) == text:
+                self._timestamps[old] = timestamp
+                return
+            self._alive[old] = False
+            self.count -= 1
+
+        row = self.rows
+        self._grow(row + 1)
+        encoded = text.encode("utf-8")
+        self._blob += encoded
+        self._ids[row] = qid
+        self._timestamps[row] = timestamp
+        self._alive[row] = True
+        self._offsets[row + 1] = self._offsets[row] + len(encoded)
+        self.rows += 1
+        self.count += 1
+
+        self._pending[qid] = row
+        if len(self._pending) > max(MERGE_THRESHOLD, self.count // 8):
+            self._merge()
+
+    def touch(self, qid, timestamp):
+        row = self._row(qid)
+        if row >= 0:
+            self._timestamps[row] = timestamp
+
+    def remove(self, qid):
+        row = self._row(qid)
+        if row < 0:
+            return False
+        self._alive[row] = False
+        self._pending.pop(qid, None)
+        self.count -= 1
+        return True
+
+    def expired(self, cutoff):
+        """IDs of live queries last seen before `cutoff`."""
+        rows = np.flatnonzero(self._alive[:self.rows] & (self._timestamps[:self.rows] < cutoff))
+        return self._ids[rows]
+
+    def ids(self):
+        return self._ids[:self.rows][self._alive[:self.rows]]
+
+    def items(self):
+        for row in np.flatnonzero(self._alive[:self.rows]):
+            yield int(self._ids[row]), self._text(row)
+
+    def compact(self):
+        """Drop dead rows and reclaim their text bytes."""
+        if self.count == self.rows:
+            return
+        rows = np.flatnonzero(self._alive[:self.rows])
+        starts = self._offsets[rows]
+        lengths = self._offsets[rows + 1] - starts
+        # Byte positions of every live text, gathered in one vectorized copy
+        new_starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype("int64")
+        positions = np.repeat(starts - new_starts, lengths) + np.arange(lengths.sum())
+        blob = bytearray(np.frombuffer(bytes(self._blob), dtype="uint8")[positions].tobytes())
+        self._ids = self._ids[rows].copy()
+        self._timestamps = self._timestamps[rows].copy()
+        self._alive = np.ones(len(rows), dtype=bool)
+        self._offsets = np.concatenate(([0], np.cumsum(lengths))).astype("int64")
+        self._blob = blob
+        self.rows = self.count = len(rows)
+        self._merge()
+
+    def save(self, file):
+        """Write the live rows to a path or binary file object."""
+        self.compact()
+        if self._pending:
+            self._merge()
+        np.savez(
+            file,
+            ids=self._ids[:self.rows],
+            timestamps=self._timestamps[:self.rows],
+            offsets=self._offsets[:self.rows + 1],
+            blob=np.frombuffer(bytes(self._blob), dtype="uint8"),
+            sorted_ids=self._sorted_ids,
+            sorted_rows=self._sorted_rows,
+        )
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Load a saved store.
+
+        With `mmap=True` the arrays are memory-mapped from the file instead of
+        read into memory, and the store is read-only: use it for snapshots
+        that are only searched.
+        """
+        store = cls(capacity=1)
+        if mmap:
+            data = npz_memmap(path)
+            store._ids, store._timestamps, store._offsets, store._blob = (
+                data["ids"], data["timestamps"], data["offsets"], data["blob"]
+            )
+        else:
+            with np.load(path) as npz:
+                data = {name: npz[name] for name in npz.files}
+            store._ids = data["ids"].copy()
+            store._timestamps = data["timestamps"].copy()
+            store._offsets = data["offsets"].copy()
+            store._blob = bytearray(data["blob"].tobytes())
+        store.rows = store.count = len(store._ids)
+        store._alive = np.ones(store.rows, dtype=bool)
+        if "sorted_ids" in data:
+            store._sorted_ids, store._sorted_rows = data["sorted_ids"], data["sorted_rows"]
+        else:
+            store._merge()  # Written before the lookup arrays were saved
+        return store
+
+
+def npz_memmap(path):
+    """Memory-map every array in an uncompressed .npz file (as written by np.savez)."""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: {info.filename} is compressed and cannot be memory-mapped")
+            # Local file header: 30 fixed bytes, then the file name and extra field
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if not np.prod(shape):
+                arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(
+                path, dtype=dtype, mode="r", offset=f.tell(), shape=shape, order="F" if fortran_order else "C"
+            )
+    return arrays
@@ -0,0 +1,96 @@
+import asyncio
+
+_STOP = object()
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_fn, max_batch=500, flush_interval=1.0, max_pending=10000, name="write-behind",
+                 retries=0, retry_delay=0.5):
+        """Queue writes in memory and hand them to `flush_fn` in batches.
+
+        A batch is flushed once it holds `max_batch` items or `flush_interval`
+        seconds after its first item arrived, whichever comes first. `put`
+        blocks once `max_pending` items are waiting, which pushes backpressure
+        onto producers instead of growing memory without bound. A failed flush
+        is retried `retries` times with exponential backoff from `retry_delay`
+        seconds, then the batch is dropped and counted.
+        """
+        self.flush_fn = flush_fn
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.name = name
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.flushed = 0
+        self.retried = 0
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._task = None
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, item):
+        self.start()
+        await self._queue.put(item)
+
+    async def _collect(self, first):
+        """Gather a batch starting with `first` until it is full or its window closes."""
+        loop = asyncio.get_running_loop()
+        batch = [first]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _flush(self, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                await self.flush_fn(batch)
+                self.flushed += len(batch)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"{self.name}: failed to flush {len(batch)} items: {e}")
+                    self.dropped += len(batch)
+                    return
+                print(f"{self.name}: flush failed, retrying: {e}")
+                self.retried += 1
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            batch, stopping = await self._collect(first)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    def stats(self):
+        return {"pending": self.pending, "flushed": self.flushed, "retries": self.retried, "dropped": self.dropped}
+
+    async def close(self):
+        """Flush everything still queued and stop the background task."""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(_STOP)
+        await self._task
@@ -0,0 +1,417 @@
+import asyncio
+import fcntl
+import os
+import pickle
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from contextlib import suppress
+from datetime import datetime, timedelta
+from database.corpus import Progress, aiter_elastic_docs, aiter_postgres_queries, count_elastic_queries
+from database.query_store import normalize_query, query_id
+
+AUTOCOMPLETE_TOP_K = int(os.getenv("AUTOCOMPLETE_TOP_K", "10"))
+AUTOCOMPLETE_SNAPSHOT = os.getenv("AUTOCOMPLETE_SNAPSHOT", "autocomplete/trie.pkl")
+AUTOCOMPLETE_APPLY_INTERVAL = float(os.getenv("AUTOCOMPLETE_APPLY_INTERVAL", "1"))
+AUTOCOMPLETE_MAX_PENDING = int(os.getenv("AUTOCOMPLETE_MAX_PENDING", "100000"))
+AUTOCOMPLETE_SYNC_INTERVAL = float(os.getenv("AUTOCOMPLETE_SYNC_INTERVAL", "60"))
+AUTOCOMPLETE_SNAPSHOT_INTERVAL = float(os.getenv("AUTOCOMPLETE_SNAPSHOT_INTERVAL", "300"))
+SNAPSHOT_VERSION = 2
+SYNC_OVERLAP = timedelta(seconds=60)  # Queries reach Elasticsearch after their timestamp (write-behind, refresh)
+
+
+def normalize_prefix(prefix: str):
+    """normalize_query, keeping one trailing space so "best " completes only after the whole word."""
+    normalized = normalize_query(prefix)
+    return normalized + " " if normalized and prefix[-1:].isspace() else normalized
+
+
+class _Node:
+    __slots__ = ("label", "children", "top")
+
+    def __init__(self, label, top=None):
+        self.label = label      # Edge text from the parent; chains of single children are merged into one edge
+        self.children = None    # First character of a child's label -> child, None for leaves
+        self.top = top or []    # Rows of the most popular queries in this subtree, most popular first
+
+
+class Autocomplete:
+    def __init__(self, top_k=AUTOCOMPLETE_TOP_K, max_pending=AUTOCOMPLETE_MAX_PENDING):
+        """In-memory type-ahead over normalized queries.
+
+        A path-compressed trie where every node keeps the rows of the `top_k`
+        most frequent queries below it, so a lookup is one walk down the
+        prefix and a slice, independent of corpus size. Counts only grow, so
+        keeping each node's list exact on insert needs no rescans: a query
+        can only enter a list when its own count rises. Texts and counts are
+        flat per-row arrays; nodes hold row numbers.
+
+        Lookups take no lock: writes happen on one thread at a time (under
+        `_lock`, never taken on the event loop) and only add nodes or replace
+        a node's top list, never edit one that a reader may be walking.
+        """
+        self.top_k = top_k
+        self.root = _Node("")
+        self.texts = []             # row -> query as first seen
+        self.counts = array("q")    # row -> times seen
+        self.rows = {}              # query_id -> row
+        self.nodes = 1
+        self.loaded = False
+        self.lookups = 0
+        self.memory_bytes = 0       # As of the last measure(); walking every node is too slow per scrape
+        self.synced_at = None       # Queries stored in Elasticsearch since then are not merged yet
+        self.dropped = 0            # Sightings lost because the queue was full
+        self._pending = deque(maxlen=max_pending)  # Logged queries waiting for apply_pending; oldest dropped
+        self._dirty = False         # Changed since the last snapshot
+        self._lock = threading.Lock()
+        self._snapshot_lock = None
+        self._task = None
+
+    # Writes
+
+    def add_queries(self, queries):
+        """Count one more sighting of each query; only queued, so it is safe on the event loop.
+
+        The queue is bounded: while the index is still loading (or
+        Elasticsearch is slow to answer) the oldest sightings are dropped.
+        """
+        overflow = len(self._pending) + len(queries) - self._pending.maxlen
+        if overflow > 0:
+            self.dropped += overflow
+        self._pending.extend(queries)
+
+    def apply_pending(self):
+        """Apply the queued sightings, once the index is loaded. Returns how many."""
+        if not self.loaded:
+            return 0
+        with self._lock:
+            applied = len(self._pending)
+            for _ in range(applied):
+                self._add(self._pending.popleft(), 1)
+        return applied
+
+    def add_counts(self, pairs):
+        """Add `(query, count)` pairs while building from the stored corpus."""
+        with self._lock:
+            for query, count in pairs:
+                self._add(query, count)
+
+    def merge_counts(self, pairs):
+        """Raise counts to those of `(query, count)` pairs from Elasticsearch.
+
+        The larger count wins, so merging the same documents twice changes
+        nothing, and queries other workers logged are picked up.
+        """
+        with self._lock:
+            for query, count in pairs:
+                key = normalize_query(query)
+                row = self.rows.get(query_id(key)) if key else None
+                current = 0 if row is None else self.counts[row]
+                if count > current:
+                    self._add(query, count - current)
+
+    def _add(self, query, count):
+        key = normalize_query(query)
+        if not key:
+            return
+        qid = query_id(key)
+        row = self.rows.get(qid)
+        if row is None:
+            row = self.rows[qid] = len(self.texts)
+            self.texts.append(query.strip())
+            self.counts.append(0)
+        self.counts[row] += count
+        self._dirty = True
+        self._insert(key, row)
+
+    def _insert(self, key, row):
+        node = self.root
+        self._offer(node, row)
+        rest = key
+        while rest:
+            child = node.children.get(rest[0]) if node.children else None
+            if child is None:
+                if node.children is None:
+                    node.children = {}
+                node.children[rest[0]] = _Node(rest, [row])
+                self.nodes += 1
+                return
+            label = child.label
+            common = 1
+            while common < len(label) and common < len(rest) and label[common] == rest[common]:
+                common += 1
+            if common < len(label):
+                # Split the edge; the new middle node covers exactly the old child's subtree. The child is
+                # copied under it rather than relabelled, so a concurrent lookup sees the old or the new path
+                lower = _Node(label[common:], child.top)
+                lower.children = child.children
+                middle = _Node(label[:common], child.top)
+                middle.children = {label[common]: lower}
+                node.children[rest[0]] = middle
+                self.nodes += 1
+                child = middle
+            self._offer(child, row)
+            node = child
+            rest = rest[common:]
+
+    def _offer(self, node, row):
+        """Place `row` in the node's top list; the list is replaced, not edited, for lock-free readers."""
+        top, counts = node.top, self.counts
+        if row in top:
+            position = top.index(row)
+            if position == 0 or counts[top[position - 1]] >= counts[row]:
+                return  # Still in order
+            top = top[:position] + top[position + 1:]
+        elif len(top) >= self.top_k:
+            if counts[row] <= counts[top[-1]]:
+                return
+            top = top[:-1]
+        else:
+            top = list(top)
+        count = counts[row]
+        i = len(top)
+        while i and counts[top[i - 1]] < count:
+            i -= 1
+        top.insert(i, row)
+        node.top = top
+
+    # Reads
+
+    def suggest(self, prefix: str, top_n: int = None):
+        """Most frequent stored queries starting with `prefix` (case- and whitespace-insensitive)."""
+        rest = normalize_prefix(prefix)
+        self.lookups += 1
+        node = self.root
+        while rest:
+            child = node.children.get(rest[0]) if node.children else None
+            if child is None:
+                return []
+            if rest.startswith(child.label):
+                rest = rest[len(child.label):]
+            elif child.label.startswith(rest):
+                rest = ""
+            else:
+                return []
+            node = child
+        texts = self.texts
+        return [texts[row] for row in node.top[:min(top_n or self.top_k, self.top_k)]]
+
+    def __len__(self):
+        return len(self.texts)
+
+    # Loading
+
+    async def load_corpus(self, elastic=None, db=None, index="queries"):
+        """Build from every stored query: Elasticsearch documents with their counts, then PostgreSQL logs."""
+        self.synced_at = datetime.utcnow()
+        progress = Progress("Autocomplete build", await count_elastic_queries(elastic.es, index) if elastic else None)
+        if elastic is not None:
+            async for docs in aiter_elastic_docs(elastic.es, index, ("query", "count")):
+                # Documents from before the queries mapping have no count: one per logged query
+                await asyncio.to_thread(self.add_counts, [(doc["query"], doc.get("count", 1)) for doc in docs if doc.get("query")])
+                progress.update(len(docs))
+        if db is not None:
+            async for queries in aiter_postgres_queries(db):
+                await asyncio.to_thread(self.add_counts, [(q, 1) for q in queries if query_id(q) not in self.rows])
+                progress.update(len(queries))
+        progress.done()
+        await asyncio.to_thread(self.finish_loading)
+
+    def finish_loading(self):
+        """Start serving: also called after a failed build, so logged queries stop piling up in the buffer."""
+        self.loaded = True
+        self.apply_pending()
+        self.measure()
+
+    async def sync_elastic(self, elastic, index="queries"):
+        """Merge the counts of queries Elasticsearch stored since the last sync, or all of them if none ran.
+
+        Each worker only sees its own traffic and a snapshot stops at its
+        save; Elasticsearch counts every worker's queries, so syncing keeps
+        them all converging on it.
+        """
+        started = datetime.utcnow()
+        query = None
+        if self.synced_at is not None:
+            query = {"range": {"timestamp": {"gte": (self.synced_at - SYNC_OVERLAP).isoformat()}}}
+        merged = 0
+        async for docs in aiter_elastic_docs(elastic.es, index, ("query", "count"), query=query):
+            pairs = [(doc["query"], doc.get("count", 1)) for doc in docs if doc.get("query")]
+            await asyncio.to_thread(self.merge_counts, pairs)
+            merged += len(pairs)
+        self.synced_at = started
+        return merged
+
+    def measure(self):
+        """Bytes held by the index (nodes, labels, top lists, texts, counts, ID map), from sys.getsizeof.
+
+        Runs without the lock, off the event loop; a write landing meanwhile only skews the figure.
+        """
+        texts, rows = self.texts, self.rows
+        size = sys.getsizeof(texts) + sys.getsizeof(self.counts) + sys.getsizeof(rows)
+        size += sum(map(sys.getsizeof, texts)) + sum(map(sys.getsizeof, list(rows)))
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            size += sys.getsizeof(node) + sys.getsizeof(node.label) + sys.getsizeof(node.top)
+            children = node.children
+            if children:
+                size += sys.getsizeof(children)
+                stack.extend(list(children.values()))
+        self.memory_bytes = size
+        return size
+
+    # Background maintenance
+
+    def start_maintenance(self, elastic=None, index="queries"):
+        """Apply queued sightings off the event loop, sync from Elasticsearch and save snapshots periodically.
+
+        The first sync runs right away, catching up on what was stored after
+        the snapshot. With several workers only the one holding the snapshot
+        lock saves; the others converge through the sync.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._maintain(elastic, index))
+
+    async def _maintain(self, elastic, index):
+        saver = self.claim_snapshot()
+        last_sync = last_save = time.monotonic()
+        sync_due = elastic is not None
+        while True:
+            try:
+                await asyncio.to_thread(self.apply_pending)
+                now = time.monotonic()
+                if elastic is not None and (sync_due or now - last_sync >= AUTOCOMPLETE_SYNC_INTERVAL):
+                    sync_due, last_sync = False, now
+                    await self.sync_elastic(elastic, index)
+                    await asyncio.to_thread(self.measure)
+                if saver and self._dirty and now - last_save >= AUTOCOMPLETE_SNAPSHOT_INTERVAL:
+                    last_save = now
+                    await asyncio.to_thread(self.save_snapshot)
+            except Exception as e:
+                print(f"Autocomplete maintenance failed: {e}")
+            await asyncio.sleep(AUTOCOMPLETE_APPLY_INTERVAL)
+
+    async def stop_maintenance(self):
+        """Stop the background task, apply what is still queued and save if this worker owns the snapshot."""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self.loaded:
+            await asyncio.to_thread(self.apply_pending)
+            if self.claim_snapshot():
+                await asyncio.to_thread(self.save_snapshot)
+
+    # Snapshots: nodes are written as flat preorder lists, so loading neither recurses nor re-sorts
+
+    def claim_snapshot(self, path=AUTOCOMPLETE_SNAPSHOT):
+        """Whether this process writes the snapshot: with several workers, only the one holding its lock file."""
+        if self._snapshot_lock is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            lock = open(f"{path}.lock", "a")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                return False
+            self._snapshot_lock = lock
+        return True
+
+    def save_snapshot(self, path=AUTOCOMPLETE_SNAPSHOT):
+        """Write the index to `path`; the lock is held only to copy it, not while pickling and writing.
+
+        Top lists are never edited in place, so the copy can share them.
+        """
+        with self._lock:
+            labels, tops, fanouts = [], [], []
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                labels.append(node.label)
+                tops.append(node.top)
+                fanouts.append(len(node.children) if node.children else 0)
+                if node.children:
+                    stack.extend(node.children.values())
+            state = {
+                "version": SNAPSHOT_VERSION,
+                "top_k": self.top_k,
+                "texts": self.texts[:],
+                "counts": array("q", self.counts),
+                "ids": list(self.rows),
+                "labels": labels,
+                "tops": tops,
+                "fanouts": fanouts,
+                "synced_at": self.synced_at,
+            }
+            self._dirty = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load_snapshot(self, path=AUTOCOMPLETE_SNAPSHOT):
+        """Restore a saved index; False when there is none or it cannot serve `top_k` suggestions."""
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Error loading autocomplete snapshot: {e}")
+            return False
+        if state.get("version") != SNAPSHOT_VERSION or state["top_k"] < self.top_k:
+            print("Autocomplete snapshot is outdated; rebuilding")
+            return False
+
+        nodes = [_Node(label, top) for label, top in zip(state["labels"], state["tops"])]
+        open_nodes = [[nodes[0], state["fanouts"][0]]]  # Nodes still missing children, with how many
+        for node, fanout in zip(nodes[1:], state["fanouts"][1:]):
+            while open_nodes[-1][1] == 0:
+                open_nodes.pop()
+            parent = open_nodes[-1]
+            parent[1] -= 1
+            if parent[0].children is None:
+                parent[0].children = {}
+            parent[0].children[node.label[0]] = node
+            if fanout:
+                open_nodes.append([node, fanout])
+
+        with self._lock:
+            self.top_k = state["top_k"]
+            self.root = nodes[0]
+            self.texts = state["texts"]
+            self.counts = state["counts"]
+            self.rows = dict(zip(state["ids"], range(len(state["ids"]))))
+            self.nodes = len(nodes)
+            self.synced_at = state["synced_at"]
+        self.finish_loading()
+        return True
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "queries": len(self.texts),
+            "nodes": self.nodes,
+            "memory_bytes": self.memory_bytes,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "lookups": self.lookups,
+        }
+
+
+autocomplete = None
+
+def get_autocomplete():
+    global autocomplete
+    if autocomplete is None:
+        autocomplete = Autocomplete()
+    return autocomplete
@@ -0,0 +1,48 @@
+import os
+import numpy as np
+
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+DEDUP_BLOCK_SIZE = int(os.getenv("DEDUP_BLOCK_SIZE", "64"))
+
+
+def normalize_rows(embeddings):
+    """Scale rows to unit length so dot products are cosine similarities."""
+    embeddings = np.asarray(embeddings, dtype="float32")
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def select_diverse(embeddings, threshold=DEDUP_THRESHOLD, limit=None, block_size=DEDUP_BLOCK_SIZE):
+    """Greedy semantic de-duplication over candidate embeddings.
+
+    Walks candidates in order and keeps each one whose cosine similarity to
+    every previously kept candidate is below `threshold`. Candidates are taken
+    `block_size` at a time: one matrix product drops those too close to a
+    candidate kept in earlier blocks, and the greedy pass over the rest only
+    compares them within the block. Stops as soon as `limit` candidates are
+    kept. Returns the kept row indices.
+    """
+    vectors = normalize_rows(embeddings)
+    n = len(vectors)
+    limit = n if limit is None else min(limit, n)
+
+    kept = []
+    kept_vectors = np.empty((limit, vectors.shape[1]), dtype="float32")
+    for start in range(0, n, block_size):
+        if len(kept) >= limit:
+            break
+        block = vectors[start:start + block_size]
+        alive = np.ones(len(block), dtype=bool)
+        if kept:
+            alive = (block @ kept_vectors[:len(kept)].T).max(axis=1) < threshold
+        similarities = block @ block.T
+        block_kept = []
+        for row in np.flatnonzero(alive).tolist():
+            if block_kept and similarities[row, block_kept].max() >= threshold:
+                continue
+            block_kept.append(row)
+            kept_vectors[len(kept)] = block[row]
+            kept.append(start + row)
+            if len(kept) >= limit:
+                break
+    return kept
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from database.query_store import normalize_query
+from telemetry.metrics import BATCH_SIZE
+
+EMBEDDING_MODEL_NAME = os.getenv("FAISS_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+EMBEDDING_MAX_QUEUE = int(os.getenv("EMBEDDING_MAX_QUEUE", "2048"))
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")   # torch, onnx or int8
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")    # e.g. onnx/model_qint8_avx512.onnx
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 keeps the library default
+
+BACKENDS = ("torch", "onnx", "int8")
+
+
+class EmbeddingOverloaded(RuntimeError):
+    """Raised when the encode queue is too deep to accept more work."""
+
+
+def load_model(model_name, backend=EMBEDDING_BACKEND, threads=EMBEDDING_THREADS, onnx_file=EMBEDDING_ONNX_FILE):
+    """Load the sentence embedding model on the selected inference backend.
+
+    - torch: the PyTorch model as published (fp32).
+    - onnx: ONNX Runtime on CPU; needs `optimum[onnxruntime]`. `onnx_file`
+      picks a specific export, such as one of the quantized files on the hub.
+    - int8: PyTorch with Linear layers dynamically quantized to int8 on CPU.
+
+    `threads` caps intra-op threads so several workers on one host do not
+    oversubscribe its cores; set it to roughly cores / workers.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+    # Imported here: pulling in sentence-transformers (and torch) takes seconds
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if onnx_file:
+            model_kwargs["file_name"] = onnx_file
+        if threads:
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+            model_kwargs["session_options"] = options
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+    if backend == "int8":
+        model = SentenceTransformer(model_name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return SentenceTransformer(model_name)
+
+
+def model_id(model_name, backend=EMBEDDING_BACKEND, onnx_file=EMBEDDING_ONNX_FILE):
+    """Name for the vectors a model/backend pair produces; backends drift slightly, so they are kept apart."""
+    if backend == "torch":
+        return model_name
+    if backend == "onnx" and onnx_file:
+        return f"{model_name}-onnx-{os.path.splitext(os.path.basename(onnx_file))[0]}"
+    return f"{model_name}-{backend}"
+
+
+class EmbeddingService:
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, cache_size=EMBEDDING_CACHE_SIZE, backend=EMBEDDING_BACKEND,
+                 threads=EMBEDDING_THREADS, onnx_file=EMBEDDING_ONNX_FILE):
+        """Sentence embedding model with a bounded LRU cache keyed on normalized text."""
+        self.model_name = model_name
+        self.backend = backend
+        self.model_id = model_id(model_name, backend, onnx_file)
+        self.model = load_model(model_name, backend, threads, onnx_file)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _encode(self, texts):
+        return np.asarray(self.model.encode(texts), dtype="float32").reshape(len(texts), self.dimension)
+
+    def encode(self, texts, cache=True):
+        """Embed a list of texts as a float32 matrix, one row per text.
+
+        Pass `cache=False` for bulk corpus encodes and long documents, which
+        would only evict the short, frequently repeated strings the cache is for.
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype="float32")
+        if not cache or not self.cache_size:
+            return self._encode(list(texts))
+
+        keys = [normalize_query(text) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key not in found and key in self.cache:
+                    self.cache.move_to_end(key)
+                    found[key] = self.cache[key]
+            missing = list(dict.fromkeys(key for key in keys if key not in found))
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            for key, embedding in zip(missing, self._encode(missing)):
+                found[key] = embedding.copy()  # A view would keep its whole batch alive in the cache
+            with self._lock:
+                for key in missing:
+                    self.cache[key] = found[key]
+                    self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+        return np.vstack([found[key] for key in keys])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_id,
+            "cache_size": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class EmbeddingBatcher:
+    def __init__(self, service, max_wait_ms=EMBEDDING_BATCH_WAIT_MS, max_batch=EMBEDDING_MAX_BATCH,
+                 max_queue=EMBEDDING_MAX_QUEUE):
+        """Coalesce concurrent encode calls into batched forward passes.
+
+        Requests are gathered for up to `max_wait_ms` or until `max_batch` texts
+        are waiting, then encoded together on a dedicated thread. Once more than
+        `max_queue` texts are waiting, new requests are rejected with
+        EmbeddingOverloaded instead of queueing without bound.
+        """
+        self.service = service
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._requests = deque()  # (texts, cache, future)
+        self._queued_texts = 0
+        self._wakeup = None
+        self._task = None
+        self.batches = 0
+        self.batched_texts = 0
+        self.shed = 0
+
+    @property
+    def queue_depth(self):
+        return self._queued_texts
+
+    async def encode(self, texts, cache=True):
+        """Embed texts as part of the next batch; same contract as EmbeddingService.encode."""
+        texts = list(texts)
+        if not texts:
+            return self.service.encode(texts)
+        if self._queued_texts + len(texts) > self.max_queue:
+            self.shed += 1
+            raise EmbeddingOverloaded(f"{self._queued_texts} texts already waiting to be encoded")
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._requests.append((texts, cache, future))
+        self._queued_texts += len(texts)
+        self._wakeup.set()
+        return await future
+
+    def _take_batch(self):
+        batch, size = [], 0
+        while self._requests and (not batch or size + len(self._requests[0][0]) <= self.max_batch):
+            request = self._requests.popleft()
+            batch.append(request)
+            size += len(request[0])
+        self._queued_texts -= size
+        return batch
+
+    def _encode_batch(self, batch):
+        """One forward pass per cache mode; returns each request's rows in order."""
+        results = [None] * len(batch)
+        for cache in (True, False):
+            members = [i for i, (_, c, _) in enumerate(batch) if c == cache]
+            if not members:
+                continue
+            embeddings = self.service.encode([t for i in members for t in batch[i][0]], cache=cache)
+            start = 0
+            for i in members:
+                end = start + len(batch[i][0])
+                results[i] = embeddings[start:end]
+                start = end
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._requests:
+                continue
+
+            deadline = loop.time() + self.max_wait
+            while self._queued_texts < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self._wakeup.clear()
+
+            batch = self._take_batch()
+            try:
+                results = await loop.run_in_executor(self._executor, self._encode_batch, batch)
+                size = sum(len(texts) for texts, _, _ in batch)
+                self.batches += 1
+                self.batched_texts += size
+                BATCH_SIZE.observe(size)
+                for (_, _, future), rows in zip(batch, results):
+                    if not future.done():
+                        future.set_result(rows)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            if self._requests:
+                self._wakeup.set()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "batched_texts": self.batched_texts,
+            "mean_batch_size": round(self.batched_texts / self.batches, 2) if self.batches else 0.0,
+            "queue_depth": self._queued_texts,
+            "shed": self.shed,
+        }
+
+
+embedding_services = {}
+embedding_batchers = {}
+_services_lock = threading.Lock()
+
+def get_embedding_service(model_name=EMBEDDING_MODEL_NAME):
+    """Process-wide embedding service, so each model is loaded once per worker."""
+    with _services_lock:
+        if model_name not in embedding_services:
+            embedding_services[model_name] = EmbeddingService(model_name)
+        return embedding_services[model_name]
+
+def get_embedding_batcher(model_name=EMBEDDING_MODEL_NAME):
+    """Process-wide batcher in front of the shared embedding service."""
+    if model_name not in embedding_batchers:
+        embedding_batchers[model_name] = EmbeddingBatcher(get_embedding_service(model_name))
+    return embedding_batchers[model_name]
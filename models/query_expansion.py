@@ -1,71 +1,266 @@
-from sentence_transformers import SentenceTransformer
 from search_engines.fetch_queries import (
-    get_query_db,
+    get_async_query_db,
+    fetch_faiss_queries,
+    fetch_elastic_queries,
     fetch_google_results,
     fetch_duckduckgo_results
 )
-from database.faiss_store import faiss_index
+from search_engines.fan_out import fan_out
+from database.faiss_store import get_faiss_index
+from database.write_behind import WriteBehindBuffer
+from database.elastic_search import document_doc
+from models.autocomplete import get_autocomplete
+from models.user_queries import log_user_query
+from database.postgres import is_configured
+from database import crud
+from models.embeddings import EMBEDDING_MODEL_NAME, EmbeddingOverloaded, get_embedding_batcher
+from models.dedup import DEDUP_THRESHOLD, normalize_rows, select_diverse
+from models.semantic_cache import SemanticCache
+from models.ranking import RRF_K, reciprocal_rank_fusion
+from telemetry.metrics import STAGE_ERRORS, stage
 from sqlalchemy.ext.asyncio import AsyncSession
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+import asyncio
+import os
+
+EXPAND_BATCH_CONCURRENCY = int(os.getenv("EXPAND_BATCH_CONCURRENCY", "16"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+HYBRID_NUM_CANDIDATES = int(os.getenv("HYBRID_NUM_CANDIDATES", "200"))
+HYBRID_RERANK_WEIGHT = float(os.getenv("HYBRID_RERANK_WEIGHT", "1.0"))
+FAISS_ADD_BATCH_SIZE = int(os.getenv("FAISS_ADD_BATCH_SIZE", "500"))
+FAISS_ADD_FLUSH_INTERVAL = float(os.getenv("FAISS_ADD_FLUSH_INTERVAL", "1.0"))
+FAISS_ADD_MAX_PENDING = int(os.getenv("FAISS_ADD_MAX_PENDING", "10000"))
+
+faiss_log = None
+
+def get_faiss_log():
+    """Write-behind buffer of logged queries for the FAISS index, created on first use."""
+    global faiss_log
+    if faiss_log is None:
+        faiss_log = WriteBehindBuffer(
+            flush_faiss_adds,
+            max_batch=FAISS_ADD_BATCH_SIZE,
+            flush_interval=FAISS_ADD_FLUSH_INTERVAL,
+            max_pending=FAISS_ADD_MAX_PENDING,
+            name="FAISS adds"
+        )
+    return faiss_log
+
+async def flush_faiss_adds(queries):
+    """Add a batch with one encode and one index update, off the event loop."""
+    with stage("faiss_add"):
+        await asyncio.to_thread(get_faiss_index().add_queries, list(dict.fromkeys(queries)))
+
+async def close_faiss_log():
+    """Add queued queries; call before FAISS compaction stops."""
+    if faiss_log is not None:
+        await faiss_log.close()
+
+async def _ready(results):
+    return results
 
 class QueryExpander:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        """Initialize the Query Expander using SentenceTransformer, ElasticSearch, FAISS."""
-        self.model = SentenceTransformer(model_name)
-        self.db = get_query_db()
-        self.query_database = self.db.search_all_queries()
-
-    def filter_duplicate_queries(self, query_list):
-        """Remove semantically similar queries."""
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME):
+        """Initialize the Query Expander using the shared embedding service, ElasticSearch, FAISS."""
+        self.embedder = get_embedding_batcher(model_name)
+        self.semantic_cache = SemanticCache(self.embedder.service.dimension)
+        self.async_db = get_async_query_db()
+
+    async def filter_duplicate_queries(self, query_list, threshold=DEDUP_THRESHOLD, limit=None, known_embeddings=None):
+        """Remove semantically similar queries.
+
+        `known_embeddings` maps candidate text to an embedding a retrieval source
+        already produced; only the remaining candidates are encoded.
+        """
         if not query_list:
             return []
 
-        embeddings = self.model.encode(query_list)
-        similarity_matrix = cosine_similarity(embeddings)
+        known_embeddings = known_embeddings or {}
+        missing = [q for q in query_list if q not in known_embeddings]
+        encoded = dict(zip(missing, await self.embedder.encode(missing))) if missing else {}
+        embeddings = np.vstack([known_embeddings.get(q, encoded.get(q)) for q in query_list])
+
+        return [query_list[i] for i in select_diverse(embeddings, threshold, limit)]
+
+    async def _merge_sources(self, results, sources, num_return_seq):
+        """Combine per-source candidates into the de-duplicated expansion response."""
+        # Reuse the vectors FAISS already holds instead of re-encoding its hits
+        faiss_embeddings = dict(results["faiss"])
+        results["faiss"] = list(faiss_embeddings)
+
+        # Keep source priority order while dropping exact duplicates
+        all_queries = list(dict.fromkeys(q for source in results.values() for q in source if q))
+        with stage("dedup"):
+            filtered_queries = await self.filter_duplicate_queries(
+                all_queries, limit=num_return_seq, known_embeddings=faiss_embeddings
+            )
+        filtered_queries = [str(q) for q in filtered_queries]
 
-        unique_queries = []
-        for i, query in enumerate(query_list):
-            if all(similarity_matrix[i][j] < 0.85 for j in range(i)):
-                unique_queries.append(query)
+        return {"expanded_queries": filtered_queries[:num_return_seq], "sources": sources}
 
-        return unique_queries
+    async def _log_query(self, query, user_id=None):
+        with stage("store_query"):
+            await self.async_db.store_query(query)
+            if user_id is not None and is_configured():
+                await log_user_query(user_id, query)
+        get_autocomplete().add_queries([query])
+        await get_faiss_log().put(query)
 
     async def expand_query(self, query, user_id=None, num_return_seq=5, db: AsyncSession = None):
         """Expand a user query using FAISS, ElasticSearch and live suggestions."""
         try:
-            faiss_queries = faiss_index.search_similar_queries(query, num_return_seq)
-            elastic_queries = self.db.search_similar_queries(query, num_return_seq)
-            google_queries = fetch_google_results(query)
-            duckduckgo_queries = fetch_duckduckgo_results(query)
+            with stage("embed"):
+                query_embedding = await self.embedder.encode([query])
+            with stage("semantic_cache"):
+                cached = self.semantic_cache.lookup(query_embedding, num_return_seq)
+            if cached:
+                matched_query, similarity, response = cached
+                await self._log_query(query, user_id)
+                return {
+                    **response,
+                    "expanded_queries": response["expanded_queries"][:num_return_seq],
+                    "cache": {"query": matched_query, "similarity": round(similarity, 4)}
+                }
 
-            all_queries = list(set(faiss_queries + elastic_queries + google_queries + duckduckgo_queries))
-            filtered_queries = self.filter_duplicate_queries(all_queries)
-            filtered_queries = [str(q) for q in filtered_queries]
+            results, sources = await fan_out({
+                "faiss": lambda: fetch_faiss_queries(
+                    query, num_return_seq, with_embeddings=True, query_embedding=query_embedding
+                ),
+                "elastic": lambda: fetch_elastic_queries(query, num_return_seq),
+                "google": lambda: fetch_google_results(query),
+                "duckduckgo": lambda: fetch_duckduckgo_results(query),
+            })
 
-            if db:
-                self.db.store_query(query, db.sync_session)
+            expansion = await self._merge_sources(results, sources, num_return_seq)
 
-            return {"expanded_queries": filtered_queries[:num_return_seq]}
+            # Partial answers (a source timed out or failed) are not worth repeating
+            if all(source["status"] == "ok" for source in sources.values()):
+                self.semantic_cache.store(query, query_embedding, num_return_seq, expansion)
 
+            await self._log_query(query, user_id)
+            return expansion
+
+        except EmbeddingOverloaded:
+            raise  # Surfaced as 503 so clients back off
         except Exception as e:
             print(f"Error expanding query: {e}")
+            STAGE_ERRORS.inc("expand_query")
             return {"error": str(e)}
 
-    async def re_rank_results(self, query, search_results, user_id=None, db: AsyncSession = None):
+    async def expand_queries(self, queries, num_return_seq=5, log=False):
+        """Expand many queries at once and return an async iterator of results.
+
+        All queries are embedded in one model pass, searched in FAISS with one
+        multi-row search and looked up in ElasticSearch with one _msearch. The
+        external providers and de-duplication then run per query, and each
+        result is yielded as soon as it is ready (not in input order).
+
+        Batches are usually offline enrichment or cache warming, so the queries
+        are only logged (raising their popularity) with `log=True`.
+        """
+        embeddings = await self.embedder.encode(queries)
+        faiss_results, elastic_results = await asyncio.gather(
+            asyncio.to_thread(get_faiss_index().search_batch, embeddings, num_return_seq, True),
+            self.async_db.msearch_similar_queries(queries, num_return_seq)
+        )
+
+        if log:
+            await self.async_db.store_queries(queries)
+            get_autocomplete().add_queries(queries)
+            for query in queries:
+                await get_faiss_log().put(query)
+
+        return self._stream_expansions(queries, faiss_results, elastic_results, num_return_seq)
+
+    async def _stream_expansions(self, queries, faiss_results, elastic_results, num_return_seq):
+        semaphore = asyncio.Semaphore(EXPAND_BATCH_CONCURRENCY)
+
+        async def expand_one(i, query):
+            async with semaphore:
+                try:
+                    results, sources = await fan_out({
+                        "faiss": lambda: _ready(list(zip(*faiss_results[i]))),
+                        "elastic": lambda: _ready(elastic_results[i]),
+                        "google": lambda: fetch_google_results(query),
+                        "duckduckgo": lambda: fetch_duckduckgo_results(query),
+                    })
+                    return {"query": query, **await self._merge_sources(results, sources, num_return_seq)}
+                except Exception as e:
+                    print(f"Error expanding query: {e}")
+                    return {"query": query, "error": str(e)}
+
+        tasks = [asyncio.create_task(expand_one(i, query)) for i, query in enumerate(queries)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()  # Client went away; stop remaining lookups
+
+    async def re_rank_results(self, query, search_results, user_id=None, db: AsyncSession = None, query_embedding=None):
         """Re-rank search results based on semantic similarity and user preferences."""
-        query_embedding = self.model.encode([query])
-        doc_embeddings = self.model.encode([doc["content"] for doc in search_results])
-        similarities = cosine_similarity(query_embedding, doc_embeddings)[0]
+        if not search_results:
+            return []
+        await self._semantic_scores(query, search_results, user_id, db, query_embedding)
+        return sorted(search_results, key=lambda x: x["score"] + x["semantic_score"], reverse=True)
+
+    async def _semantic_scores(self, query, search_results, user_id=None, db: AsyncSession = None, query_embedding=None):
+        """Set each result's "semantic_score": cosine to the query plus the user's preference bonus.
+
+        Documents carrying a stored "embedding" are scored against it; only
+        documents indexed without one are encoded here.
+        """
+        with stage("rerank_encode"):
+            if query_embedding is None:
+                query_embedding = await self.embedder.encode([query])
+            missing = [i for i, doc in enumerate(search_results) if doc.get("embedding") is None]
+            if missing:
+                encoded = await self.embedder.encode([search_results[i]["content"] for i in missing], cache=False)
+                for i, embedding in zip(missing, encoded):
+                    search_results[i]["embedding"] = embedding
 
-        for i, doc in enumerate(search_results):
-            doc["semantic_score"] = float(similarities[i])
+        with stage("rerank_score"):
+            doc_embeddings = normalize_rows([doc.pop("embedding") for doc in search_results])
+            similarities = doc_embeddings @ normalize_rows(query_embedding)[0]
+            for i, doc in enumerate(search_results):
+                doc["semantic_score"] = float(similarities[i])
 
         if user_id and db:
-            user_prefs = self.db.get_user_preferences(user_id, db.sync_session)
-            for doc in search_results:
-                for keyword in user_prefs:
-                    if keyword.lower() in doc["content"].lower():
-                        doc["semantic_score"] += 0.2
+            with stage("personalize"):
+                matcher = await crud.get_preference_matcher(db, user_id)
+                if matcher:
+                    for doc in search_results:
+                        doc["semantic_score"] += 0.2 * matcher.count(doc["content"])
+
+    async def hybrid_search(self, query, top_n=10, user_id=None, db: AsyncSession = None):
+        """Search documents with BM25 and kNN, fuse with RRF and re-rank on stored vectors.
+
+        RRF scores and cosines are on different scales, so the re-ranking is
+        fused as a third ranking, weighted by HYBRID_RERANK_WEIGHT, rather
+        than added to the RRF score.
+        """
+        with stage("embed"):
+            query_embedding = await self.embedder.encode([query])
+        with stage("retrieve"):
+            bm25_hits, knn_hits = await self.async_db.hybrid_documents(
+                query, query_embedding[0], HYBRID_CANDIDATES, HYBRID_NUM_CANDIDATES
+            )
+        candidates = reciprocal_rank_fusion([bm25_hits, knn_hits])[:HYBRID_CANDIDATES]
+        if not candidates:
+            return []
+        await self._semantic_scores(query, candidates, user_id, db, query_embedding=query_embedding)
+        by_semantic = sorted(candidates, key=lambda doc: doc["semantic_score"], reverse=True)
+        for rank, doc in enumerate(by_semantic, start=1):
+            doc["score"] = doc.pop("rrf_score") + HYBRID_RERANK_WEIGHT / (RRF_K + rank)
+        return sorted(candidates, key=lambda doc: doc["score"], reverse=True)[:top_n]
 
-        return sorted(search_results, key=lambda x: x["score"] + x["semantic_score"], reverse=True)
\ No newline at end of file
+    async def index_documents(self, documents):
+        """Embed documents once at ingest and store the vectors alongside them."""
+        if not documents:
+            return 0
+        embeddings = await self.embedder.encode([doc["content"] for doc in documents], cache=False)
+        await self.async_db.index_documents([
+            document_doc(doc.get("title", ""), doc["content"], embedding)
+            for doc, embedding in zip(documents, embeddings)
+        ])
+        return len(documents)
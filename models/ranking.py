@@ -0,0 +1,20 @@
+import os
+
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, key=lambda doc: doc["id"]):
+    """Merge ranked result lists by summing 1 / (k + rank) for each document.
+
+    Only ranks are used, so BM25 and vector scores need no calibration against
+    each other. The first copy of each document seen is kept, with the fused
+    score stored under "rrf_score". Returns documents by descending score.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            doc_key = key(doc)
+            if doc_key not in fused:
+                fused[doc_key] = {**doc, "rrf_score": 0.0}
+            fused[doc_key]["rrf_score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda doc: doc["rrf_score"], reverse=True)
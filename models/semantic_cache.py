@@ -0,0 +1,70 @@
+import os
+import time
+import numpy as np
+from models.dedup import normalize_rows
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "5000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "600"))
+
+
+class SemanticCache:
+    def __init__(self, dimension, threshold=SEMANTIC_CACHE_THRESHOLD, max_size=SEMANTIC_CACHE_SIZE,
+                 ttl=SEMANTIC_CACHE_TTL):
+        """Serve expansions of near-paraphrases of recently answered queries.
+
+        Recent query embeddings are kept in a fixed-size ring of unit vectors;
+        one matrix-vector product finds the closest one. A lookup hits when its
+        cosine similarity reaches `threshold`, the entry is younger than `ttl`,
+        and the entry holds at least as many expansions as requested. The
+        oldest entry is overwritten once `max_size` is reached; a `max_size`
+        of 0 turns the cache off.
+        """
+        self.threshold = threshold
+        self.max_size = max_size = max(max_size, 0)
+        self.ttl = ttl
+        self.vectors = np.zeros((max_size, dimension), dtype="float32")
+        self.expires_at = np.zeros(max_size, dtype="float64")
+        self.capacity = np.zeros(max_size, dtype="int32")  # num_return_seq each entry was computed for
+        self.entries = [None] * max_size                   # (query, response)
+        self.next_slot = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, embedding, num_return_seq):
+        """Return `(matched_query, similarity, response)` for a close enough entry, or None."""
+        if not self.max_size:
+            return None
+        if self.size:
+            query_vector = normalize_rows(np.reshape(embedding, (1, -1)))[0]
+            similarities = self.vectors[:self.size] @ query_vector
+            usable = (self.expires_at[:self.size] > time.time()) & (self.capacity[:self.size] >= num_return_seq)
+            similarities[~usable] = -1.0
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                self.hits += 1
+                query, response = self.entries[best]
+                return query, float(similarities[best]), response
+        self.misses += 1
+        return None
+
+    def store(self, query, embedding, num_return_seq, response):
+        if not self.max_size:
+            return
+        slot = self.next_slot
+        self.vectors[slot] = normalize_rows(np.reshape(embedding, (1, -1)))[0]
+        self.expires_at[slot] = time.time() + self.ttl
+        self.capacity[slot] = num_return_seq
+        self.entries[slot] = (query, response)
+        self.next_slot = (slot + 1) % self.max_size
+        self.size = min(self.size + 1, self.max_size)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
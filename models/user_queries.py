@@ -1,10 +1,67 @@
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from database.models import QueryLogs
+from database.models import QueryLogs, User
+from database.corpus import aiter_postgres_queries
+from database.postgres import SessionLocal
+from database.write_behind import WriteBehindBuffer
 from datetime import datetime
+import os
+
+QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", "500"))
+QUERY_LOG_FLUSH_INTERVAL = float(os.getenv("QUERY_LOG_FLUSH_INTERVAL", "1.0"))
+QUERY_LOG_MAX_PENDING = int(os.getenv("QUERY_LOG_MAX_PENDING", "10000"))
+QUERY_LOG_RETRIES = int(os.getenv("QUERY_LOG_RETRIES", "3"))
+
+query_log = None
+
+def get_query_log():
+    """Write-behind buffer for QueryLogs rows, created on first use."""
+    global query_log
+    if query_log is None:
+        query_log = WriteBehindBuffer(
+            flush_query_logs,
+            max_batch=QUERY_LOG_BATCH_SIZE,
+            flush_interval=QUERY_LOG_FLUSH_INTERVAL,
+            max_pending=QUERY_LOG_MAX_PENDING,
+            name="PostgreSQL query log",
+            retries=QUERY_LOG_RETRIES
+        )
+    return query_log
+
+async def log_user_query(user_id: int, query: str):
+    """Queue a query for the user's history; waits only when the buffer is full"""
+    await get_query_log().put({"user_id": user_id, "query": query, "timestamp": datetime.utcnow()})
+
+async def flush_query_logs(rows):
+    """Insert a batch with one multi-row INSERT in one transaction.
+
+    Raising lets the buffer retry, so a batch whose commit succeeded but was
+    not acknowledged can be written twice; that is acceptable for a log.
+    """
+    async with SessionLocal() as db:
+        try:
+            await db.execute(insert(QueryLogs).values(rows))
+            await db.commit()
+        except IntegrityError:
+            # Rows for unknown or deleted users would fail every retry; keep the others
+            await db.rollback()
+            user_ids = {row["user_id"] for row in rows}
+            known = set((await db.execute(select(User.id).where(User.id.in_(user_ids)))).scalars())
+            kept = [row for row in rows if row["user_id"] in known]
+            print(f"Dropped {len(rows) - len(kept)} query logs for unknown users")
+            if kept:
+                await db.execute(insert(QueryLogs).values(kept))
+                await db.commit()
+
+async def close_query_log():
+    """Flush queued query logs; call before the engine is disposed."""
+    if query_log is not None:
+        await query_log.close()
 
 async def store_user_query(db: AsyncSession, user_id: int, query: str):
-    """Store user search queries into PostgreSQL"""
+    """Store user search queries into PostgreSQL with one commit per call; the request path uses log_user_query"""
     try:
         new_query = QueryLogs(user_id=user_id, query=query, timestamp=datetime.utcnow())
         db.add(new_query)
@@ -30,10 +87,13 @@ async def get_recent_queries(db: AsyncSession, user_id: int, limit: int = 10):
         return []
 
 async def get_all_queries(db: AsyncSession):
-    """Retrieve all stored queries from PostgreSQL."""
+    """Retrieve all distinct stored query strings from PostgreSQL.
+
+    Holds the whole corpus in memory; use database.corpus.aiter_postgres_queries
+    to stream large ones.
+    """
     try:
-        result = await db.execute(select(QueryLogs).order_by(QueryLogs.timestamp.desc()))
-        return result.scalars().all()
+        return [query async for chunk in aiter_postgres_queries(db) for query in chunk]
     except Exception as e:
         print(f"Error retrieving all queries: {e}")
-        return []
\ No newline at end of file
+        return []
@@ -0,0 +1,51 @@
+"""Backfill stored embeddings for documents indexed before hybrid search.
+
+Pages through documents that have no `embedding` field, encodes their content
+in batches and writes the vectors back with partial bulk updates:
+
+    python -m scripts.embed_documents --batch-size 256
+"""
+import argparse
+import asyncio
+from database.elastic_search import AsyncQueryDatabase
+from models.embeddings import get_embedding_batcher
+
+
+async def backfill(batch_size):
+    db = AsyncQueryDatabase()
+    embedder = get_embedding_batcher()
+    await db.create_documents_index(embedder.service.dimension)
+    body = {
+        "query": {"bool": {"must_not": {"exists": {"field": "embedding"}}}},
+        "sort": [{"_doc": "asc"}],
+        "_source": ["content"]
+    }
+    updated = 0
+    try:
+        while True:
+            # Updated documents drop out of the query, so always read the first page
+            response = await db.es.search(index="documents", body=body, size=batch_size)
+            hits = response["hits"]["hits"]
+            if not hits:
+                break
+            embeddings = await embedder.encode([hit["_source"].get("content", "") for hit in hits], cache=False)
+            operations = []
+            for hit, embedding in zip(hits, embeddings):
+                operations.append({"update": {"_index": "documents", "_id": hit["_id"]}})
+                operations.append({"doc": {"embedding": [float(x) for x in embedding]}})
+            result = await db.es.bulk(operations=operations, refresh="wait_for")
+            if result.get("errors"):
+                print("Some documents failed to update; stopping")
+                break
+            updated += len(hits)
+            print(f"Embedded {updated} documents")
+    finally:
+        await db.close()
+    print(f"Done: {updated} documents embedded.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size))
@@ -0,0 +1,98 @@
+"""Move the query log to the mapped, versioned index behind the `queries` alias.
+
+Creates `queries-v<version>` with the edge-ngram/completion mapping, copies
+every document from the current `queries` index (a pre-mapping concrete
+index or an older version behind the alias) as scripted upserts, so repeated
+queries collapse into one document with a count, then swaps the alias in a
+single atomic `_aliases` call:
+
+    python -m scripts.migrate_queries_index
+    python -m scripts.migrate_queries_index --version 3 --keep-old
+
+Queries logged between the copy and the swap land in the old index and are
+lost with it, so run it when traffic is low.
+If a run stops before the swap, re-running starts the copy over. Documents
+without a timestamp are copied without one; documents without a query are
+skipped, and both are counted at the end.
+"""
+import argparse
+from database.corpus import Progress, iter_elastic_docs
+from database.elastic_search import (
+    QUERIES_INDEX,
+    QUERIES_INDEX_VERSION,
+    QUERIES_MAPPING,
+    QueryDatabase,
+    queries_index_name,
+    query_upsert_operations
+)
+
+
+def current_index(es):
+    """(concrete index behind `queries`, whether it is an alias) or (None, False)."""
+    if es.indices.exists_alias(name=QUERIES_INDEX):
+        return next(iter(es.indices.get_alias(name=QUERIES_INDEX))), True
+    if es.indices.exists(index=QUERIES_INDEX):
+        return QUERIES_INDEX, False
+    return None, False
+
+
+def migrate(version, chunk_size, keep_old):
+    es = QueryDatabase().es
+    target = queries_index_name(version)
+    source, aliased = current_index(es)
+    if source == target:
+        print(f"'{QUERIES_INDEX}' already points to '{target}'")
+        return
+    if es.indices.exists(index=target):
+        # Left by an interrupted run; copying into it again would add every count twice
+        es.indices.delete(index=target)
+        print(f"Deleted partial copy '{target}'")
+    es.indices.create(index=target, body=QUERIES_MAPPING)
+    print(f"Created '{target}'")
+
+    if source is not None:
+        progress = Progress(f"Copy {source} -> {target}", es.count(index=source)["count"])
+        skipped = untimed = 0
+        for docs in iter_elastic_docs(es, source, ("query", "timestamp", "count"), chunk_size):
+            total = len(docs)
+            docs = [{**doc, "timestamp": doc.get("timestamp") or None} for doc in docs if doc.get("query")]
+            skipped += total - len(docs)
+            untimed += sum(1 for doc in docs if not doc.get("timestamp"))
+            if docs:
+                response = es.bulk(operations=query_upsert_operations(docs, index=target))
+                if response.get("errors"):
+                    print("Some queries failed to copy; stopping before the alias swap")
+                    return
+            progress.update(total)
+        progress.done()
+        if untimed:
+            print(f"Copied {untimed} documents without a timestamp; they keep none")
+        if skipped:
+            print(f"Skipped {skipped} documents without a query")
+    es.indices.refresh(index=target)
+
+    actions = [{"add": {"index": target, "alias": QUERIES_INDEX}}]
+    if source is not None and not aliased:
+        # A concrete index named like the alias must go in the same call
+        actions.append({"remove_index": {"index": source}})
+    elif source is not None:
+        actions.append({"remove": {"index": source, "alias": QUERIES_INDEX}})
+    es.indices.update_aliases(actions=actions)
+    print(f"'{QUERIES_INDEX}' now points to '{target}'")
+
+    if aliased and not keep_old:
+        es.indices.delete(index=source)
+        print(f"Deleted '{source}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--version", type=int, default=QUERIES_INDEX_VERSION)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--keep-old", action="store_true", help="keep the previous versioned index after the swap")
+    args = parser.parse_args()
+    migrate(args.version, args.chunk_size, args.keep_old)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,29 @@
-import os
-from sentence_transformers import SentenceTransformer
-import faiss
-from database.elastic_search import QueryDatabase
+from database.faiss_store import get_faiss_index
+from database.elastic_search import AsyncQueryDatabase
+from database.corpus import aiter_elastic_queries, count_elastic_queries
 from dotenv import load_dotenv
-import numpy as np
-import pickle
+import asyncio
 
 load_dotenv()
 
-MODEL_NAME = os.getenv("FAISS_MODEL_NAME", "all-MiniLM-L6-v2")
-INDEX_PATH = "faiss_index/index.faiss"
-MAPPING_PATH = "faiss_index/id_to_text.pkl"
 
-# Step 1: Load model
-model = SentenceTransformer(MODEL_NAME)
+async def main():
+    # Step 1: Count queries in Elasticsearch (picks the index type when FAISS_INDEX_TYPE=auto)
+    query_db = AsyncQueryDatabase()
+    faiss_index = get_faiss_index()
+    try:
+        total = await count_elastic_queries(query_db.es)
+        if not total:
+            print("No queries found in ElasticSearch.")
+            return
 
-# Step 2: Fetch queries from Elasticsearch
-query_db = QueryDatabase()
-queries = query_db.search_all_queries()
+        # Step 2: Stream queries in chunks through the encoder into a fresh index,
+        # then write it as a snapshot
+        await faiss_index.build_from_chunks(aiter_elastic_queries(query_db.es), total)
+    finally:
+        await query_db.close()
 
-if not queries:
-    print("No queries found in ElasticSearch.")
-    exit()
+    print(f"FAISS index built and saved with {len(faiss_index.store)} entries.")
 
-# Step 3: Embed queries
-print("Encoding queries...")
-embeddings = model.encode(queries, show_progress_bar=True)
 
-# Step 4: Build FAISS index
-dimension = embeddings.shape[1]
-index = faiss.IndexFlatL2(dimension)
-index.add(np.array(embeddings))
-
-# Step 5: Save index and mapping
-os.makedirs("faiss_index", exist_ok=True)
-faiss.write_index(index, INDEX_PATH)
-
-with open(MAPPING_PATH, "wb") as f:
-    pickle.dump(queries, f)
-
-print(f"FAISS index built and saved with {len(queries)} entries.")
\ No newline at end of file
+asyncio.run(main())
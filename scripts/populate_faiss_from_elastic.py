@@ -1,12 +1,21 @@
-from database.faiss_store import faiss_index
+from database.faiss_store import get_faiss_index
 from database.elastic_search import QueryDatabase
+from database.corpus import Progress, iter_elastic_queries
 
 query_db = QueryDatabase()
-queries = query_db.search_all_queries()
+query_db.connect_to_es()
+faiss_index = get_faiss_index()
+total = query_db.es.count(index="queries")["count"]
 
-if queries:
-    print(f"Found {len(queries)} queries in Elasticsearch. Indexing into FAISS...")
-    faiss_index.index_queries(queries)
+if total:
+    print(f"Found {total} queries in Elasticsearch. Indexing into FAISS...")
+    faiss_index.load_snapshot()
+    progress = Progress("FAISS upsert", total)
+    for chunk in iter_elastic_queries(query_db.es):
+        faiss_index.upsert_queries(chunk, bulk=True)
+        progress.update(len(chunk))
+    progress.done()
+    faiss_index.save_snapshot()
     print("FAISS successfully populated from Elasticsearch.")
 else:
-    print("No queries found in Elasticsearch.")
\ No newline at end of file
+    print("No queries found in Elasticsearch.")
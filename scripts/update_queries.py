@@ -1,4 +1,4 @@
-from database.elastic_search import QueryDatabase
+from database.elastic_search import AsyncQueryDatabase
 from search_engines.fetch_queries import fetch_google_results, fetch_duckduckgo_results
 from sqlalchemy.ext.asyncio import AsyncSession
 from database.postgres import SessionLocal
@@ -7,17 +7,18 @@ import asyncio
 class QueryUpdater:
     def __init__(self):
         """Initialize Elasticsearch and PostgreSQL connection."""
-        self.db = QueryDatabase()
+        self.db = AsyncQueryDatabase()
 
     async def update_query_database(self, query: str, db: AsyncSession):
         """Fetch new related queries and store them."""
-        google_queries = fetch_google_results(query)
-        duckduckgo_queries = fetch_duckduckgo_results(query)
+        google_queries, duckduckgo_queries = await asyncio.gather(
+            fetch_google_results(query),
+            fetch_duckduckgo_results(query)
+        )
 
         all_queries = set(google_queries + duckduckgo_queries)
 
-        for suggestion in all_queries:
-            self.db.store_query(suggestion, db.sync_session)  
+        await self.db.store_queries([q for q in all_queries if q])
 
         return list(all_queries)
 
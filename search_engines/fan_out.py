@@ -0,0 +1,63 @@
+import asyncio
+import os
+import time
+from telemetry.metrics import SOURCE_RESULTS, record
+
+# Latency budgets in seconds, overridable per source via <NAME>_SOURCE_TIMEOUT
+DEFAULT_SOURCE_TIMEOUT = float(os.getenv("SOURCE_TIMEOUT", "1.0"))
+DEFAULT_GLOBAL_TIMEOUT = float(os.getenv("EXPANSION_TIMEOUT", "2.0"))
+
+
+def source_timeout(name, default=DEFAULT_SOURCE_TIMEOUT):
+    """Return the latency budget configured for a source."""
+    return float(os.getenv(f"{name.upper()}_SOURCE_TIMEOUT", default))
+
+
+async def _run_source(name, factory, timeout):
+    """Await a single source within its own deadline and record the outcome."""
+    started = time.perf_counter()
+    try:
+        results = await asyncio.wait_for(factory(), timeout)
+        status = "ok"
+    except asyncio.TimeoutError:
+        results, status = [], "timeout"
+    except Exception as e:
+        print(f"Source '{name}' failed: {e}")
+        results, status = [], "error"
+    elapsed = time.perf_counter() - started
+    record(name, elapsed, error=status == "error")
+    SOURCE_RESULTS.inc(name, status)
+    return results or [], {"status": status, "count": len(results or []), "elapsed_ms": round(elapsed * 1000, 2)}
+
+
+async def fan_out(sources, timeouts=None, global_timeout=DEFAULT_GLOBAL_TIMEOUT):
+    """Run all sources concurrently and return whatever finished within budget.
+
+    `sources` maps a source name to a zero-argument callable returning an awaitable.
+    Returns `(results, report)` where `results` maps each source to its list of
+    results (empty when it missed its deadline) and `report` records the status
+    and latency of every source.
+    """
+    timeouts = timeouts or {}
+    started = time.perf_counter()
+    tasks = {
+        name: asyncio.create_task(_run_source(name, factory, timeouts.get(name, source_timeout(name))))
+        for name, factory in sources.items()
+    }
+
+    done, pending = await asyncio.wait(tasks.values(), timeout=global_timeout)
+    for task in pending:
+        task.cancel()
+    # Wait for the cancellations to land so no source outlives the call
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    results, report = {}, {}
+    for name, task in tasks.items():
+        if task in done:
+            results[name], report[name] = task.result()
+        else:
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+            SOURCE_RESULTS.inc(name, "timeout")
+            results[name] = []
+            report[name] = {"status": "timeout", "count": 0, "elapsed_ms": elapsed_ms}
+    return results, report
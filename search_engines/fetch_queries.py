@@ -1,11 +1,19 @@
+import asyncio
 import os
-import requests
-from database.faiss_store import faiss_index
-from database.elastic_search import QueryDatabase
+from telemetry.metrics import STAGE_ERRORS
+from database.faiss_store import get_faiss_index
+from database.elastic_search import QueryDatabase, AsyncQueryDatabase
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.user_queries import get_recent_queries
+from search_engines.http_client import get_http_client
+from search_engines.provider_cache import get_provider_cache
+from models.embeddings import get_embedding_batcher
+
+GOOGLE_SEARCH_URL = os.getenv("GOOGLE_SEARCH_URL", "https://www.googleapis.com/customsearch/v1")
+DUCKDUCKGO_URL = os.getenv("DUCKDUCKGO_URL", "https://api.duckduckgo.com/")
 
 query_db = None
+async_query_db = None
 
 def get_query_db():
     global query_db
@@ -13,18 +21,44 @@ def get_query_db():
         query_db = QueryDatabase()
     return query_db
 
-async def fetch_faiss_queries(query, top_n=5):
-    return faiss_index.search_similar_queries(query, top_n)
+def get_async_query_db():
+    global async_query_db
+    if async_query_db is None:
+        async_query_db = AsyncQueryDatabase()
+    return async_query_db
+
+async def fetch_faiss_queries(query, top_n=5, with_embeddings=False, query_embedding=None):
+    """Similar queries from FAISS; with embeddings, a list of (text, vector) pairs.
+
+    Pass `query_embedding` when the caller already encoded the query.
+    """
+    faiss_index = get_faiss_index()
+    if faiss_index.index.ntotal == 0:
+        return []
+    if query_embedding is None:
+        query_embedding = await get_embedding_batcher().encode([query])
+    results = await asyncio.to_thread(faiss_index.search_by_embedding, query_embedding, top_n, with_embeddings)
+    return list(zip(*results)) if with_embeddings else results
 
 async def fetch_elastic_queries(query, top_n=5):
-    db = get_query_db()
-    return db.search_similar_queries(query, top_n)
+    db = get_async_query_db()
+    return await db.search_similar_queries(query, top_n)
 
 async def fetch_postgres_queries(user_id: int, db: AsyncSession, top_n=5):
     queries = await get_recent_queries(db, user_id, top_n)
     return [q.query for q in queries] if queries else []
 
-def fetch_google_results(query, num_results=5):
+async def fetch_google_results(query, num_results=5):
+    return await get_provider_cache().get_or_fetch(
+        "google", query, num_results, lambda: _google_results(query, num_results)
+    )
+
+async def fetch_duckduckgo_results(query, num_results=5):
+    return await get_provider_cache().get_or_fetch(
+        "duckduckgo", query, num_results, lambda: _duckduckgo_results(query, num_results)
+    )
+
+async def _google_results(query, num_results):
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
     SEARCH_ENGINE_ID = os.getenv("SEARCH_ENGINE_ID")
 
@@ -32,14 +66,9 @@ def fetch_google_results(query, num_results=5):
         print("Missing Google API credentials in environment variables.")
         return []
 
-    search_url = (
-        f"https://www.googleapis.com/customsearch/v1?"
-        f"q={query}&key={GOOGLE_API_KEY}&cx={SEARCH_ENGINE_ID}"
-    )
+    params = {"q": query, "key": GOOGLE_API_KEY, "cx": SEARCH_ENGINE_ID}
     try:
-        response = requests.get(search_url)
-        response.raise_for_status()
-        data = response.json()
+        data = await get_http_client().get_json(GOOGLE_SEARCH_URL, params=params)
         if "items" in data:
             return [
                 item["title"]
@@ -47,14 +76,13 @@ def fetch_google_results(query, num_results=5):
             ]
     except Exception as e:
         print(f"Google API Error: {e}")
+        STAGE_ERRORS.inc("google")
     return []
 
-def fetch_duckduckgo_results(query, num_results=5):
-    search_url = f"https://api.duckduckgo.com/?q={query}&format=json"
+async def _duckduckgo_results(query, num_results):
+    params = {"q": query, "format": "json"}
     try:
-        response = requests.get(search_url)
-        response.raise_for_status()
-        data = response.json()
+        data = await get_http_client().get_json(DUCKDUCKGO_URL, params=params)
         if "RelatedTopics" in data:
             return [
                 item.get("Text", "")
@@ -62,4 +90,5 @@ def fetch_duckduckgo_results(query, num_results=5):
             ]
     except Exception as e:
         print(f"DuckDuckGo API Error: {e}")
-    return []
\ No newline at end of file
+        STAGE_ERRORS.inc("duckduckgo")
+    return []
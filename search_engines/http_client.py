@@ -0,0 +1,109 @@
+import asyncio
+import os
+import random
+from urllib.parse import urlsplit
+import httpx
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "3.0"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "1.0"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_PER_HOST_CONCURRENCY = int(os.getenv("HTTP_PER_HOST_CONCURRENCY", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.2"))
+HTTP_MAX_RETRY_DELAY = float(os.getenv("HTTP_MAX_RETRY_DELAY", "2.0"))  # Longer Retry-After means give up
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HTTPClient:
+    def __init__(
+        self,
+        timeout=HTTP_TIMEOUT,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive=HTTP_MAX_KEEPALIVE,
+        per_host_concurrency=HTTP_PER_HOST_CONCURRENCY,
+        max_retries=HTTP_MAX_RETRIES,
+        backoff=HTTP_BACKOFF,
+        max_retry_delay=HTTP_MAX_RETRY_DELAY,
+    ):
+        """Pooled keep-alive HTTP client with per-host concurrency limits and retries."""
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+        )
+        self.per_host_concurrency = per_host_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_delay = max_retry_delay
+        self._client = None
+        self._semaphores = {}
+
+    @property
+    def client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    def _semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._semaphores[host]
+
+    def _retry_delay(self, attempt, response=None):
+        """Exponential backoff with jitter, honouring Retry-After when present.
+
+        None when the server asks for a longer wait than `max_retry_delay`:
+        the caller gives up rather than holding the request that long.
+        """
+        delay = min(self.backoff * (2 ** attempt) * (1 + random.random()), self.max_retry_delay)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("Retry-After", 0))
+            except ValueError:
+                retry_after = 0
+            if retry_after > self.max_retry_delay:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+    async def get_json(self, url, params=None):
+        """GET a URL and decode the JSON body, retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore(url):
+                    response = await self.client.get(url, params=params)
+                if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    delay = self._retry_delay(attempt, response)
+                    if delay is not None:
+                        await asyncio.sleep(delay)
+                        continue
+                response.raise_for_status()
+                return response.json()
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+http_client = None
+
+def get_http_client():
+    global http_client
+    if http_client is None:
+        http_client = HTTPClient()
+    return http_client
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from database.query_store import normalize_query
+from telemetry.metrics import CACHE_REQUESTS
+
+PROVIDER_CACHE_TTL = float(os.getenv("PROVIDER_CACHE_TTL", "3600"))
+PROVIDER_CACHE_STALE_TTL = float(os.getenv("PROVIDER_CACHE_STALE_TTL", "86400"))
+PROVIDER_CACHE_SIZE = int(os.getenv("PROVIDER_CACHE_SIZE", "10000"))
+
+
+class CacheBackend(ABC):
+    """Storage for cached provider results.
+
+    The in-process LRU is the default; a shared store such as Redis or
+    memcached can implement the same two coroutines so workers share results.
+    """
+
+    @abstractmethod
+    async def get(self, key):
+        """Return `(value, stored_at)` or None."""
+
+    @abstractmethod
+    async def set(self, key, value, stored_at, expire_after):
+        """Store a value; it may be dropped once `expire_after` seconds have passed."""
+
+
+class LRUCacheBackend(CacheBackend):
+    def __init__(self, max_size=PROVIDER_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # key -> (value, stored_at, expires_at)
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[0], entry[1]
+
+    async def set(self, key, value, stored_at, expire_after):
+        self.entries[key] = (value, stored_at, stored_at + expire_after)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+class ProviderCache:
+    def __init__(self, backend=None, ttl=PROVIDER_CACHE_TTL, stale_ttl=PROVIDER_CACHE_STALE_TTL):
+        """TTL cache for external provider results with request coalescing.
+
+        Fresh entries (younger than `ttl`) are returned directly. For a further
+        `stale_ttl` seconds an entry is still returned, but a background refresh
+        is started. Concurrent misses for the same key share one upstream call.
+        """
+        self.backend = backend or LRUCacheBackend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.inflight = {}  # key -> asyncio.Task
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key(provider, query, num_results):
+        return f"{provider}:{num_results}:{normalize_query(query)}"
+
+    async def get_or_fetch(self, provider, query, num_results, fetch):
+        """Return cached results for the provider/query pair, calling `fetch()` on a miss."""
+        key = self.key(provider, query, num_results)
+        entry = await self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < self.ttl:
+                self.hits += 1
+                CACHE_REQUESTS.inc(provider, "hit")
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                CACHE_REQUESTS.inc(provider, "stale")
+                self._load_once(key, fetch)  # Revalidate in the background
+                return value
+
+        self.misses += 1
+        CACHE_REQUESTS.inc(provider, "miss")
+        task = self._load_once(key, fetch)
+        # Shielded so a caller hitting its deadline does not cancel the fetch others wait on
+        return await asyncio.shield(task)
+
+    def _load_once(self, key, fetch):
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.create_task(self._load(key, fetch))
+        self.inflight[key] = task
+        task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return task
+
+    async def _load(self, key, fetch):
+        value = await fetch()
+        if value:  # Fetchers return [] on errors; do not pin failures in the cache
+            await self.backend.set(key, value, time.time(), self.ttl + self.stale_ttl)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+provider_cache = None
+
+def get_provider_cache():
+    global provider_cache
+    if provider_cache is None:
+        provider_cache = ProviderCache()
+    return provider_cache
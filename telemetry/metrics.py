@@ -0,0 +1,179 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PREFIX = "searchsense_"
+
+# Seconds; spans cache hits (~0.1 ms) to provider timeouts (seconds)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+registry = []     # Metrics in exposition order
+collectors = []   # Callables returning samples computed at scrape time
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        """Monotonic count per label combination, e.g. errors per source."""
+        self.name = METRICS_PREFIX + name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self.values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        """Cumulative-bucket histogram per label combination."""
+        self.name = METRICS_PREFIX + name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = [(labels, list(series)) for labels, series in self.values.items()]
+        for label_values, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                labels = _labels(self.labels + ("le",), label_values + (_number(float(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+def register_stats(prefix, stats, counters=("hits", "misses", "stale_hits", "coalesced", "shed", "batches", "batched_texts")):
+    """Export a component's `stats()` dict at scrape time.
+
+    Numeric entries become `<prefix>_<key>` gauges; keys in `counters` are
+    cumulative and are exported as `<prefix>_<key>_total` counters. `stats`
+    may return None when the component is not loaded yet.
+    """
+    def collect():
+        values = stats()
+        if not values:
+            return []
+        lines = []
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            kind = "counter" if key in counters else "gauge"
+            name = f"{METRICS_PREFIX}{prefix}_{key}" + ("_total" if kind == "counter" else "")
+            lines += [f"# TYPE {name} {kind}", f"{name} {_number(value)}"]
+        return lines
+
+    collectors.append(collect)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in registry:
+        lines += metric.render()
+    for collect in collectors:
+        try:
+            lines += collect()
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Request latency by route.", ("route", "status"))
+STAGE_LATENCY = Histogram("stage_duration_seconds", "Latency of each request stage.", ("stage",))
+STAGE_ERRORS = Counter("stage_errors_total", "Stages that raised.", ("stage",))
+SOURCE_RESULTS = Counter("source_results_total", "Expansion source outcomes (ok, timeout or error).", ("source", "status"))
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"))
+BATCH_SIZE = Histogram("embedding_batch_size", "Texts per embedding forward pass.", buckets=SIZE_BUCKETS)
+
+
+# Per-request trace: stage name -> accumulated seconds, reported as Server-Timing
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def record(stage, seconds, error=False):
+    """Record a stage duration measured elsewhere (e.g. by fan_out)."""
+    if not METRICS_ENABLED:
+        return
+    STAGE_LATENCY.observe(seconds, stage)
+    if error:
+        STAGE_ERRORS.inc(stage)
+    trace = current_trace.get()
+    if trace is not None:
+        trace[stage] = trace.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one stage: `with stage("dedup"): ...` (also around awaits)."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record(name, time.perf_counter() - started, error=True)
+        raise
+    record(name, time.perf_counter() - started)
+
+
+async def timed(name, awaitable):
+    """Await as one stage, for stages run concurrently with asyncio.gather."""
+    with stage(name):
+        return await awaitable
+
+
+def server_timing(trace, total):
+    """Server-Timing header value, durations in milliseconds."""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in trace.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
@@ -0,0 +1,52 @@
+"""Autocomplete suggestions, queued sightings and snapshots.
+
+    pytest tests/test_autocomplete.py
+"""
+from models.autocomplete import Autocomplete
+
+
+def test_suggests_most_frequent_completions_of_a_prefix():
+    index = Autocomplete(top_k=3)
+    index.add_counts([("best laptop", 5), ("best phone", 9), ("Best  Laptop bag", 1), ("cheap phone", 7)])
+    index.finish_loading()
+    assert index.suggest("BEST ") == ["best phone", "best laptop", "Best  Laptop bag"]
+    assert index.suggest("best l", top_n=1) == ["best laptop"]
+    assert index.suggest("xyz") == []
+
+
+def test_sightings_are_queued_until_applied():
+    index = Autocomplete(top_k=3)
+    index.add_queries(["best phone"])  # Before loading: kept for later
+    index.add_counts([("best laptop", 1)])
+    index.finish_loading()
+    index.add_queries(["best phone", "best phone"])
+    assert index.suggest("best") == ["best laptop", "best phone"]
+    assert index.apply_pending() == 2
+    assert index.suggest("best") == ["best phone", "best laptop"]
+
+
+def test_pending_queue_is_bounded_while_loading():
+    index = Autocomplete(max_pending=3)
+    for i in range(5):
+        index.add_queries([f"query {i}"])
+    index.add_queries(["a", "b", "c", "d"])
+    assert index.stats()["pending"] == 3
+    assert index.dropped == 6
+    index.finish_loading()
+    assert sorted(index.texts) == ["b", "c", "d"]
+
+
+def test_merge_keeps_the_larger_count_and_snapshot_round_trips(tmp_path):
+    index = Autocomplete(top_k=2)
+    index.add_counts([("best laptop", 5), ("best phone", 2)])
+    index.finish_loading()
+    index.merge_counts([("best laptop", 3), ("best phone", 8), ("best tablet", 1)])
+    index.merge_counts([("best phone", 8)])
+    assert index.suggest("best") == ["best phone", "best laptop"]
+
+    path = str(tmp_path / "trie.pkl")
+    index.save_snapshot(path)
+    restored = Autocomplete(top_k=2)
+    assert restored.load_snapshot(path)
+    assert restored.suggest("best") == ["best phone", "best laptop"]
+    assert restored.suggest("best t") == ["best tablet"]
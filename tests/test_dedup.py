@@ -0,0 +1,39 @@
+"""select_diverse against the plain greedy loop it vectorizes.
+
+    pytest tests/test_dedup.py
+"""
+import numpy as np
+import pytest
+from benchmarks.dedup import candidates
+from models.dedup import normalize_rows, select_diverse
+
+
+def greedy(embeddings, threshold, limit=None):
+    """Reference: keep each candidate whose similarity to every kept one is below `threshold`."""
+    vectors = normalize_rows(embeddings)
+    kept = []
+    for i, vector in enumerate(vectors):
+        if limit is not None and len(kept) >= limit:
+            break
+        if all(float(vectors[j] @ vector) < threshold for j in kept):
+            kept.append(i)
+    return kept
+
+
+@pytest.mark.parametrize("size", [1, 20, 300])
+@pytest.mark.parametrize("threshold", [0.5, 0.85, 0.95])
+@pytest.mark.parametrize("block_size", [1, 7, 64, 1000])
+def test_matches_the_greedy_loop(size, threshold, block_size):
+    embeddings = candidates(size, dimension=32, duplicate_rate=0.5, seed=size)
+    assert select_diverse(embeddings, threshold, block_size=block_size) == greedy(embeddings, threshold)
+
+
+@pytest.mark.parametrize("limit", [1, 5, 50])
+def test_limit_stops_after_the_same_prefix(limit):
+    embeddings = candidates(300, dimension=32, duplicate_rate=0.5, seed=1)
+    assert select_diverse(embeddings, 0.85, limit=limit, block_size=16) == greedy(embeddings, 0.85, limit)
+
+
+def test_exact_duplicates_collapse_to_the_first():
+    vector = np.array([1.0, 2.0, 3.0])
+    assert select_diverse([vector, 2 * vector, [-1.0, 0.0, 0.0], vector]) == [0, 2]
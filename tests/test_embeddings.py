@@ -0,0 +1,100 @@
+"""EmbeddingService caching and EmbeddingBatcher coalescing with a stub model instead of a sentence-transformers download.
+
+    pytest tests/test_embeddings.py
+"""
+import asyncio
+import hashlib
+import json
+import numpy as np
+import pytest
+from api.main import embedding_overloaded
+from models import embeddings
+from models.embeddings import EmbeddingBatcher, EmbeddingOverloaded, EmbeddingService
+
+
+class StubModel:
+    dimension = 8
+
+    def __init__(self):
+        self.encoded = []
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts):
+        """A fixed vector per text; records each call so tests can count forward passes."""
+        self.encoded.append(list(texts))
+        return np.stack([
+            np.frombuffer(hashlib.sha256(text.encode()).digest()[:self.dimension], dtype="uint8").astype("float32")
+            for text in texts
+        ])
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(embeddings, "load_model", lambda *args, **kwargs: StubModel())
+    return EmbeddingService("stub", cache_size=3)
+
+
+def test_cached_texts_are_not_encoded_again(service):
+    first = service.encode(["best laptop", "cheap phone"])
+    second = service.encode(["Best  Laptop", "vegan dinner"])
+    assert np.array_equal(first[0], second[0])
+    assert service.model.encoded == [["best laptop", "cheap phone"], ["vegan dinner"]]
+    assert (service.hits, service.misses) == (1, 3)
+
+
+def test_cache_entries_own_their_memory_and_stay_bounded(service):
+    service.encode([f"query {i}" for i in range(5)])
+    assert len(service.cache) == 3
+    # Each entry is its own row, not a view that pins the whole batch matrix
+    assert all(vector.base is None for vector in service.cache.values())
+
+
+def test_concurrent_requests_share_one_forward_pass_and_get_their_own_rows(service):
+    batcher = EmbeddingBatcher(service, max_wait_ms=50, max_batch=64)
+    requests = [["best laptop"], ["cheap phone", "vegan dinner"], ["coffee recipe"]]
+
+    async def run():
+        return await asyncio.gather(*(batcher.encode(texts) for texts in requests))
+
+    results = asyncio.run(run())
+    assert service.model.encoded == [["best laptop", "cheap phone", "vegan dinner", "coffee recipe"]]
+    assert batcher.stats()["batches"] == 1
+    for texts, rows in zip(requests, results):
+        assert np.array_equal(rows, service.encode(texts))
+
+
+def test_batches_are_capped_at_max_batch_and_split_by_cache_mode(service):
+    batcher = EmbeddingBatcher(service, max_wait_ms=50, max_batch=3)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.encode(["a", "b"]), batcher.encode(["c", "d"]), batcher.encode(["long document"], cache=False)
+        )
+
+    first, second, document = asyncio.run(run())
+    assert np.array_equal(first, service.encode(["a", "b"]))
+    assert np.array_equal(second, service.encode(["c", "d"]))
+    assert np.array_equal(document, service.encode(["long document"], cache=False))
+    assert all(len(call) <= 3 for call in service.model.encoded)
+    assert batcher.stats()["batches"] == 2
+
+
+def test_full_queue_sheds_requests_as_503(service):
+    batcher = EmbeddingBatcher(service, max_wait_ms=50, max_batch=64, max_queue=3)
+
+    async def run():
+        waiting = asyncio.create_task(batcher.encode(["a", "b"]))
+        await asyncio.sleep(0)  # Queued, still inside the batching window
+        with pytest.raises(EmbeddingOverloaded):
+            await batcher.encode(["c", "d"])
+        return await waiting
+
+    assert len(asyncio.run(run())) == 2
+    assert batcher.stats()["shed"] == 1
+
+    response = asyncio.run(embedding_overloaded(None, EmbeddingOverloaded("2 texts already waiting")))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert json.loads(response.body) == {"error": "2 texts already waiting"}
@@ -0,0 +1,126 @@
+"""Persistence round trips for FAISSIndex with a stub embedder: writer/reader spooling and delta-log replay.
+
+    pytest tests/test_faiss_roles.py
+"""
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+from database.faiss_store import SPOOL_DIR, FAISSIndex
+from database.query_store import query_id
+
+
+class StubEmbedder:
+    dimension = 16
+
+    def encode(self, texts, cache=True):
+        """A fixed random unit vector per text, so the same text always finds itself first."""
+        vectors = np.stack([
+            np.random.default_rng(int.from_bytes(hashlib.sha1(text.encode()).digest()[:4], "little")).standard_normal(self.dimension)
+            for text in texts
+        ]).astype("float32")
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def open_index(index_dir, role):
+    index = FAISSIndex(index_dir=str(index_dir), index_type="flat", role=role, num_shards=1)
+    index._embedder = index.corpus_encoder = StubEmbedder()
+    return index
+
+
+def top_hit(index, query):
+    results = index.search_similar_queries(query, 1)
+    return results[0] if results else None
+
+
+def test_reader_changes_reach_writer_and_come_back_published(tmp_path):
+    writer = open_index(tmp_path, "writer")
+    writer.upsert_queries(["best laptop", "cheap phone"])
+    writer.save_snapshot()
+
+    reader = open_index(tmp_path, "reader")
+    assert reader.load_snapshot()
+    assert top_hit(reader, "best laptop") == "best laptop"
+
+    # Readers only spool; nothing changes locally until the writer publishes
+    reader.upsert_queries(["python tutorial"])
+    assert reader.delete_queries([query_id("cheap phone")]) == 1
+    assert reader.store.get(query_id("python tutorial")) is None
+    reader._rotate_spool()
+
+    assert writer._ingest_spool() == 2
+    assert not os.listdir(os.path.join(tmp_path, SPOOL_DIR))
+    writer.save_snapshot()
+
+    assert reader._load_published()
+    assert reader.generation == writer.generation
+    assert reader.store.get(query_id("python tutorial")) == "python tutorial"
+    assert query_id("cheap phone") not in reader.store
+    assert top_hit(reader, "python tutorial") == "python tutorial"
+    assert top_hit(reader, "cheap phone") != "cheap phone"
+
+
+def test_writer_ingests_spool_abandoned_by_a_dead_reader(tmp_path):
+    writer = open_index(tmp_path, "writer")
+    writer.upsert_queries(["best laptop"])
+    writer.save_snapshot()
+
+    reader = open_index(tmp_path, "reader")
+    reader.load_snapshot()
+    reader.upsert_queries(["orphaned query"])
+    # The reader dies without handing its spool over
+    spool_path = reader._spool_file.name
+    reader._spool_file.close()
+    reader._spool_file = None
+    old = time.time() - 3600
+    os.utime(spool_path, (old, old))
+
+    assert writer._ingest_spool() == 1
+    assert writer.store.get(query_id("orphaned query")) == "orphaned query"
+    assert not os.listdir(os.path.join(tmp_path, SPOOL_DIR))
+
+
+def test_delta_log_replays_upserts_and_deletes_after_restart(tmp_path):
+    index = open_index(tmp_path, "standalone")
+    index.upsert_queries(["best laptop", "cheap phone", "coffee recipe"])
+    index.save_snapshot()
+
+    # Logged after the snapshot: one delete (tombstone) and one new query
+    index.delete_queries([query_id("cheap phone")])
+    index.upsert_queries(["vegan dinner"])
+    index._delta_log.close()
+
+    restarted = open_index(tmp_path, "standalone")
+    assert restarted.load_snapshot()
+    assert restarted.delta_count == 2
+    assert len(restarted.store) == 3
+    assert query_id("cheap phone") not in restarted.store
+    assert top_hit(restarted, "cheap phone") != "cheap phone"
+    assert top_hit(restarted, "vegan dinner") == "vegan dinner"
+    assert top_hit(restarted, "coffee recipe") == "coffee recipe"
+
+
+def test_searches_are_safe_while_queries_are_written(tmp_path):
+    index = open_index(tmp_path, "standalone")
+    index.upsert_queries([f"query {i}" for i in range(200)])
+    errors, done = [], threading.Event()
+
+    def search():
+        rng = np.random.default_rng()
+        while not done.is_set():
+            try:
+                index.search_batch(rng.standard_normal((4, StubEmbedder.dimension)), 5, with_embeddings=True)
+            except Exception as e:
+                errors.append(e)
+
+    searchers = [threading.Thread(target=search) for _ in range(4)]
+    for thread in searchers:
+        thread.start()
+    for i in range(200):
+        index.upsert_queries([f"new {i} {j}" for j in range(5)])
+        index.delete_queries([query_id(f"new {i} 0")])
+    done.set()
+    for thread in searchers:
+        thread.join()
+    assert errors == []
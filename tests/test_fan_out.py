@@ -0,0 +1,73 @@
+"""fan_out per-source and global deadlines, status reporting and cleanup with fake sources.
+
+    pytest tests/test_fan_out.py
+"""
+import asyncio
+from search_engines.fan_out import fan_out
+
+
+def source(results, delay=0.0, fail=False, log=None):
+    """A fake source factory; `log` records whether each call finished or was cancelled."""
+    async def run():
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append("cancelled")
+            raise
+        if fail:
+            raise RuntimeError("provider down")
+        if log is not None:
+            log.append("finished")
+        return results
+    return run
+
+
+def test_statuses_for_ok_slow_and_failing_sources():
+    results, report = asyncio.run(fan_out(
+        {
+            "fast": source(["a", "b"]),
+            "slow": source(["late"], delay=1.0),
+            "broken": source(["never"], fail=True),
+            "empty": source(None),
+        },
+        timeouts={"fast": 0.5, "slow": 0.05, "broken": 0.5, "empty": 0.5},
+        global_timeout=0.5,
+    ))
+    assert results == {"fast": ["a", "b"], "slow": [], "broken": [], "empty": []}
+    assert {name: entry["status"] for name, entry in report.items()} == {
+        "fast": "ok", "slow": "timeout", "broken": "error", "empty": "ok"
+    }
+    assert report["fast"]["count"] == 2 and report["slow"]["count"] == 0
+    assert report["slow"]["elapsed_ms"] < 500
+
+
+def test_global_deadline_returns_partial_results_and_cancels_the_rest():
+    log = []
+
+    async def run():
+        started = asyncio.get_running_loop().time()
+        outcome = await fan_out(
+            {"fast": source(["a"]), "slow": source(["late"], delay=5.0, log=log)},
+            timeouts={"fast": 10, "slow": 10},
+            global_timeout=0.05,
+        )
+        elapsed = asyncio.get_running_loop().time() - started
+        leftover = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        return outcome, elapsed, leftover
+
+    (results, report), elapsed, leftover = asyncio.run(run())
+    assert elapsed < 1
+    assert results == {"fast": ["a"], "slow": []}
+    assert report["fast"]["status"] == "ok" and report["slow"]["status"] == "timeout"
+    # Nothing keeps running once fan_out has returned
+    assert leftover == []
+    assert log == ["cancelled"]
+
+
+def test_source_deadline_cancels_the_source():
+    log = []
+    _, report = asyncio.run(fan_out({"slow": source(["late"], delay=5.0, log=log)},
+                                    timeouts={"slow": 0.05}, global_timeout=1))
+    assert report["slow"]["status"] == "timeout"
+    assert log == ["cancelled"]
@@ -0,0 +1,94 @@
+"""HTTPClient retries, Retry-After cap, timeouts and connection reuse against httpx.MockTransport.
+
+    pytest tests/test_http_client.py
+"""
+import asyncio
+import time
+import httpx
+import pytest
+from search_engines.http_client import HTTPClient
+
+URL = "https://provider.test/search"
+
+
+def stub_client(responses, **kwargs):
+    """An HTTPClient whose pooled client answers from `responses` in order; returns it and the request log."""
+    requests = []
+    responses = iter(responses)
+
+    def handler(request):
+        requests.append(request)
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    http = HTTPClient(backoff=0, **kwargs)
+    http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return http, requests
+
+
+def test_retries_server_errors_then_returns_json():
+    http, requests = stub_client([httpx.Response(503), httpx.Response(500), httpx.Response(200, json={"ok": 1})])
+    assert asyncio.run(http.get_json(URL, params={"q": "laptop"})) == {"ok": 1}
+    assert len(requests) == 3
+    assert requests[0].url.params["q"] == "laptop"
+
+
+def test_gives_up_after_max_retries():
+    http, requests = stub_client([httpx.Response(502)] * 3, max_retries=2)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(http.get_json(URL))
+    assert len(requests) == 3
+
+
+def test_client_errors_are_not_retried():
+    http, requests = stub_client([httpx.Response(404)])
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(http.get_json(URL))
+    assert len(requests) == 1
+
+
+def test_429_honours_a_short_retry_after():
+    http, requests = stub_client([
+        httpx.Response(429, headers={"Retry-After": "0.05"}),
+        httpx.Response(200, json=[]),
+    ])
+    started = time.monotonic()
+    assert asyncio.run(http.get_json(URL)) == []
+    assert time.monotonic() - started >= 0.05
+    assert len(requests) == 2
+
+
+def test_429_with_retry_after_beyond_the_cap_gives_up_at_once():
+    http, requests = stub_client([httpx.Response(429, headers={"Retry-After": "30"})], max_retry_delay=1.0)
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        asyncio.run(asyncio.wait_for(http.get_json(URL), 1))
+    assert error.value.response.status_code == 429
+    assert len(requests) == 1
+
+
+def test_timeouts_are_retried_then_raised():
+    timeout = httpx.ReadTimeout("provider too slow")
+    http, requests = stub_client([timeout, httpx.Response(200, json={"ok": 1})])
+    assert asyncio.run(http.get_json(URL)) == {"ok": 1}
+
+    http, requests = stub_client([timeout] * 3, max_retries=2)
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(http.get_json(URL))
+    assert len(requests) == 3
+
+
+def test_pooled_client_is_reused_until_closed():
+    async def run():
+        http, requests = stub_client([httpx.Response(200, json={})] * 2)
+        pooled = http.client
+        await http.get_json(URL)
+        await http.get_json(URL)
+        assert http.client is pooled and len(requests) == 2
+        await http.aclose()
+        reopened = http.client
+        assert reopened is not pooled and not reopened.is_closed
+        await http.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+"""KeywordMatcher counts on both the substring and the regex path.
+
+    pytest tests/test_preference_cache.py
+"""
+import random
+import pytest
+from database.preference_cache import KeywordMatcher
+
+
+def test_counts_distinct_keywords_case_insensitively():
+    matcher = KeywordMatcher(["Python", "python", "tutorial", "rust"])
+    assert len(matcher) == 3
+    assert matcher.count("A PYTHON Tutorial for python users") == 2
+    assert matcher.count("") == 0
+    assert KeywordMatcher([]).count("anything") == 0
+
+
+def test_overlapping_keywords_are_all_credited():
+    matcher = KeywordMatcher(["new york", "york", "new"] + [f"filler{i}" for i in range(KeywordMatcher.REGEX_MIN_KEYWORDS)])
+    assert matcher.pattern is not None
+    assert matcher.matches("Flights to New York") == {"new york", "york", "new"}
+
+
+@pytest.mark.parametrize("size", [5, 200])
+def test_regex_path_matches_testing_each_keyword(size):
+    rng = random.Random(size)
+    words = ["data", "database", "base", "learn", "learning", "machine", "deep", "net", "network", "work"]
+    keywords = {" ".join(rng.sample(words, rng.randint(1, 2))) for _ in range(size)} | set(words)
+    keywords |= {f"kw{i}" for i in range(size)}
+    matcher = KeywordMatcher(keywords)
+    assert (matcher.pattern is not None) == (len(matcher) >= KeywordMatcher.REGEX_MIN_KEYWORDS)
+    for _ in range(50):
+        text = " ".join(rng.choices(words + ["kw1", "kw42", "other"], k=12))
+        assert matcher.matches(text) == {k for k in keywords if k in text}
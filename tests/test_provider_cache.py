@@ -0,0 +1,78 @@
+"""ProviderCache single-flight and stale-while-revalidate.
+
+    pytest tests/test_provider_cache.py
+"""
+import asyncio
+from search_engines.provider_cache import LRUCacheBackend, ProviderCache
+
+
+def counting_fetch(results, delay=0.0):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return results(len(calls)) if callable(results) else results
+    return fetch, calls
+
+
+def test_concurrent_misses_share_one_fetch():
+    async def run():
+        cache = ProviderCache(ttl=60, stale_ttl=60)
+        fetch, calls = counting_fetch(["laptop deals"], delay=0.05)
+        results = await asyncio.gather(*(cache.get_or_fetch("google", "Laptop", 5, fetch) for _ in range(5)))
+        assert results == [["laptop deals"]] * 5
+        assert len(calls) == 1
+        assert cache.stats()["coalesced"] == 4 and not cache.inflight
+
+        # Same normalized key: now a fresh hit
+        assert await cache.get_or_fetch("google", "  laptop ", 5, fetch) == ["laptop deals"]
+        assert len(calls) == 1 and cache.hits == 1
+
+    asyncio.run(run())
+
+
+def test_stale_entry_is_served_while_refreshed_in_the_background():
+    async def run():
+        cache = ProviderCache(ttl=0.05, stale_ttl=60)
+        fetch, calls = counting_fetch(lambda n: [f"version {n}"])
+        assert await cache.get_or_fetch("ddg", "laptop", 5, fetch) == ["version 1"]
+        await asyncio.sleep(0.06)
+
+        assert await cache.get_or_fetch("ddg", "laptop", 5, fetch) == ["version 1"]  # Stale, served at once
+        assert cache.stale_hits == 1
+        await asyncio.sleep(0.01)  # Let the refresh land
+        assert len(calls) == 2
+        assert await cache.get_or_fetch("ddg", "laptop", 5, fetch) == ["version 2"]
+
+    asyncio.run(run())
+
+
+def test_expired_and_failed_results_are_fetched_again():
+    async def run():
+        cache = ProviderCache(ttl=0.01, stale_ttl=0.01)
+        fetch, calls = counting_fetch([])
+        assert await cache.get_or_fetch("google", "laptop", 5, fetch) == []
+        assert await cache.get_or_fetch("google", "laptop", 5, fetch) == []
+        assert len(calls) == 2  # Empty (failed) results are not cached
+
+        fetch, calls = counting_fetch(["a"])
+        await cache.get_or_fetch("google", "phone", 5, fetch)
+        await asyncio.sleep(0.03)
+        await cache.get_or_fetch("google", "phone", 5, fetch)
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+
+def test_lru_backend_evicts_least_recently_used():
+    async def run():
+        backend = LRUCacheBackend(max_size=2)
+        for key in ("a", "b"):
+            await backend.set(key, [key], 0.0, 1e12)
+        await backend.get("a")
+        await backend.set("c", ["c"], 0.0, 1e12)
+        assert await backend.get("b") is None
+        assert (await backend.get("a"))[0] == ["a"]
+
+    asyncio.run(run())
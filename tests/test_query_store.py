@@ -0,0 +1,56 @@
+"""QueryStore ID map: puts, removes, merges, compaction and save/load round trips.
+
+    pytest tests/test_query_store.py
+"""
+import numpy as np
+import pytest
+from database import query_store
+from database.query_store import QueryStore, normalize_query, query_id
+
+
+def test_query_id_is_stable_across_case_and_whitespace():
+    assert normalize_query("  Best   LAPTOP ") == "best laptop"
+    assert query_id("Best  Laptop") == query_id("best laptop")
+    assert query_id("best laptop") != query_id("best laptops")
+    assert 0 <= query_id("café ☕") < 2**63
+
+
+def test_put_get_touch_and_remove():
+    store = QueryStore(capacity=2)
+    for i, text in enumerate(["best laptop", "cheap phone", "café ☕"]):
+        store.put(query_id(text), text, float(i))
+    assert len(store) == 3
+    assert store.get(query_id("café ☕")) == "café ☕"
+
+    store.put(query_id("best laptop"), "Best Laptop", 10.0)  # Replaced text
+    store.touch(query_id("cheap phone"), 20.0)
+    assert store.get(query_id("best laptop")) == "Best Laptop"
+    assert store.timestamp(query_id("cheap phone")) == 20.0
+    assert len(store) == 3
+
+    assert store.remove(query_id("cheap phone"))
+    assert not store.remove(query_id("cheap phone"))
+    assert query_id("cheap phone") not in store and store.get(query_id("cheap phone")) is None
+    assert store.expired(5.0).tolist() == [query_id("café ☕")]
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_round_trip_after_merges_and_compaction(tmp_path, monkeypatch, mmap):
+    monkeypatch.setattr(query_store, "MERGE_THRESHOLD", 8)  # Exercise the sorted arrays, not just pending
+    store = QueryStore(capacity=4)
+    texts = {query_id(f"query {i}"): f"query {i}" for i in range(100)}
+    for i, (qid, text) in enumerate(texts.items()):
+        store.put(qid, text, float(i))
+    removed = list(texts)[::3]
+    for qid in removed:
+        store.remove(qid)
+        del texts[qid]
+
+    path = tmp_path / "store.npz"
+    store.save(str(path))
+    loaded = QueryStore.load(str(path), mmap=mmap)
+    assert len(loaded) == len(texts)
+    assert dict(loaded.items()) == texts
+    assert all(loaded.get(qid) == text for qid, text in texts.items())
+    assert all(qid not in loaded for qid in removed)
+    assert np.array_equal(np.sort(loaded.ids()), np.sort(np.array(list(texts), dtype="int64")))
@@ -0,0 +1,34 @@
+"""Reciprocal-rank fusion ordering.
+
+    pytest tests/test_ranking.py
+"""
+import pytest
+from models.ranking import reciprocal_rank_fusion
+
+
+def docs(*ids, source=""):
+    return [{"id": i, "source": source} for i in ids]
+
+
+def test_documents_ranked_well_by_both_lists_come_first():
+    fused = reciprocal_rank_fusion([docs("a", "b", "c", source="bm25"), docs("c", "a", "d", source="knn")], k=60)
+    assert [doc["id"] for doc in fused] == ["a", "c", "b", "d"]
+    assert fused[0]["rrf_score"] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[-1]["rrf_score"] == pytest.approx(1 / 63)
+
+
+def test_first_copy_is_kept_and_inputs_are_not_modified():
+    bm25, knn = docs("a", source="bm25"), docs("a", source="knn")
+    fused = reciprocal_rank_fusion([bm25, knn])
+    assert fused == [{"id": "a", "source": "bm25", "rrf_score": pytest.approx(2 / 61)}]
+    assert "rrf_score" not in bm25[0]
+
+
+def test_smaller_k_weights_top_ranks_more():
+    # "a" tops one list; "b" is fourth in two
+    rankings = [docs("a", "x", "y", "b"), docs("p", "q", "r", "b")]
+    assert [doc["id"] for doc in reciprocal_rank_fusion(rankings, k=1)][0] == "a"
+    assert [doc["id"] for doc in reciprocal_rank_fusion(rankings, k=60)][0] == "b"
+    assert reciprocal_rank_fusion([]) == []
+    assert [doc["key"] for doc in reciprocal_rank_fusion([[{"key": 1}], [{"key": 2}, {"key": 1}]],
+                                                         key=lambda doc: doc["key"])] == [1, 2]
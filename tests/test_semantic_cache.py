@@ -0,0 +1,34 @@
+"""SemanticCache hits, misses and the disabled (size 0) cache.
+
+    pytest tests/test_semantic_cache.py
+"""
+import numpy as np
+from models.semantic_cache import SemanticCache
+
+RESPONSE = {"expanded_queries": ["a", "b", "c"], "sources": {}}
+
+
+def test_close_paraphrase_hits_and_distant_query_misses():
+    cache = SemanticCache(dimension=3, threshold=0.95, max_size=4, ttl=60)
+    cache.store("best laptop", np.array([1.0, 0.0, 0.0]), 3, RESPONSE)
+
+    query, similarity, response = cache.lookup(np.array([0.99, 0.05, 0.0]), 3)
+    assert query == "best laptop" and similarity >= 0.95 and response is RESPONSE
+    assert cache.lookup(np.array([0.0, 1.0, 0.0]), 3) is None
+    assert cache.lookup(np.array([1.0, 0.0, 0.0]), 5) is None  # Computed for fewer expansions
+
+
+def test_oldest_entry_is_overwritten_when_full():
+    cache = SemanticCache(dimension=2, max_size=2, ttl=60)
+    for i, vector in enumerate([[1.0, 0.0], [0.0, 1.0], [-1.0, 0.0]]):
+        cache.store(f"query {i}", np.array(vector), 3, RESPONSE)
+    assert cache.size == 2
+    assert cache.lookup(np.array([1.0, 0.0]), 3) is None
+    assert cache.lookup(np.array([-1.0, 0.0]), 3)[0] == "query 2"
+
+
+def test_size_zero_disables_the_cache():
+    cache = SemanticCache(dimension=3, max_size=0)
+    cache.store("best laptop", np.array([1.0, 0.0, 0.0]), 3, RESPONSE)
+    assert cache.lookup(np.array([1.0, 0.0, 0.0]), 3) is None
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,58 @@
+"""Readiness tracking and background retries of failed startup steps.
+
+    pytest tests/test_startup.py
+"""
+import asyncio
+from api.startup import Readiness
+
+
+def flaky(failures):
+    """A step that raises `failures` times before succeeding."""
+    calls = []
+
+    async def step():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ConnectionError("not up yet")
+        return "loaded"
+    return step, calls
+
+
+def test_failed_step_is_retried_until_ready():
+    async def run():
+        readiness = Readiness(required=("model",))
+        step, calls = flaky(2)
+        assert await readiness.track("model", step, retry_delay=0.01, max_retry_delay=0.02) is None
+        assert not readiness.is_ready
+        assert readiness.report()["components"]["model"]["status"] == "failed"
+
+        await asyncio.wait_for(readiness.wait_ready("model"), 1)
+        assert readiness.is_ready and len(calls) == 3
+        assert readiness.report()["components"]["model"]["attempts"] == 3
+        await readiness.close()
+
+    asyncio.run(run())
+
+
+def test_successful_step_returns_its_result_without_retries():
+    async def run():
+        readiness = Readiness(required=("model",))
+        step, calls = flaky(0)
+        assert await readiness.track("model", step) == "loaded"
+        assert readiness.is_ready and readiness.ready_after_ms is not None and len(calls) == 1
+
+    asyncio.run(run())
+
+
+def test_close_stops_retrying():
+    async def run():
+        readiness = Readiness(required=("model",))
+        step, calls = flaky(100)
+        await readiness.track("model", step, retry_delay=0.01, max_retry_delay=0.01)
+        await asyncio.sleep(0.05)
+        await readiness.close()
+        attempts = len(calls)
+        await asyncio.sleep(0.05)
+        assert len(calls) == attempts and not readiness.is_ready
+
+    asyncio.run(run())
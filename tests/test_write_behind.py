@@ -0,0 +1,73 @@
+"""WriteBehindBuffer batching, flush on close and retry on failure.
+
+    pytest tests/test_write_behind.py
+"""
+import asyncio
+from database.write_behind import WriteBehindBuffer
+
+
+def recorder(failures=0):
+    """A flush function that fails `failures` times, then records each batch."""
+    batches, attempts = [], []
+
+    async def flush(batch):
+        attempts.append(list(batch))
+        if len(attempts) <= failures:
+            raise ConnectionError("database unavailable")
+        batches.append(list(batch))
+    return flush, batches, attempts
+
+
+def test_items_are_flushed_in_batches_of_max_batch():
+    async def run():
+        flush, batches, _ = recorder()
+        buffer = WriteBehindBuffer(flush, max_batch=3, flush_interval=10)
+        for i in range(7):
+            await buffer.put(i)
+        await buffer.close()
+        return buffer, batches
+
+    buffer, batches = asyncio.run(run())
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert buffer.stats() == {"pending": 0, "flushed": 7, "retries": 0, "dropped": 0}
+
+
+def test_partial_batch_is_flushed_after_the_interval():
+    async def run():
+        flush, batches, _ = recorder()
+        buffer = WriteBehindBuffer(flush, max_batch=100, flush_interval=0.02)
+        await buffer.put("a")
+        await buffer.put("b")
+        await asyncio.sleep(0.1)
+        flushed = list(batches)
+        await buffer.close()
+        return flushed
+
+    assert asyncio.run(run()) == [["a", "b"]]
+
+
+def test_failed_flush_is_retried_then_succeeds():
+    async def run():
+        flush, batches, attempts = recorder(failures=2)
+        buffer = WriteBehindBuffer(flush, max_batch=10, flush_interval=0.01, retries=3, retry_delay=0.001)
+        await buffer.put("a")
+        await buffer.close()
+        return buffer, batches, attempts
+
+    buffer, batches, attempts = asyncio.run(run())
+    assert batches == [["a"]] and len(attempts) == 3
+    assert buffer.retried == 2 and buffer.flushed == 1 and buffer.dropped == 0
+
+
+def test_batch_is_dropped_once_retries_run_out():
+    async def run():
+        flush, batches, attempts = recorder(failures=10)
+        buffer = WriteBehindBuffer(flush, max_batch=10, flush_interval=0.01, retries=1, retry_delay=0.001)
+        await buffer.put("a")
+        await buffer.put("b")
+        await buffer.close()
+        return buffer, batches, attempts
+
+    buffer, batches, attempts = asyncio.run(run())
+    assert batches == [] and len(attempts) == 2
+    assert buffer.dropped == 2 and buffer.flushed == 0